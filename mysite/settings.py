@@ -49,7 +49,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'polls.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'polls.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -62,7 +65,7 @@ ROOT_URLCONF = 'mysite.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'polls.templating.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -89,6 +92,60 @@ DATABASES = {
     }
 }
 
+# DB_PROFILE=production tunes SQLite so readers and the vote writer do
+# not block each other: WAL journal, writers wait for the lock instead
+# of failing, and connections are kept between requests.
+DB_PROFILE = env('DB_PROFILE', default='development')
+
+SQLITE_PRODUCTION_OPTIONS = {
+    'timeout': env.int('DB_BUSY_TIMEOUT', default=20),
+    'transaction_mode': 'IMMEDIATE',
+    'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+}
+
+if DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': env.int('CONN_MAX_AGE', default=600),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': SQLITE_PRODUCTION_OPTIONS,
+    })
+
+# DB_REPLICA=True reads poll data from a replica, a copy of the primary
+# refreshed by "manage.py sync_replica". Every copy replaces the replica
+# file, so replica connections are opened per request to read the latest
+# copy, and in rollback journal mode so no WAL file outlives a copy.
+if env.bool('DB_REPLICA', default=False):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': env('DB_REPLICA_NAME', default=str(BASE_DIR / 'db-replica.sqlite3')),
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {**DATABASES['default'].get('OPTIONS', {}), 'transaction_mode': None, 'init_command': ''},
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['polls.routers.PrimaryReplicaRouter']
+
+# Seconds a client keeps reading from the primary after it wrote.
+POLLS_REPLICA_PIN_SECONDS = env.int('POLLS_REPLICA_PIN_SECONDS', default=30)
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'polls': {
+        'BACKEND': env('POLLS_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': env('POLLS_CACHE_LOCATION', default='polls'),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': env.int('POLLS_CACHE_MAX_ENTRIES', default=10000),
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -127,4 +184,156 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.1/howto/static-files/
 
 STATIC_URL = '/static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic writes content hashed copies of every asset with gzip and
+# brotli variants next to them, WhiteNoise serves the hashed names with a
+# far-future immutable Cache-Control.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'polls.storage.StaticStorage',
+    },
+}
 LOGIN_REDIRECT_URL = '/polls/'
+
+# With a polls cache shared by all processes, sessions and the users of
+# logged in sessions are read from it and sessions are written through to
+# the database. A process-local cache would keep serving a session or a
+# user after another process logged it out or changed its password, so
+# then both are read from the database.
+POLLS_CACHE_SHARED = CACHES['polls']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+if POLLS_CACHE_SHARED:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    SESSION_CACHE_ALIAS = 'polls'
+    AUTHENTICATION_BACKENDS = ['polls.auth.CachedModelBackend']
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+    AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
+
+
+# Polls
+
+# Number of counter rows per choice, raise it to spread concurrent votes
+# on a hot choice over several rows.
+POLLS_TALLY_SHARDS = env.int('POLLS_TALLY_SHARDS', default=1)
+
+# Write-behind vote buffer, votes are appended to a local log and
+# flushed to the database in batches by a background thread.
+POLLS_VOTE_BUFFER = {
+    'ENABLED': env.bool('POLLS_VOTE_BUFFER', default=False),
+    'PATH': BASE_DIR / 'var' / 'vote-buffer',
+    'BATCH_SIZE': env.int('POLLS_VOTE_BUFFER_BATCH_SIZE', default=500),
+    'FLUSH_INTERVAL': env.float('POLLS_VOTE_BUFFER_FLUSH_INTERVAL', default=1.0),
+    'FSYNC': True,
+}
+
+# Cache alias for poll results, listings and counters.
+POLLS_CACHE_ALIAS = 'polls'
+POLLS_RESULTS_CACHE_TIMEOUT = 3600
+
+# Live results streaming over ASGI.
+POLLS_STREAM_MAX_SUBSCRIBERS = env.int('POLLS_STREAM_MAX_SUBSCRIBERS', default=10000)
+POLLS_STREAM_QUEUE_SIZE = 16
+POLLS_STREAM_HEARTBEAT = 15
+
+# Serve the detail, results and vote views as async views, for ASGI deployments.
+POLLS_ASYNC_VIEWS = env.bool('POLLS_ASYNC_VIEWS', default=False)
+
+# Per request SQL, template and view timing in a Server-Timing header,
+# requests slower than SLOW_REQUEST_MS are logged to polls.timing.
+POLLS_TIMING = {
+    'ENABLED': env.bool('POLLS_TIMING', default=True),
+    'SLOW_REQUEST_MS': env.int('POLLS_SLOW_REQUEST_MS', default=500),
+}
+
+# Questions per page of the poll index.
+POLLS_INDEX_PAGE_SIZE = 10
+# Seconds the first index pages are cached at most. A save refreshes the
+# listing of a shared cache at once, a process-local cache only in the
+# process that saved, and import_polls in none.
+POLLS_INDEX_CACHE_TIMEOUT = env.int('POLLS_INDEX_CACHE_TIMEOUT', default=60)
+
+# Vote time series rollup. LAG is how far before its watermark the job
+# looks again for votes of transactions that committed late, MAX_POINTS
+# bounds the points of a time series response.
+POLLS_ROLLUP = {
+    'LAG': env.int('POLLS_ROLLUP_LAG', default=60),
+    'BATCH_SIZE': 5000,
+    'MAX_POINTS': 500,
+}
+
+# Seconds a logged in user is cached. Edits and logouts drop the entry,
+# the timeout bounds how long another process may use a stale copy when
+# the polls cache is not shared.
+POLLS_USER_CACHE_TIMEOUT = env.int('POLLS_USER_CACHE_TIMEOUT', default=300)
+
+# Vote rate limits as (burst, votes per second) token buckets per user
+# and per client address. STORE keeps the buckets, MemoryStore in this
+# process with at most OPTIONS['max_entries'] keys, CacheStore in the
+# cache alias OPTIONS['alias'] shared by all processes. Behind PROXIES
+# trusted reverse proxies the client address is read from
+# X-Forwarded-For. A vote repeating the last one of the user within
+# DUPLICATE_WINDOW seconds skips the database.
+POLLS_RATE_LIMIT = {
+    'ENABLED': env.bool('POLLS_RATE_LIMIT', default=True),
+    'STORE': env('POLLS_RATE_LIMIT_STORE', default='polls.ratelimit.MemoryStore'),
+    'OPTIONS': {},
+    'USER': (10, 1.0),
+    'IP': (30, 5.0),
+    'PROXIES': env.int('POLLS_TRUSTED_PROXIES', default=0),
+    'DUPLICATE_WINDOW': 10,
+}
+
+# Batched results API. MAX_SIZE bounds the question ids of a request,
+# batches over CHUNK_SIZE are streamed, each chunk in a fixed number of
+# queries.
+POLLS_RESULTS_BATCH = {
+    'MAX_SIZE': 200,
+    'CHUNK_SIZE': 50,
+}
+
+# Result snapshots of closed polls, taken by the finalize_polls command
+# GRACE seconds after a poll closes. Responses built from a snapshot may
+# be cached by clients for MAX_AGE seconds.
+POLLS_SNAPSHOT = {
+    'GRACE': 60,
+    'BATCH_SIZE': 500,
+    'MAX_AGE': env.int('POLLS_SNAPSHOT_MAX_AGE', default=86400),
+}
+
+# Warm new workers up before they take traffic: import the views and the
+# admin, build the URL resolvers, compile TEMPLATES and prime the index,
+# results and leaderboard caches. The startup report is logged to
+# polls.startup.
+POLLS_WARMUP = {
+    'ENABLED': env.bool('POLLS_WARMUP', default=False),
+}
+
+# Most voted and trending polls on the index page. Trending counts the
+# votes of the last WINDOW seconds in BUCKET-second buckets, and the boards
+# are cached for TIMEOUT seconds. The rollup_votes job counts the votes
+# into them, run the rebuild_leaderboards command periodically to
+# recount them from the votes.
+POLLS_LEADERBOARD = {
+    'SIZE': 5,
+    'WINDOW': 3600,
+    'BUCKET': 300,
+    'TIMEOUT': 60,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'polls.startup': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
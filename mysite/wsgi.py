@@ -8,9 +8,16 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/wsgi/
 """
 
 import os
+import time
 
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
 
+started = time.perf_counter()
 application = get_wsgi_application()
+
+# Prime the caches and log the startup report before taking traffic.
+from polls.warmup import finish_startup  # noqa: E402
+
+finish_startup('wsgi', started)
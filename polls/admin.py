@@ -1,8 +1,18 @@
 """Create admin page."""
 
 from django.contrib import admin
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 
-from .models import Choice, Question, Vote
+from .models import Choice, ChoiceTally, Question, Vote
+from .pagination import EstimatedCountPaginator
+
+
+def tally_total(**filters):
+    """Return a subquery summing the tally shards matching the filters."""
+    tallies = (ChoiceTally.objects.filter(**filters).order_by()
+               .values(*filters).annotate(total=Sum('count')).values('total'))
+    return Coalesce(Subquery(tallies), Value(0))
 
 
 class ChoiceInline(admin.TabularInline):
@@ -22,11 +32,69 @@ class QuestionAdmin(admin.ModelAdmin):
     ]
     inlines = [ChoiceInline]
     list_display = ('question_text', 'pub_date', 'was_published_recently',
-                    'is_published', 'can_vote')
+                    'state', 'vote_total')
     list_filter = ['pub_date']
     search_fields = ['question_text']
+    date_hierarchy = 'pub_date'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        """Annotate the state and the vote count in the changelist query."""
+        return super().get_queryset(request).with_state().annotate(
+            vote_total=tally_total(choice__question=OuterRef('pk')))
+
+    def state(self, obj):
+        """Return the state computed by the database."""
+        return obj.state
+
+    state.admin_order_field = 'state'
+    state.short_description = 'State'
+
+    def vote_total(self, obj):
+        """Return the number of votes of the question."""
+        return obj.vote_total
+
+    vote_total.admin_order_field = 'vote_total'
+    vote_total.short_description = 'Votes'
+
+
+class ChoiceAdmin(admin.ModelAdmin):
+    """Admin for choices with their vote counts."""
+
+    list_display = ('choice_text', 'question', 'vote_total')
+    list_select_related = ('question',)
+    search_fields = ['choice_text']
+    autocomplete_fields = ['question']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        """Annotate the vote count in the changelist query."""
+        return super().get_queryset(request).annotate(vote_total=tally_total(choice=OuterRef('pk')))
+
+    def vote_total(self, obj):
+        """Return the number of votes of the choice."""
+        return obj.vote_total
+
+    vote_total.admin_order_field = 'vote_total'
+    vote_total.short_description = 'Votes'
+
+
+class VoteAdmin(admin.ModelAdmin):
+    """Admin for the votes table, which can hold millions of rows."""
+
+    list_display = ('id', 'user', 'question', 'choice', 'voted_at')
+    list_select_related = ('user', 'question', 'choice')
+    autocomplete_fields = ['user', 'question']
+    raw_id_fields = ['choice']
+    readonly_fields = ['voted_at']
+    # Only orderings backed by an index.
+    sortable_by = ('id', 'voted_at')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 admin.site.register(Question, QuestionAdmin)
-admin.site.register(Choice)
-admin.site.register(Vote)
+admin.site.register(Choice, ChoiceAdmin)
+admin.site.register(Vote, VoteAdmin)
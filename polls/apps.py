@@ -8,3 +8,13 @@ class PollsConfig(AppConfig):
 
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'polls'
+
+    def ready(self):
+        """Register the checks, connect the signal handlers and warm the code paths up if enabled."""
+        from . import checks, handlers  # noqa: F401
+        from .warmup import CODE_STEPS, warm_up, warmup_settings
+
+        # The database steps run from the WSGI and ASGI modules, once
+        # every app is ready.
+        if warmup_settings()['ENABLED']:
+            warm_up(CODE_STEPS)
@@ -0,0 +1,105 @@
+"""Async views for ku polls under ASGI.
+
+They use the async ORM and cache API, so a request only leaves the
+event loop to write a vote. Enable them with POLLS_ASYNC_VIEWS, the URL
+names are the same as for the sync views.
+"""
+
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, HttpResponseRedirect
+from django.shortcuts import render
+from django.urls import reverse
+from django.views import View
+
+from . import cache
+from .buffer import buffer_settings, get_buffer
+from .models import Choice, Question, Vote
+from .ratelimit import is_repeat_vote, rate_limited, remember_vote
+from .results import afrozen_results
+from .snapshots import cache_frozen
+
+
+async def _aget_question(request, pk):
+    """Return the question conditional_question loaded, or load it.
+
+    Raises: Http404 if the question does not exist
+    """
+    question = getattr(request, 'question', None)
+    if question is not None and question.pk == pk:
+        return question
+    try:
+        return await Question.objects.select_related('snapshot').aget(pk=pk)
+    except Question.DoesNotExist:
+        raise Http404('No Question matches the given query.')
+
+
+def login_required(view):
+    """Async login_required that resolves the user without leaving the event loop."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # Replace the lazy user so templates never load it synchronously.
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), settings.LOGIN_URL)
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def detail(request, question_id=None):
+    """Return poll not available or go to detail page."""
+    request.user = await request.auser()
+    question = await _aget_question(request, question_id)
+    if not question.can_vote():
+        messages.error(request, f'{"Poll not available"}')
+        return HttpResponseRedirect(reverse('polls:index'))
+    choices = [choice async for choice in question.choice_set.all()]
+    return render(request, 'polls/detail.html', {'question': question, 'choices': choices})
+
+
+class ResultsView(View):
+    """View for result."""
+
+    async def get(self, request, pk):
+        """Render the cached results of the question."""
+        request.user = await request.auser()
+        question = await _aget_question(request, pk)
+        response = render(request, 'polls/results.html', {
+            'question': question,
+            'object': question,
+            'results': await cache.aget_cached_results(question),
+        })
+        if await afrozen_results(question) is not None:
+            cache_frozen(response, private=True)
+        return response
+
+
+@login_required
+@rate_limited
+async def vote(request, question_id):
+    """Vote page for the selected question."""
+    if is_repeat_vote(request.user.id, question_id, request.POST.get('choice')):
+        return HttpResponseRedirect(reverse('polls:results', args=(question_id,)))
+    question = await _aget_question(request, question_id)
+    if not question.can_vote():
+        messages.error(request, f'{"Poll not available"}')
+        return HttpResponseRedirect(reverse('polls:index'))
+    try:
+        selected_choice = await question.choice_set.aget(pk=request.POST['choice'])
+    except (KeyError, Choice.DoesNotExist):
+        # Redisplay the question voting form.
+        return render(request, 'polls/detail.html', {
+            'question': question,
+            'choices': [choice async for choice in question.choice_set.all()],
+            'error_message': "You didn't select a choice.",
+        })
+    if buffer_settings()['ENABLED']:
+        await sync_to_async(get_buffer().append)(request.user.id, question.id, selected_choice.id)
+    else:
+        await sync_to_async(Vote.objects.cast_vote)(request.user, question, selected_choice)
+    remember_vote(request.user.id, question.id, selected_choice.id)
+    return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
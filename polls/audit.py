@@ -0,0 +1,249 @@
+"""Integrity audit of the votes.
+
+The vote table is cut into primary key ranges that are checked
+independently, in worker processes for a large table. Every range
+reports the votes that are orphaned or disagree with their choice and
+the votes it counted per choice, and each finished range is written to
+a checkpoint file with the list of ranges, so an interrupted audit
+resumes where it stopped with the same ranges.
+Duplicate (user, question) votes and drifted tallies are found from the
+merged results, and the findings can be repaired in batched transactions.
+"""
+
+import json
+import multiprocessing
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+from django.db.models import Count, Exists, Max, Min, OuterRef, Subquery, Sum
+
+from .cache import bump_results_version
+from .models import Choice, ChoiceTally, Question, Vote
+from .workers import setup_worker
+
+# Votes that are deleted by a repair, in the order they are checked.
+ORPHANS = ('orphan_question', 'no_user', 'orphan_user', 'no_choice', 'orphan_choice')
+
+# Votes whose question is not the question of their choice.
+MISMATCH = 'mismatch'
+
+FINDINGS = (*ORPHANS, MISMATCH)
+
+
+def pk_ranges(size, using=None, start=None):
+    """Return the [start, end) ranges of at most size vote ids covering the table.
+
+    Args:
+        start: first vote id to cover, the lowest id by default
+    """
+    using = using or router.db_for_write(Vote)
+    votes = Vote.objects.using(using)
+    if start is not None:
+        votes = votes.filter(id__gte=start)
+    bounds = votes.aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return []
+    first = bounds['first'] if start is None else start
+    last = bounds['last'] + 1
+    return [(begin, min(begin + size, last)) for begin in range(first, last, size)]
+
+
+def classify(user_id, user_exists, question_exists, choice_id, choice_question_id, question_id):
+    """Return the finding of a vote, None if the vote is sound."""
+    if not question_exists:
+        return 'orphan_question'
+    if user_id is None:
+        return 'no_user'
+    if not user_exists:
+        return 'orphan_user'
+    if choice_id is None:
+        return 'no_choice'
+    if choice_question_id is None:
+        return 'orphan_choice'
+    if choice_question_id != question_id:
+        return MISMATCH
+    return None
+
+
+def check_range(bounds, using=None):
+    """Check the votes with ids in [start, end).
+
+    Returns: dict of the range, the number of votes, the ids of every
+        finding and the votes counted per choice id
+    """
+    using = using or router.db_for_write(Vote)
+    start, end = bounds
+    rows = (Vote.objects.using(using).filter(id__gte=start, id__lt=end)
+            .annotate(user_exists=Exists(User.objects.filter(pk=OuterRef('user_id'))),
+                      question_exists=Exists(Question.objects.filter(pk=OuterRef('question_id'))),
+                      choice_question=Subquery(Choice.objects.filter(pk=OuterRef('choice_id')).values('question_id')))
+            .values_list('id', 'user_id', 'user_exists', 'question_exists', 'choice_id', 'choice_question',
+                         'question_id'))
+    findings = {name: [] for name in FINDINGS}
+    counts = Counter()
+    votes = 0
+    for vote_id, user_id, user_exists, question_exists, choice_id, choice_question_id, question_id in rows.iterator():
+        votes += 1
+        finding = classify(user_id, user_exists, question_exists, choice_id, choice_question_id, question_id)
+        if finding is not None:
+            findings[finding].append(vote_id)
+        # A mismatched vote still counts for its choice once it is repaired.
+        if finding in (None, MISMATCH):
+            counts[choice_id] += 1
+    return {'range': [start, end], 'votes': votes, 'findings': findings, 'counts': dict(counts)}
+
+
+def _load_checkpoint(path, size):
+    """Return the ranges of the checkpoint and its finished ranges keyed by their start.
+
+    Returns: (list of ranges, dict), ([], {}) without a usable checkpoint
+    """
+    try:
+        with open(path) as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return [], {}
+    if data.get('size') != size or 'plan' not in data:
+        return [], {}
+    return ([tuple(bounds) for bounds in data['plan']],
+            {int(start): result for start, result in data['ranges'].items()})
+
+
+def _save_checkpoint(path, size, ranges, done):
+    """Write the ranges and the finished ranges to the checkpoint atomically."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_suffix('.tmp')
+    with open(temporary, 'w') as file:
+        json.dump({'size': size, 'plan': ranges, 'ranges': done}, file)
+    os.replace(temporary, path)
+
+
+def scan(size=100000, workers=1, checkpoint=None, progress=None):
+    """Check every range of the vote table.
+
+    Args:
+        size: vote ids per range
+        workers: worker processes, the ranges are checked in this
+            process if it is 1 or less
+        checkpoint: path of the file of finished ranges, None to not
+            keep one
+        progress: called with (ranges done, ranges, votes checked)
+            after every range
+    Returns: list of the results of check_range() of every range
+    """
+    using = router.db_for_write(Vote)
+    ranges, done = _load_checkpoint(checkpoint, size) if checkpoint else ([], {})
+    # The ranges of a resumed audit keep their ends, votes added since
+    # are covered by new ranges after the last one.
+    ranges += pk_ranges(size, using, start=ranges[-1][1] if ranges else None)
+    pending = [bounds for bounds in ranges if bounds[0] not in done]
+
+    def finish(result):
+        done[result['range'][0]] = result
+        if checkpoint:
+            _save_checkpoint(checkpoint, size, ranges, done)
+        if progress:
+            progress(len(done), len(ranges), sum(entry['votes'] for entry in done.values()))
+
+    if workers <= 1 or len(pending) <= 1:
+        for bounds in pending:
+            finish(check_range(bounds, using))
+    else:
+        # Spawned workers open their own connections and set Django up
+        # before they load this module.
+        context = multiprocessing.get_context('spawn')
+        databases = {alias: connections[alias].settings_dict for alias in connections}
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=setup_worker,
+                                 initargs=(databases,)) as executor:
+            futures = [executor.submit(check_range, bounds, using) for bounds in pending]
+            for future in as_completed(futures):
+                finish(future.result())
+    return [done[start] for start, _ in ranges if start in done]
+
+
+def audit_votes(size=100000, workers=1, checkpoint=None, progress=None):
+    """Audit the votes and the tallies.
+
+    Returns: dict of the number of votes checked, the vote ids of every
+        finding, the duplicate (user id, question id) pairs and the
+        choices whose tally differs from their votes as
+        {choice id: (tally, votes)}
+    """
+    using = router.db_for_write(Vote)
+    results = scan(size=size, workers=workers, checkpoint=checkpoint, progress=progress)
+    findings = {name: [] for name in FINDINGS}
+    counts = Counter()
+    for result in results:
+        for name, vote_ids in result['findings'].items():
+            findings[name].extend(vote_ids)
+        counts.update({int(choice_id): count for choice_id, count in result['counts'].items()})
+    duplicates = list(Vote.objects.using(using).filter(user__isnull=False).values('user', 'question')
+                      .annotate(total=Count('id')).filter(total__gt=1).values_list('user', 'question'))
+    tallies = dict(ChoiceTally.objects.using(using).values_list('choice').annotate(total=Sum('count')))
+    drift = {}
+    for choice_id in Choice.objects.using(using).values_list('id', flat=True).iterator():
+        tally, votes = tallies.get(choice_id, 0), counts.get(choice_id, 0)
+        if tally != votes:
+            drift[choice_id] = (tally, votes)
+    return {
+        'votes': sum(result['votes'] for result in results),
+        'findings': findings,
+        'duplicates': duplicates,
+        'drift': drift,
+    }
+
+
+def _batches(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def repair(report, batch_size=1000):
+    """Repair the findings of an audit, batch_size votes per transaction.
+
+    Orphaned votes are deleted. A mismatched vote is moved to the
+    question of its choice, or deleted if the user already voted on that
+    question. Of duplicate votes the latest is kept. Finally the tallies
+    of every affected choice are recomputed and their results made stale.
+
+    Returns: Counter of the votes deleted and moved
+    """
+    using = router.db_for_write(Vote)
+    done = Counter()
+    choices = set(report['drift'])
+    votes = Vote.objects.using(using)
+    for vote_ids in _batches((vote_id for name in ORPHANS for vote_id in report['findings'][name]), batch_size):
+        with transaction.atomic(using=using):
+            choices.update(votes.filter(pk__in=vote_ids, choice__isnull=False).values_list('choice_id', flat=True))
+            done['deleted'] += votes.filter(pk__in=vote_ids).delete()[0]
+    for vote_ids in _batches(report['findings'][MISMATCH], batch_size):
+        with transaction.atomic(using=using):
+            for vote in votes.select_for_update().filter(pk__in=vote_ids).select_related('choice'):
+                choices.add(vote.choice_id)
+                if votes.filter(user_id=vote.user_id, question_id=vote.choice.question_id).exists():
+                    vote.delete()
+                    done['deleted'] += 1
+                else:
+                    votes.filter(pk=vote.pk).update(question_id=vote.choice.question_id)
+                    done['moved'] += 1
+    for pairs in _batches(report['duplicates'], batch_size):
+        with transaction.atomic(using=using):
+            for user_id, question_id in pairs:
+                duplicates = votes.filter(user_id=user_id, question_id=question_id).order_by('-id')
+                stale = list(duplicates.values_list('id', 'choice_id')[1:])
+                choices.update(choice_id for _, choice_id in stale if choice_id is not None)
+                done['deleted'] += votes.filter(pk__in=[vote_id for vote_id, _ in stale]).delete()[0]
+    for choice_ids in _batches(choices, batch_size):
+        with transaction.atomic(using=using):
+            ChoiceTally.objects.rebuild(Choice.objects.filter(pk__in=choice_ids))
+    question_ids = set(Choice.objects.using(using).filter(pk__in=choices).values_list('question_id', flat=True))
+    Question.objects.using(using).filter(pk__in=question_ids).touch()
+    for question_id in question_ids:
+        bump_results_version(question_id)
+    return done
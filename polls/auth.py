@@ -0,0 +1,64 @@
+"""Authentication backend that caches the users of logged in sessions.
+
+Every authenticated request loads its user by id from the session. The
+backend keeps those users in the polls cache for a bounded time, and
+the cached entry is dropped whenever the user is saved, deleted or logs
+out, so password changes and deactivation apply on the next request.
+
+Only the process that handled the change drops its entries, so the
+backend and cached sessions are used only with a polls cache shared by
+all processes, see CACHED_AUTH and polls.checks.
+"""
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+
+from .cache import get_cache
+
+# Marks a cached lookup of a user id that does not exist.
+_MISSING = 'missing'
+
+# Settings reading sessions and users through the shared polls cache.
+CACHED_AUTH = {
+    'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+    'SESSION_CACHE_ALIAS': 'polls',
+    'AUTHENTICATION_BACKENDS': ['polls.auth.CachedModelBackend'],
+}
+
+
+def user_cache_key(user_id):
+    """Return the cache key of the user."""
+    return f'polls:user:{user_id}'
+
+
+def _timeout():
+    return getattr(settings, 'POLLS_USER_CACHE_TIMEOUT', 300)
+
+
+def invalidate_user(user_id):
+    """Drop the cached user."""
+    get_cache().delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose get_user reads through the polls cache."""
+
+    def get_user(self, user_id):
+        """Return the active user with the id from the cache or the database."""
+        cache = get_cache()
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            cache.set(key, _MISSING if user is None else user, _timeout())
+        return None if user == _MISSING else user
+
+    async def aget_user(self, user_id):
+        """Async version of get_user()."""
+        cache = get_cache()
+        key = user_cache_key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            user = await super().aget_user(user_id)
+            await cache.aset(key, _MISSING if user is None else user, _timeout())
+        return None if user == _MISSING else user
@@ -0,0 +1,262 @@
+"""Benchmark helpers for ku polls.
+
+Builds synthetic datasets at several scales and drives the views through
+the test clients, over the WSGI handler with a thread pool or over the
+ASGI handler with concurrent tasks, and summarizes the latencies and SQL
+query counts.
+"""
+
+import asyncio
+import importlib
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import clear_url_caches, reverse
+from django.utils import timezone
+
+from .cache import get_cache
+from .models import Choice, ChoiceTally, Question, Vote
+
+BATCH_SIZE = 5000
+
+# Dataset sizes, from a smoke test to millions of votes.
+SCALES = {
+    'tiny': {'questions': 10, 'choices': 2, 'votes': 100},
+    'small': {'questions': 100, 'choices': 5, 'votes': 10000},
+    'medium': {'questions': 1000, 'choices': 20, 'votes': 200000},
+    'large': {'questions': 10000, 'choices': 50, 'votes': 2000000},
+}
+
+
+@contextmanager
+def test_database():
+    """Run the block on a throwaway database file that is destroyed afterwards."""
+    setup_test_environment()
+    directory = tempfile.mkdtemp()
+    if connection.vendor == 'sqlite':
+        # A file database shared by the worker threads, where writers
+        # wait for the lock instead of failing on a read-to-write upgrade.
+        connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        settings.DATABASES[connection.alias].setdefault('OPTIONS', {})['transaction_mode'] = 'IMMEDIATE'
+        connection.settings_dict['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        # The workloads vote far faster than a person, measure the views
+        # rather than the rate limiter.
+        with override_settings(POLLS_RATE_LIMIT={'ENABLED': False, 'DUPLICATE_WINDOW': 0}):
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def _reload_urls():
+    from . import urls
+    importlib.reload(urls)
+    # The root URLconf holds the resolver of the old polls patterns.
+    importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+
+
+@contextmanager
+def use_async_views(enabled=True):
+    """Route the detail, results and vote URLs to the async or sync views."""
+    try:
+        with override_settings(POLLS_ASYNC_VIEWS=enabled):
+            _reload_urls()
+            yield
+    finally:
+        _reload_urls()
+
+
+def build_dataset(questions=100, choices=4, votes=1000, seed=0):
+    """Create open questions, their choices, voters and votes.
+
+    Every vote is from a different (user, question) pair, votes are
+    spread evenly over the questions and randomly over their choices.
+
+    Returns: dict of the question ids, user ids and choice ids per question
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    user_count = max(1, -(-votes // questions))
+    first_user = User.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    User.objects.bulk_create([User(username=f'bench{first_user + number}', password='!')
+                              for number in range(user_count)], batch_size=BATCH_SIZE)
+    user_ids = list(User.objects.filter(username__startswith='bench').order_by('-id')
+                    .values_list('id', flat=True)[:user_count])
+    new_questions = Question.objects.bulk_create([
+        Question(question_text=f'Benchmark question {number}',
+                 pub_date=now - timezone.timedelta(minutes=number),
+                 end_date=now + timezone.timedelta(days=30))
+        for number in range(questions)
+    ], batch_size=BATCH_SIZE)
+    question_ids = [question.id for question in new_questions]
+    Choice.objects.bulk_create([Choice(question_id=question_id, choice_text=f'Choice {number}')
+                                for question_id in question_ids for number in range(choices)],
+                               batch_size=BATCH_SIZE)
+    choice_ids = {}
+    for choice_id, question_id in Choice.objects.filter(question_id__in=question_ids).values_list('id', 'question'):
+        choice_ids.setdefault(question_id, []).append(choice_id)
+    batch = []
+    for number in range(votes):
+        question_id = question_ids[number % questions]
+        batch.append(Vote(user_id=user_ids[number // questions], question_id=question_id,
+                          choice_id=rng.choice(choice_ids[question_id])))
+        if len(batch) >= BATCH_SIZE:
+            Vote.objects.bulk_create(batch)
+            batch = []
+    Vote.objects.bulk_create(batch)
+    ChoiceTally.objects.rebuild(Choice.objects.filter(question_id__in=question_ids))
+    return {'questions': question_ids, 'users': user_ids, 'choices': choice_ids}
+
+
+def workload(dataset, requests=500, vote_ratio=0.1, seed=0):
+    """Return a random mix of detail, results and vote requests.
+
+    Returns: list of (method, path, data) tuples
+    """
+    rng = random.Random(seed)
+    mix = []
+    for _ in range(requests):
+        question_id = rng.choice(dataset['questions'])
+        roll = rng.random()
+        if roll < vote_ratio:
+            mix.append(('post', reverse('polls:vote', args=(question_id,)),
+                        {'choice': rng.choice(dataset['choices'][question_id])}))
+        elif roll < (1 + vote_ratio) / 2:
+            mix.append(('get', reverse('polls:detail', args=(question_id,)), None))
+        else:
+            mix.append(('get', reverse('polls:results', args=(question_id,)), None))
+    return mix
+
+
+def summarize(latencies, seconds):
+    """Return the request count, throughput and latency percentiles in milliseconds."""
+    ordered = sorted(latencies)
+
+    def percentile(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 2)
+
+    return {
+        'requests': len(ordered),
+        'seconds': round(seconds, 3),
+        'throughput': round(len(ordered) / seconds, 1) if seconds else 0.0,
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 2) if ordered else 0.0,
+        'p50_ms': percentile(0.5) if ordered else 0.0,
+        'p95_ms': percentile(0.95) if ordered else 0.0,
+    }
+
+
+def run_sync(mix, users, concurrency=8):
+    """Send the requests through the WSGI handler from a thread pool."""
+    local = threading.local()
+    logins = iter(users * (concurrency // max(1, len(users)) + 1))
+    login_lock = threading.Lock()
+
+    def send(request):
+        if not hasattr(local, 'client'):
+            local.client = Client()
+            with login_lock:
+                local.client.force_login(User.objects.get(pk=next(logins)))
+        method, path, data = request
+        start = time.perf_counter()
+        getattr(local.client, method)(path, data)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        latencies = list(executor.map(send, mix))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+async def _run_async(mix, users, concurrency):
+    queue = asyncio.Queue()
+    for request in mix:
+        queue.put_nowait(request)
+    latencies = []
+
+    async def worker(user_id):
+        client = AsyncClient()
+        await client.aforce_login(await User.objects.aget(pk=user_id))
+        while not queue.empty():
+            method, path, data = queue.get_nowait()
+            start = time.perf_counter()
+            await getattr(client, method)(path, data)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(users[number % len(users)]) for number in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def run_async(mix, users, concurrency=8):
+    """Send the requests through the ASGI handler from concurrent tasks."""
+    return asyncio.run(_run_async(mix, users, concurrency))
+
+
+def view_requests(dataset, seed=0):
+    """Return one request for each view of a random question of the dataset.
+
+    Returns: dict of view name to (method, path, data)
+    """
+    rng = random.Random(seed)
+    question_id = rng.choice(dataset['questions'])
+    batch = rng.sample(dataset['questions'], min(20, len(dataset['questions'])))
+    return {
+        'index': ('get', reverse('polls:index'), None),
+        'detail': ('get', reverse('polls:detail', args=(question_id,)), None),
+        'results': ('get', reverse('polls:results', args=(question_id,)), None),
+        'results_json': ('get', reverse('polls:results_json', args=(question_id,)), None),
+        'results_batch': ('get', reverse('polls:results_batch'), {'ids': ','.join(map(str, batch))}),
+        'vote': ('post', reverse('polls:vote', args=(question_id,)),
+                 {'choice': rng.choice(dataset['choices'][question_id])}),
+    }
+
+
+def query_counts(dataset, user):
+    """Return the SQL queries each view runs with a cold cache."""
+    client = Client()
+    client.force_login(user)
+    counts = {}
+    for name, (method, path, data) in view_requests(dataset).items():
+        get_cache().clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(path, data)
+        if response.status_code >= 400:
+            raise AssertionError(f'{name} returned {response.status_code}')
+        counts[name] = len(queries)
+    return counts
+
+
+def profile_views(dataset, user, requests=200, seed=0):
+    """Return the latency, throughput and cold query count of every view.
+
+    Every view is requested with random questions, with the caches warm
+    as they would be in production.
+    """
+    client = Client()
+    client.force_login(user)
+    counts = query_counts(dataset, user)
+    report = {}
+    for name in counts:
+        latencies = []
+        start = time.perf_counter()
+        for number in range(requests):
+            method, path, data = view_requests(dataset, seed=seed + number)[name]
+            request_start = time.perf_counter()
+            getattr(client, method)(path, data)
+            latencies.append(time.perf_counter() - request_start)
+        report[name] = {**summarize(latencies, time.perf_counter() - start), 'queries': counts[name]}
+    return report
@@ -0,0 +1,253 @@
+"""Write-behind vote buffer for ku polls.
+
+When enabled, the vote view appends each vote to a local append-only
+log and returns at once. A background flusher applies the logged votes
+to the database in batches, so a flash poll does not take one database
+write per request.
+"""
+
+import atexit
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections
+
+from .models import Vote
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'PATH': 'vote-buffer',
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 1.0,
+    'FSYNC': True,
+}
+
+
+def _pid_alive(pid):
+    """Return True if a process with the pid is running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class VoteBuffer:
+    """Append-only log of votes flushed to the database in batches.
+
+    Every process appends to its own ``votes-<pid>.log``. A flush moves
+    the log aside as a ``.pending`` segment, claims segments by renaming
+    them, merges their votes by the time they were cast and applies them
+    batch by batch. Applying a segment twice gives the same result, so a
+    segment left behind by a crash is safe to replay. Votes the database
+    rejects are moved to a ``.rejected`` file instead of blocking the
+    segment.
+    """
+
+    def __init__(self, path, batch_size=500, flush_interval=1.0, fsync=True):
+        """Initialize the buffer in the given directory."""
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._file = None
+        self._file_pid = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._drain_at_exit = False
+
+    def _log_path(self, pid=None):
+        return self.path / f'votes-{pid or os.getpid()}.log'
+
+    def append(self, user_id, question_id, choice_id):
+        """Durably append a vote to the log."""
+        record = json.dumps({'user': user_id, 'question': question_id,
+                             'choice': choice_id, 'at': time.time()})
+        with self._lock:
+            if self._file is None or self._file_pid != os.getpid():
+                self.path.mkdir(parents=True, exist_ok=True)
+                self._file = open(self._log_path(), 'a', encoding='utf-8')
+                self._file_pid = os.getpid()
+            self._file.write(record + '\n')
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def _rotate(self, log_path):
+        """Move a log aside as a pending segment."""
+        pending = log_path.with_name(f'{log_path.stem}-{time.time_ns()}.pending')
+        try:
+            os.replace(log_path, pending)
+        except FileNotFoundError:
+            pass
+
+    def _rotate_own_log(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._rotate(self._log_path())
+
+    def _rotate_orphans(self):
+        """Rotate logs and reclaim segments of processes that are gone."""
+        for log_path in self.path.glob('votes-*.log'):
+            pid = int(log_path.stem.split('-')[1])
+            if not _pid_alive(pid):
+                self._rotate(log_path)
+        for claimed in self.path.glob('*.claimed-*'):
+            pid = int(claimed.suffix.rsplit('-', 1)[1])
+            if not _pid_alive(pid):
+                os.replace(claimed, claimed.with_suffix('.pending'))
+
+    def _read_segment(self, segment):
+        """Yield the vote records of a segment, skipping malformed lines."""
+        with open(segment, encoding='utf-8') as lines:
+            for line in lines:
+                try:
+                    record = json.loads(line)
+                    record['at'] = float(record['at'])
+                    if not all(isinstance(record[key], int) for key in ('user', 'question', 'choice')):
+                        raise TypeError
+                except (ValueError, KeyError, TypeError):
+                    # A torn last line from a crash mid-write, or a damaged record.
+                    logger.warning('Skipping malformed line in %s', segment)
+                    continue
+                yield record
+
+    def _reject(self, records):
+        """Write votes the database refused to a rejected file for inspection."""
+        rejected = self.path / f'votes-{os.getpid()}-{time.time_ns()}.rejected'
+        with open(rejected, 'w', encoding='utf-8') as output:
+            for record in records:
+                output.write(json.dumps(record) + '\n')
+        logger.warning('Moved %d rejected votes to %s', len(records), rejected)
+
+    def _apply(self, records):
+        """Apply the records in order, batch by batch.
+
+        A batch the database refuses is applied vote by vote, and the
+        votes it still refuses are rejected.
+
+        Returns: number of votes that changed
+        """
+        def entry(record):
+            cast_at = datetime.datetime.fromtimestamp(record['at'], tz=datetime.timezone.utc)
+            return record['user'], record['question'], record['choice'], cast_at
+
+        changed = 0
+        rejected = []
+        for start in range(0, len(records), self.batch_size):
+            batch = records[start:start + self.batch_size]
+            try:
+                changed += len(Vote.objects.apply_batch([entry(record) for record in batch]))
+            except IntegrityError:
+                for record in batch:
+                    try:
+                        changed += len(Vote.objects.apply_batch([entry(record)]))
+                    except IntegrityError:
+                        rejected.append(record)
+        if rejected:
+            self._reject(rejected)
+        return changed
+
+    def flush(self, include_orphans=False):
+        """Apply all pending votes to the database.
+
+        Args:
+            include_orphans: also replay logs of processes that are gone
+        Returns: number of votes that changed
+        """
+        if not self.path.exists():
+            return 0
+        with self._flush_lock:
+            self._rotate_own_log()
+            if include_orphans:
+                self._rotate_orphans()
+            segments = []
+            for pending in self.path.glob('*.pending'):
+                claimed = pending.with_suffix(f'.claimed-{os.getpid()}')
+                try:
+                    os.rename(pending, claimed)
+                except FileNotFoundError:
+                    continue  # claimed by another process
+                segments.append(claimed)
+            if not segments:
+                return 0
+            try:
+                # Segment names order by process, not by time. Merge the
+                # votes of all segments by the time they were cast, so
+                # the last vote of a user wins across processes and replays.
+                records = sorted((record for segment in segments for record in self._read_segment(segment)),
+                                 key=lambda record: record['at'])
+                changed = self._apply(records)
+            except Exception:
+                # Leave the segments to the next flush, replaying them is safe.
+                for segment in segments:
+                    os.replace(segment, segment.with_suffix('.pending'))
+                raise
+            for segment in segments:
+                segment.unlink()
+            return changed
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Vote buffer flush failed')
+            finally:
+                close_old_connections()
+
+    def start(self):
+        """Start the background flusher and drain the buffer at exit."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='vote-buffer-flusher', daemon=True)
+            self._thread.start()
+            if not self._drain_at_exit:
+                atexit.register(self.stop)
+                self._drain_at_exit = True
+
+    def stop(self):
+        """Stop the flusher and apply everything still buffered."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def buffer_settings():
+    """Return the vote buffer settings merged with the defaults."""
+    return {**DEFAULTS, **getattr(settings, 'POLLS_VOTE_BUFFER', {})}
+
+
+def get_buffer():
+    """Return the process wide vote buffer, starting its flusher."""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            options = buffer_settings()
+            _buffer = VoteBuffer(options['PATH'], batch_size=options['BATCH_SIZE'],
+                                 flush_interval=options['FLUSH_INTERVAL'], fsync=options['FSYNC'])
+    # Also restarts the flusher in a worker forked after the buffer was made.
+    _buffer.start()
+    return _buffer
@@ -0,0 +1,218 @@
+"""Versioned caches for ku polls.
+
+Every question has a version number in the cache. Cached results are
+stored under a key that contains the version, so bumping the version on
+a vote makes the old entry unreachable and it is left to the LRU
+eviction of the cache backend. The index listing works the same way
+with one generation number for all questions.
+
+Entries are filled from the primary. A replica behind the write that
+bumped the version would otherwise be cached under the new version and
+served until the next change.
+"""
+
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import Question
+from .pagination import catalog, keyset_page
+from .results import afrozen_results, aget_results, frozen_results, get_batch_results, get_results
+from .routers import primary_reads
+
+
+def get_cache():
+    """Return the cache used by ku polls."""
+    return caches[getattr(settings, 'POLLS_CACHE_ALIAS', 'default')]
+
+
+class CacheStats:
+    """Thread safe hit and miss counters of this process."""
+
+    def __init__(self):
+        """Initialize empty counters."""
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def record(self, name, hit):
+        """Count a hit or a miss for the named cache."""
+        with self._lock:
+            self._counts[(name, 'hits' if hit else 'misses')] += 1
+
+    def snapshot(self):
+        """Return the hits, misses and hit ratio of every named cache."""
+        with self._lock:
+            counts = dict(self._counts)
+        stats = {}
+        for name in sorted({name for name, _ in counts}):
+            hits = counts.get((name, 'hits'), 0)
+            misses = counts.get((name, 'misses'), 0)
+            stats[name] = {'hits': hits, 'misses': misses, 'ratio': round(hits / (hits + misses), 3)}
+        return stats
+
+    def reset(self):
+        """Clear all counters."""
+        with self._lock:
+            self._counts.clear()
+
+
+stats = CacheStats()
+
+
+def _get_version(key):
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock so a version lost to eviction never
+        # comes back lower than one that was already used.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+async def _aget_version(key):
+    cache = get_cache()
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def _bump_version(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def results_version(question_id):
+    """Return the current results version of the question."""
+    return _get_version(f'polls:results:version:{question_id}')
+
+
+def bump_results_version(question_id):
+    """Make the cached results of the question stale."""
+    _bump_version(f'polls:results:version:{question_id}')
+
+
+def get_cached_results(question):
+    """Return the results of the question from the cache, computing them on a miss.
+
+    A closed question with a snapshot is answered from the snapshot.
+    """
+    cache = get_cache()
+    key = f'polls:results:{question.id}:{results_version(question.id)}'
+    results = cache.get(key)
+    stats.record('results', results is not None)
+    if results is None:
+        with primary_reads():
+            results = frozen_results(question) or get_results(question)
+        cache.set(key, results, getattr(settings, 'POLLS_RESULTS_CACHE_TIMEOUT', 3600))
+    return results
+
+
+async def aget_cached_results(question):
+    """Async version of get_cached_results()."""
+    cache = get_cache()
+    key = f"polls:results:{question.id}:{await _aget_version(f'polls:results:version:{question.id}')}"
+    results = await cache.aget(key)
+    stats.record('results', results is not None)
+    if results is None:
+        with primary_reads():
+            results = await afrozen_results(question) or await aget_results(question)
+        await cache.aset(key, results, getattr(settings, 'POLLS_RESULTS_CACHE_TIMEOUT', 3600))
+    return results
+
+
+def get_cached_batch_results(question_ids):
+    """Return the results of several questions, computing the misses together.
+
+    Versions and results are read with one get_many each, and all the
+    misses cost the three queries of get_batch_results().
+
+    Returns: dict of question id to results, without missing questions
+    """
+    cache = get_cache()
+    version_keys = {question_id: f'polls:results:version:{question_id}' for question_id in question_ids}
+    versions = cache.get_many(version_keys.values())
+    keys = {question_id: f'polls:results:{question_id}:{versions.get(key) or _get_version(key)}'
+            for question_id, key in version_keys.items()}
+    cached = cache.get_many(keys.values())
+    results = {}
+    for question_id, key in keys.items():
+        stats.record('results', key in cached)
+        if key in cached:
+            results[question_id] = cached[key]
+    missing = [question_id for question_id in question_ids if question_id not in results]
+    if not missing:
+        return results
+    with primary_reads():
+        misses = get_batch_results(missing)
+    cache.set_many({keys[question_id]: entry for question_id, entry in misses.items()},
+                   getattr(settings, 'POLLS_RESULTS_CACHE_TIMEOUT', 3600))
+    results.update(misses)
+    return results
+
+
+def bump_index_generation():
+    """Make the cached index listing stale."""
+    _bump_version('polls:index:generation')
+
+
+def _next_boundary(questions, state, now):
+    """Return the next time a listed question opens, closes or a new one is published.
+
+    The closed filter lists none of the questions that will close next,
+    so the next end of any open question is a boundary too.
+    """
+    boundaries = [question.end_date for question in questions
+                  if question.end_date is not None and question.end_date > now]
+    upcoming = Question.objects.filter(pub_date__gt=now).aggregate(next=Min('pub_date'))['next']
+    if upcoming is not None:
+        boundaries.append(upcoming)
+    if state == Question.CLOSED:
+        closing = (Question.objects.filter(end_date__gt=now, pub_date__lte=now)
+                   .aggregate(next=Min('end_date'))['next'])
+        if closing is not None:
+            boundaries.append(closing)
+    return min(boundaries, default=None)
+
+
+def get_index_listing(state=None, cursor=None, size=10):
+    """Return a catalog page annotated with the state of each question.
+
+    The first page of every filter is cached until the next question
+    changes state or any question is saved, for at most
+    POLLS_INDEX_CACHE_TIMEOUT seconds, so reading it between changes
+    costs no queries. Deeper pages are one index seek each and
+    are not cached, which keeps arbitrary cursors out of the cache.
+
+    Returns: (list of questions, cursor of the next page or None)
+    Raises: ValueError for an unknown state or an invalid cursor
+    """
+    now = timezone.now()
+    if cursor:
+        return keyset_page(catalog(state, now), cursor, size)
+    cache = get_cache()
+    key = f"polls:index:{_get_version('polls:index:generation')}:{state or 'all'}:{size}"
+    entry = cache.get(key)
+    hit = entry is not None and (entry['expires'] is None or now < entry['expires'])
+    stats.record('index', hit)
+    if hit:
+        return entry['questions'], entry['next']
+    with primary_reads():
+        questions, next_cursor = keyset_page(catalog(state, now), size=size)
+        expires = _next_boundary(questions, state, now)
+    # Saves in other processes only bump the generation of a shared cache.
+    timeout = getattr(settings, 'POLLS_INDEX_CACHE_TIMEOUT', 60)
+    if expires is not None:
+        timeout = min(timeout, (expires - now).total_seconds())
+    cache.set(key, {'questions': questions, 'next': next_cursor, 'expires': expires}, timeout)
+    return questions, next_cursor
@@ -0,0 +1,40 @@
+"""System checks for ku polls."""
+
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Backends whose entries are seen only by the process that wrote them.
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def _process_local(alias):
+    return settings.CACHES.get(alias, {}).get('BACKEND') in PROCESS_LOCAL_CACHES
+
+
+@register(Tags.caches)
+def check_shared_auth_cache(app_configs, **kwargs):
+    """Refuse cached sessions and users on a cache other processes do not see.
+
+    A logout or password change only drops the entries of the process
+    that handled it, every other process would keep using them.
+    """
+    errors = []
+    if ('polls.auth.CachedModelBackend' in settings.AUTHENTICATION_BACKENDS
+            and _process_local(getattr(settings, 'POLLS_CACHE_ALIAS', 'default'))):
+        errors.append(Error(
+            'CachedModelBackend needs a polls cache shared by all processes.',
+            hint='Set POLLS_CACHE_BACKEND to a shared cache, or use ModelBackend.',
+            id='polls.E001',
+        ))
+    if (settings.SESSION_ENGINE in ('django.contrib.sessions.backends.cache',
+                                    'django.contrib.sessions.backends.cached_db')
+            and _process_local(settings.SESSION_CACHE_ALIAS)):
+        errors.append(Error(
+            'Cached sessions need a session cache shared by all processes.',
+            hint='Point SESSION_CACHE_ALIAS to a shared cache, or use the db session engine.',
+            id='polls.E002',
+        ))
+    return errors
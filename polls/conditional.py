@@ -0,0 +1,143 @@
+"""Conditional GET for the poll pages.
+
+The validators come from ``Question.modified``, which every save and
+vote updates, and from the times the questions opened or closed. They
+are computed before the view runs, so an unchanged page is answered
+with 304 Not Modified without rendering it.
+"""
+
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from . import cache
+from .leaderboards import get_leaderboards
+from .models import Question
+from .pagination import STATES, InvalidCursor
+
+
+def changed_at(pub_date, end_date, modified, now):
+    """Return the last time the question was edited, voted on, opened or closed."""
+    return max([modified] + [moment for moment in (pub_date, end_date) if moment is not None and moment <= now])
+
+
+def make_etag(request, *parts):
+    """Return the ETag of a page built from the parts for the user of the request.
+
+    Returns: quoted ETag, None when the page must be rendered anyway
+    """
+    # Pending messages are shown once, the page is different next time.
+    if len(get_messages(request)):
+        return None
+    user_id = request.user.pk if request.user.is_authenticated else 0
+    digest = hashlib.md5('|'.join(map(str, (*parts, user_id))).encode(), usedforsecurity=False).hexdigest()
+    return quote_etag(digest)
+
+
+def question_validators(request, question):
+    """Return the ETag and last modified time of a question page.
+
+    Returns: (etag, datetime), None if the page must be rendered
+    """
+    if question is None:
+        return None
+    last_modified = changed_at(question.pub_date, question.end_date, question.modified, timezone.now())
+    etag = make_etag(request, question.id, last_modified.isoformat())
+    return None if etag is None else (etag, last_modified)
+
+
+def index_validators(request):
+    """Return the ETag and last modified time of an index page.
+
+    Returns: (etag, datetime), None if the page must be rendered
+    """
+    state = request.GET.get('state') or None
+    cursor = request.GET.get('cursor')
+    if state is not None and state not in STATES:
+        return None
+    try:
+        questions, next_cursor = cache.get_index_listing(
+            state=state, cursor=cursor, size=getattr(settings, 'POLLS_INDEX_PAGE_SIZE', 10))
+    except InvalidCursor:
+        return None
+    request.index_listing = questions, next_cursor
+    now = timezone.now()
+    last_modified = max((changed_at(question.pub_date, question.end_date, question.modified, now)
+                         for question in questions), default=None)
+    parts = [f'{question.id}:{question.state}' for question in questions]
+    if state is None and not cursor:
+        # The first page shows the leaderboards, which are rebuilt every TIMEOUT seconds.
+        generated = get_leaderboards()['generated']
+        last_modified = max(filter(None, (last_modified, generated)))
+        parts.append(generated.isoformat())
+    etag = make_etag(request, state, cursor, next_cursor, last_modified, *parts)
+    return None if etag is None else (etag, last_modified)
+
+
+def _not_modified(request, validators):
+    """Return a 304 or 412 response if the request's preconditions say so."""
+    if validators is None or request.method not in ('GET', 'HEAD'):
+        return None
+    etag, last_modified = validators
+    return get_conditional_response(
+        request, etag=etag, last_modified=last_modified and int(last_modified.timestamp()))
+
+
+def _with_validators(request, response, validators):
+    """Add the ETag and Last-Modified headers to a rendered page."""
+    if validators is None or request.method not in ('GET', 'HEAD') or response.status_code != 200:
+        return response
+    etag, last_modified = validators
+    if not response.has_header('ETag'):
+        response.headers['ETag'] = etag
+    if last_modified and not response.has_header('Last-Modified'):
+        response.headers['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def conditional_question(view):
+    """Answer GETs of a question page with 304 while the question is unchanged.
+
+    The view gets the question id as ``question_id`` or ``pk``, sync and
+    async views are supported. The question is loaded once and left in
+    ``request.question`` for the view.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            request.user = await request.auser()
+            question_id = kwargs.get('question_id', kwargs.get('pk'))
+            request.question = await Question.objects.select_related('snapshot').filter(pk=question_id).afirst()
+            validators = question_validators(request, request.question)
+            return (_not_modified(request, validators)
+                    or _with_validators(request, await view(request, *args, **kwargs), validators))
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        question_id = kwargs.get('question_id', kwargs.get('pk'))
+        request.question = Question.objects.select_related('snapshot').filter(pk=question_id).first()
+        validators = question_validators(request, request.question)
+        return _not_modified(request, validators) or _with_validators(request, view(request, *args, **kwargs),
+                                                                      validators)
+    return wrapper
+
+
+def conditional_index(view):
+    """Answer GETs of an index page with 304 while its questions are unchanged.
+
+    The page of questions and the next cursor are loaded once and left in
+    ``request.index_listing`` for the view.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        validators = index_validators(request)
+        return _not_modified(request, validators) or _with_validators(request, view(request, *args, **kwargs),
+                                                                      validators)
+    return wrapper
@@ -0,0 +1,58 @@
+"""Signal handlers for ku polls, connected in PollsConfig.ready."""
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .auth import invalidate_user
+from .cache import bump_index_generation, bump_results_version
+from .models import Choice, Question
+from .signals import vote_changed
+from .snapshots import discard_snapshot
+from .streaming import broadcaster
+
+
+@receiver(vote_changed)
+def invalidate_results_on_vote(sender, question_id, **kwargs):
+    """Make the cached results stale after a vote."""
+    bump_results_version(question_id)
+
+
+@receiver(vote_changed)
+def stream_vote(sender, question_id, choice_id, previous_choice_id, **kwargs):
+    """Send the tally delta of a vote to the live results subscribers."""
+    deltas = {choice_id: 1}
+    if previous_choice_id is not None:
+        deltas[previous_choice_id] = -1
+    broadcaster.publish(question_id, {'question': question_id, 'deltas': deltas})
+
+
+@receiver([post_save, post_delete], sender=Question)
+def invalidate_results_on_question_change(sender, instance, **kwargs):
+    """Make the cached results, listing and snapshot stale after the question is edited."""
+    bump_results_version(instance.id)
+    bump_index_generation()
+    if kwargs['signal'] is post_save:
+        discard_snapshot(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Choice)
+def invalidate_results_on_choice_change(sender, instance, **kwargs):
+    """Make the cached results and the question's validators stale after a choice is edited."""
+    bump_results_version(instance.question_id)
+    Question.objects.filter(pk=instance.question_id).touch()
+    discard_snapshot(instance.question_id)
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def invalidate_user_on_change(sender, instance, **kwargs):
+    """Drop the cached user after a password change or any other edit."""
+    invalidate_user(instance.pk)
+
+
+@receiver(user_logged_out)
+def invalidate_user_on_logout(sender, user, **kwargs):
+    """Drop the cached user when it logs out."""
+    if user is not None:
+        invalidate_user(user.pk)
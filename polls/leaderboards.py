@@ -0,0 +1,139 @@
+"""Most voted and trending polls.
+
+The rollup job counts every vote it rolls up into the leaderboards, in
+the transaction of its batch and with one grouped update per batch: a
+new vote adds to the total of its question in QuestionStats, and a new
+or changed vote recent enough for the trending window to the activity
+bucket of its question. Votes cast directly, buffered or imported are
+all counted the same way. The rebuild job recounts both tables from the
+rolled up votes as a safety net. The top questions are cached in the
+polls cache, so serving them is O(N).
+"""
+
+import datetime
+from collections import Counter
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .cache import get_cache
+from .models import Question, QuestionActivity, QuestionStats, RollupWatermark, Vote
+from .rollup import WATERMARK, bucket_start
+
+CACHE_KEY = 'polls:leaderboards'
+
+
+def leaderboard_settings():
+    """Return the leaderboard settings with their defaults."""
+    return {'SIZE': 5, 'WINDOW': 3600, 'BUCKET': 300, 'TIMEOUT': 60, **getattr(settings, 'POLLS_LEADERBOARD', {})}
+
+
+def _window_start(options, now):
+    """Return the start of the first bucket of the trending window."""
+    return bucket_start(now - datetime.timedelta(seconds=options['WINDOW']), options['BUCKET'])
+
+
+def count_votes(db, votes, now=None):
+    """Add votes being rolled up to the leaderboards, in the caller's transaction.
+
+    Args:
+        votes: (question_id, choice_id, rolled_up_choice_id, voted_at) of
+            every vote, rolled_up_choice_id is None for a new vote
+    """
+    options = leaderboard_settings()
+    cutoff = _window_start(options, now or timezone.now())
+    totals = Counter()
+    activity = Counter()
+    for question_id, choice_id, rolled_up_choice_id, voted_at in votes:
+        totals[question_id] += (choice_id is not None) - (rolled_up_choice_id is not None)
+        if choice_id is not None and voted_at >= cutoff:
+            activity[(question_id, bucket_start(voted_at, options['BUCKET']))] += 1
+    totals = {question_id: delta for question_id, delta in totals.items() if delta}
+    stats = list(QuestionStats.objects.using(db).filter(question_id__in=totals))
+    for row in stats:
+        row.total_votes += totals.pop(row.question_id)
+    QuestionStats.objects.using(db).bulk_update(stats, ['total_votes'])
+    QuestionStats.objects.using(db).bulk_create(
+        QuestionStats(question_id=question_id, total_votes=delta) for question_id, delta in totals.items())
+    if not activity:
+        return
+    rows = list(QuestionActivity.objects.using(db).filter(
+        question_id__in={question_id for question_id, _ in activity},
+        bucket__in={bucket for _, bucket in activity},
+    ))
+    for row in rows:
+        row.votes += activity.pop((row.question_id, row.bucket), 0)
+    QuestionActivity.objects.using(db).bulk_update(rows, ['votes'])
+    QuestionActivity.objects.using(db).bulk_create(
+        QuestionActivity(question_id=question_id, bucket=bucket, votes=count)
+        for (question_id, bucket), count in activity.items())
+
+
+def rebuild_leaderboards(now=None):
+    """Recount the totals and the recent activity of every question from the rolled up votes.
+
+    Holds the rollup watermark, so no batch is rolled up meanwhile and
+    the votes it has not reached yet are left for it to count.
+
+    Returns: number of questions with votes
+    """
+    options = leaderboard_settings()
+    cutoff = _window_start(options, now or timezone.now())
+    db = router.db_for_write(QuestionStats)
+    with transaction.atomic(using=db):
+        RollupWatermark.objects.using(db).select_for_update().get_or_create(name=WATERMARK)
+        votes = Vote.objects.using(db).filter(choice__isnull=False, rolled_up_choice__isnull=False)
+        totals = dict(votes.values_list('question').annotate(total=Count('id')).order_by())
+        activity = {}
+        for question_id, voted_at in votes.filter(voted_at__gte=cutoff).values_list('question_id', 'voted_at'):
+            key = (question_id, bucket_start(voted_at, options['BUCKET']))
+            activity[key] = activity.get(key, 0) + 1
+        QuestionStats.objects.using(db).all().delete()
+        QuestionStats.objects.using(db).bulk_create(
+            QuestionStats(question_id=question_id, total_votes=total) for question_id, total in totals.items())
+        QuestionActivity.objects.using(db).all().delete()
+        QuestionActivity.objects.using(db).bulk_create(
+            QuestionActivity(question_id=question_id, bucket=bucket, votes=count)
+            for (question_id, bucket), count in activity.items())
+    get_cache().delete(CACHE_KEY)
+    return len(totals)
+
+
+def most_voted(size, now=None):
+    """Return the published questions with the most votes, as (question, votes) pairs."""
+    stats = (QuestionStats.objects.filter(question__pub_date__lte=now or timezone.now(), total_votes__gt=0)
+             .select_related('question').order_by('-total_votes', 'question_id')[:size])
+    return [(row.question, row.total_votes) for row in stats]
+
+
+def trending(size, now=None):
+    """Return the published questions with the most votes in the window, as (question, votes) pairs."""
+    now = now or timezone.now()
+    cutoff = _window_start(leaderboard_settings(), now)
+    rows = list(QuestionActivity.objects.filter(bucket__gte=cutoff, question__pub_date__lte=now)
+                .values_list('question').annotate(total=Sum('votes')).order_by('-total', 'question')[:size])
+    questions = Question.objects.in_bulk([question_id for question_id, _ in rows])
+    return [(questions[question_id], votes) for question_id, votes in rows if question_id in questions]
+
+
+def get_leaderboards():
+    """Return the most voted and trending questions, cached for TIMEOUT seconds.
+
+    Returns: dict of the time the boards were built and the 'most_voted'
+        and 'trending' lists of {'id', 'question_text', 'votes'}
+    """
+    cache = get_cache()
+    boards = cache.get(CACHE_KEY)
+    if boards is None:
+        options = leaderboard_settings()
+        now = timezone.now()
+        boards = {
+            'generated': now,
+            **{name: [{'id': question.id, 'question_text': question.question_text, 'votes': votes}
+                      for question, votes in board(options['SIZE'], now)]
+               for name, board in (('most_voted', most_voted), ('trending', trending))},
+        }
+        cache.set(CACHE_KEY, boards, options['TIMEOUT'])
+    return boards
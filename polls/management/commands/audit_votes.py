@@ -0,0 +1,57 @@
+"""Check the votes and tallies for inconsistent rows and repair them."""
+
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from polls.audit import FINDINGS, audit_votes, repair
+
+
+class Command(BaseCommand):
+    """Audit the vote table in ranges of ids, in parallel worker processes."""
+
+    help = ('Find orphaned, mismatched and duplicate votes and drifted tallies, '
+            'and optionally repair them.')
+
+    def add_arguments(self, parser):
+        """Add the parallelism, checkpoint and repair options."""
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes checking the ranges.')
+        parser.add_argument('--chunk-size', type=int, default=100000, help='Vote ids per range.')
+        parser.add_argument('--checkpoint', default=os.path.join(settings.BASE_DIR, 'var', 'audit-votes.json'),
+                            help='File of the finished ranges, an interrupted audit resumes from it.')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and check every range.')
+        parser.add_argument('--repair', action='store_true', help='Repair the findings.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Votes repaired per transaction.')
+
+    def progress(self, done, total, votes):
+        """Report the ranges checked so far."""
+        self.stdout.write(f'Checked {done}/{total} ranges, {votes} votes.')
+
+    def handle(self, *args, **options):
+        """Audit the votes, then report and repair the findings."""
+        checkpoint = options['checkpoint']
+        if options['restart'] and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        report = audit_votes(size=options['chunk_size'], workers=options['workers'],
+                             checkpoint=checkpoint, progress=self.progress)
+        self.stdout.write(f"Audited {report['votes']} votes.")
+        for name in FINDINGS:
+            vote_ids = report['findings'][name]
+            if vote_ids:
+                sample = ', '.join(map(str, vote_ids[:10]))
+                self.stdout.write(self.style.WARNING(f'{name}: {len(vote_ids)} votes ({sample})'))
+        if report['duplicates']:
+            self.stdout.write(self.style.WARNING(f"duplicate: {len(report['duplicates'])} user and question pairs"))
+        for choice_id, (tally, votes) in list(report['drift'].items())[:10]:
+            self.stdout.write(self.style.WARNING(f'tally of choice {choice_id}: {tally}, votes: {votes}'))
+        if report['drift']:
+            self.stdout.write(self.style.WARNING(f"drift: {len(report['drift'])} choices"))
+        if options['repair']:
+            done = repair(report, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Deleted {done['deleted']} and moved {done['moved']} votes, "
+                                                 'tallies rebuilt.'))
+        # The audit finished, the next one starts from scratch.
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
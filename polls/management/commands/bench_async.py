@@ -0,0 +1,34 @@
+"""Compare sync WSGI and async ASGI throughput of the poll views."""
+
+from django.core.management.base import BaseCommand
+
+from polls import benchmarks
+
+
+class Command(BaseCommand):
+    """Benchmark the detail, results and vote views on a throwaway database."""
+
+    help = 'Compare sync views over WSGI with async views over ASGI on the same dataset.'
+
+    def add_arguments(self, parser):
+        """Add the dataset and load options."""
+        parser.add_argument('--questions', type=int, default=100)
+        parser.add_argument('--choices', type=int, default=4)
+        parser.add_argument('--votes', type=int, default=10000)
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--vote-ratio', type=float, default=0.1)
+
+    def handle(self, *args, **options):
+        """Build the dataset once and run the same workload through both stacks."""
+        with benchmarks.test_database():
+            dataset = benchmarks.build_dataset(options['questions'], options['choices'], options['votes'])
+            mix = benchmarks.workload(dataset, options['requests'], options['vote_ratio'])
+            users = dataset['users'][:options['concurrency']]
+            with benchmarks.use_async_views(False):
+                sync = benchmarks.run_sync(mix, users, options['concurrency'])
+            with benchmarks.use_async_views(True):
+                asynchronous = benchmarks.run_async(mix, users, options['concurrency'])
+        self.stdout.write(f"{'':12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for name, result in (('sync WSGI', sync), ('async ASGI', asynchronous)):
+            self.stdout.write(f"{name:12}{result['throughput']:>10}{result['p50_ms']:>10}{result['p95_ms']:>10}")
@@ -0,0 +1,38 @@
+"""Measure the latency, throughput and query count of the poll views."""
+
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from polls import benchmarks
+
+
+class Command(BaseCommand):
+    """Profile every view on synthetic datasets of the given scales."""
+
+    help = 'Report p50/p95 latency, throughput and SQL queries per view on synthetic datasets.'
+
+    def add_arguments(self, parser):
+        """Add the scales and the number of requests."""
+        parser.add_argument('--scale', action='append', choices=benchmarks.SCALES,
+                            help='Dataset scale, may be repeated (default: tiny and small).')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per view.')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+
+    def handle(self, *args, **options):
+        """Build each dataset on a throwaway database and profile the views."""
+        report = {}
+        for scale in options['scale'] or ['tiny', 'small']:
+            with benchmarks.test_database():
+                dataset = benchmarks.build_dataset(**benchmarks.SCALES[scale])
+                user = User.objects.create(username='benchmark-voter')
+                report[scale] = benchmarks.profile_views(dataset, user, options['requests'])
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(f"{'scale':8}{'view':14}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}")
+        for scale, views in report.items():
+            for name, result in views.items():
+                self.stdout.write(f"{scale:8}{name:14}{result['throughput']:>10}{result['p50_ms']:>10}"
+                                  f"{result['p95_ms']:>10}{result['queries']:>9}")
@@ -0,0 +1,24 @@
+"""Export questions, choices and votes as CSV or JSON lines."""
+
+from django.core.management.base import BaseCommand
+
+from polls.transfer import FORMATS, export_data
+
+
+class Command(BaseCommand):
+    """Stream the polls data to files in constant memory."""
+
+    help = 'Write questions, choices and votes to <name>.csv or <name>.jsonl files in a directory.'
+
+    def add_arguments(self, parser):
+        """Add the output directory, format and chunk size."""
+        parser.add_argument('directory')
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per query.')
+
+    def handle(self, *args, **options):
+        """Export every table and report the row counts."""
+        written = export_data(options['directory'], options['format'], options['chunk_size'])
+        for name, count in written.items():
+            self.stdout.write(f'{name}: {count}')
+        self.stdout.write(self.style.SUCCESS(f"Exported to {options['directory']}."))
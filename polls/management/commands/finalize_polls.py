@@ -0,0 +1,29 @@
+"""Snapshot the results of closed polls."""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from polls.snapshots import finalize_polls
+
+
+class Command(BaseCommand):
+    """Run the finalize job once, or every interval seconds."""
+
+    help = 'Store the final results of the polls that closed since the last run.'
+
+    def add_arguments(self, parser):
+        """Add the interval and grace options."""
+        parser.add_argument('--interval', type=float, help='Repeat the job every this many seconds.')
+        parser.add_argument('--grace', type=float, help='Seconds after closing before a poll is finalized.')
+
+    def handle(self, *args, **options):
+        """Finalize the closed polls, in a loop if an interval is given."""
+        while True:
+            count = finalize_polls(grace=options['grace'])
+            self.stdout.write(self.style.SUCCESS(f'Finalized {count} polls.'))
+            if not options['interval']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
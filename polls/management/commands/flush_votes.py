@@ -0,0 +1,22 @@
+"""Apply the votes waiting in the write-behind buffer."""
+
+from django.core.management.base import BaseCommand
+
+from polls.buffer import VoteBuffer, buffer_settings
+
+
+class Command(BaseCommand):
+    """Flush the vote buffer, including logs left by stopped workers."""
+
+    help = 'Apply all buffered votes to the database.'
+
+    def add_arguments(self, parser):
+        """Add the batch size option."""
+        parser.add_argument('--batch-size', type=int, help='Votes applied per transaction.')
+
+    def handle(self, *args, **options):
+        """Flush the buffer and report the number of changed votes."""
+        settings = buffer_settings()
+        vote_buffer = VoteBuffer(settings['PATH'], batch_size=options['batch_size'] or settings['BATCH_SIZE'])
+        changed = vote_buffer.flush(include_orphans=True)
+        self.stdout.write(self.style.SUCCESS(f'Applied {changed} buffered votes.'))
@@ -0,0 +1,27 @@
+"""Import questions, choices and votes written by export_polls."""
+
+from django.core.management.base import BaseCommand
+
+from polls.transfer import FORMATS, Importer
+
+
+class Command(BaseCommand):
+    """Load exported polls data in chunked bulk transactions."""
+
+    help = 'Import the files written by export_polls, giving every row a new id.'
+
+    def add_arguments(self, parser):
+        """Add the input directory, format and chunk size."""
+        parser.add_argument('directory')
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows written per transaction.')
+        parser.add_argument('--create-users', action='store_true',
+                            help='Create voters missing from this database instead of skipping their votes.')
+
+    def handle(self, *args, **options):
+        """Import every table and report the row counts."""
+        counts = Importer(options['directory'], options['format'], options['chunk_size'],
+                          options['create_users']).run()
+        for name, count in counts.items():
+            self.stdout.write(f'{name}: {count}')
+        self.stdout.write(self.style.SUCCESS(f"Imported from {options['directory']}."))
@@ -0,0 +1,28 @@
+"""Recount the leaderboards from the votes."""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from polls.leaderboards import rebuild_leaderboards
+
+
+class Command(BaseCommand):
+    """Rebuild the leaderboards once, or every interval seconds."""
+
+    help = 'Recount the vote totals and the recent activity of every question for the leaderboards.'
+
+    def add_arguments(self, parser):
+        """Add the interval option."""
+        parser.add_argument('--interval', type=float, help='Repeat the rebuild every this many seconds.')
+
+    def handle(self, *args, **options):
+        """Rebuild the leaderboards, in a loop if an interval is given."""
+        while True:
+            count = rebuild_leaderboards()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt the leaderboards of {count} questions.'))
+            if not options['interval']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,28 @@
+"""Recompute the choice vote tallies from the votes."""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from polls.cache import bump_results_version
+from polls.models import Choice, ChoiceTally
+
+
+class Command(BaseCommand):
+    """Rebuild the vote tallies, e.g. after loading fixtures."""
+
+    help = 'Recompute the vote tally of every choice (or the given questions) from the votes.'
+
+    def add_arguments(self, parser):
+        """Add the optional question ids."""
+        parser.add_argument('question_ids', nargs='*', type=int)
+
+    def handle(self, *args, **options):
+        """Rebuild the tallies in one transaction."""
+        choices = Choice.objects.all()
+        if options['question_ids']:
+            choices = choices.filter(question_id__in=options['question_ids'])
+        with transaction.atomic():
+            rebuilt = ChoiceTally.objects.rebuild(choices)
+        for question_id in choices.values_list('question_id', flat=True).distinct():
+            bump_results_version(question_id)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt tallies of {rebuilt} choices.'))
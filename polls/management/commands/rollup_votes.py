@@ -0,0 +1,32 @@
+"""Roll new and changed votes up into the vote time series."""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from polls.rollup import reset_rollup, rollup_votes
+
+
+class Command(BaseCommand):
+    """Run the rollup job once, or every interval seconds."""
+
+    help = 'Add the votes cast since the last run to the per minute and per hour vote rollups.'
+
+    def add_arguments(self, parser):
+        """Add the interval, batch size and rebuild options."""
+        parser.add_argument('--interval', type=float, help='Repeat the rollup every this many seconds.')
+        parser.add_argument('--batch-size', type=int, help='Votes rolled up per transaction.')
+        parser.add_argument('--rebuild', action='store_true', help='Drop the rollups and rebuild them from all votes.')
+
+    def handle(self, *args, **options):
+        """Roll up the votes, in a loop if an interval is given."""
+        if options['rebuild']:
+            reset_rollup()
+        while True:
+            count = rollup_votes(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Rolled up {count} votes.'))
+            if not options['interval']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
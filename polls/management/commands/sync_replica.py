@@ -0,0 +1,68 @@
+"""Copy the SQLite primary database into the read replica."""
+
+import os
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from polls.routers import REPLICA
+
+
+def sync_replica():
+    """Copy the primary into the replica with the SQLite online backup API.
+
+    The primary is copied in one step into a new file next to the
+    replica, which then replaces the replica. A copy in several steps
+    restarts whenever a vote is written, and a replica rewritten in place
+    would fail the pages reading it. Readers that opened the old replica
+    keep reading it until they reconnect.
+    """
+    primary, replica = connections['default'], connections[REPLICA]
+    if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+        raise CommandError('sync_replica only copies SQLite databases.')
+    # Close the replica connection of this process, it would keep the old file.
+    replica.close()
+    path = Path(replica.settings_dict['NAME'])
+    handle, copy = tempfile.mkstemp(prefix=f'{path.name}.', suffix='.tmp', dir=path.parent)
+    os.close(handle)
+    try:
+        source = sqlite3.connect(primary.settings_dict['NAME'])
+        target = sqlite3.connect(copy)
+        try:
+            source.backup(target)
+            # The copy keeps the WAL mode of the primary, and a WAL file left
+            # next to the replica path would be read with the next copy.
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+            source.close()
+        os.replace(copy, path)
+    finally:
+        Path(copy).unlink(missing_ok=True)
+
+
+class Command(BaseCommand):
+    """Refresh the replica once, or every interval seconds."""
+
+    help = 'Copy the primary SQLite database into the read replica.'
+
+    def add_arguments(self, parser):
+        """Add the interval option."""
+        parser.add_argument('--interval', type=float, help='Repeat the copy every this many seconds.')
+
+    def handle(self, *args, **options):
+        """Copy the database, in a loop if an interval is given."""
+        if REPLICA not in connections.settings:
+            raise CommandError('No replica database is configured, set DB_REPLICA=True.')
+        while True:
+            start = time.perf_counter()
+            sync_replica()
+            self.stdout.write(self.style.SUCCESS(
+                f'Copied the primary to the replica in {time.perf_counter() - start:.2f}s.'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
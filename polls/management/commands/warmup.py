@@ -0,0 +1,19 @@
+"""Warm the caches up and report the cost of every warm-up step."""
+
+from django.core.management.base import BaseCommand
+
+from polls.warmup import warm_up
+
+
+class Command(BaseCommand):
+    """Run every warm-up step in this process and print their durations."""
+
+    help = ('Import the views and admin, build the URLs, compile the templates and prime the index, '
+            'results and leaderboard caches, reporting how long each step took.')
+
+    def handle(self, *args, **options):
+        """Warm up and print the report."""
+        report = warm_up()
+        for name, milliseconds in report.as_dict().items():
+            self.stdout.write(f'{name}: {milliseconds} ms')
+        self.stdout.write(self.style.SUCCESS('Warmed up.'))
@@ -0,0 +1,198 @@
+"""Middleware for ku polls."""
+
+import json
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.urls import reverse
+
+from .routers import pin_primary, unpin_primary
+
+logger = logging.getLogger('polls.timing')
+
+_current = ContextVar('polls_request_timing', default=None)
+
+
+class RequestTiming:
+    """SQL and template timings of one request."""
+
+    __slots__ = ('queries', 'sql_time', 'template_time', 'statements')
+
+    def __init__(self):
+        """Initialize empty timings."""
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.statements = Counter()
+
+    def most_repeated(self):
+        """Return the most repeated SQL statement and its count."""
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+
+def current_timing():
+    """Return the timings of the request being served, None outside a request."""
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper that adds the query to the current request timing."""
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.sql_time += time.perf_counter() - start
+        timing.queries += 1
+        # The SQL still has its placeholders, so repeats of the same
+        # query with other parameters count together.
+        timing.statements[sql] += 1
+
+
+def install_query_recorder(connection, **kwargs):
+    """Add record_query to the execute wrappers of the connection once."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class ServerTimingMiddleware:
+    """Report per request SQL, template and view time.
+
+    The timings are sent in a ``Server-Timing`` header, and requests
+    slower than ``POLLS_TIMING['SLOW_REQUEST_MS']`` are logged with the
+    most repeated SQL statement to make N+1 queries easy to spot.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """Install the query recorder on every database connection."""
+        options = getattr(settings, 'POLLS_TIMING', {})
+        if not options.get('ENABLED', True):
+            raise MiddlewareNotUsed()
+        self.slow_request = options.get('SLOW_REQUEST_MS', 500) / 1000
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(install_query_recorder, dispatch_uid='polls_query_recorder')
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+
+    def __call__(self, request):
+        """Time the request."""
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timing = RequestTiming()
+        token = _current.set(timing)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, timing, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        """Time the request under ASGI."""
+        timing = RequestTiming()
+        token = _current.set(timing)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, timing, time.perf_counter() - start)
+
+    def report(self, request, response, timing, total):
+        """Add the Server-Timing header and log the request if it was slow."""
+        view = total - timing.template_time
+        response['Server-Timing'] = (
+            f'db;dur={timing.sql_time * 1000:.1f};desc="{timing.queries} queries", '
+            f'tpl;dur={timing.template_time * 1000:.1f}, '
+            f'view;dur={view * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}'
+        )
+        if total >= self.slow_request:
+            statement, repeats = timing.most_repeated()
+            record = {
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'total_ms': round(total * 1000, 1),
+                'sql_ms': round(timing.sql_time * 1000, 1),
+                'queries': timing.queries,
+                'template_ms': round(timing.template_time * 1000, 1),
+                'view_ms': round(view * 1000, 1),
+                'top_sql': statement,
+                'top_sql_count': repeats,
+            }
+            logger.warning('slow request %s', json.dumps(record), extra={'timing': record})
+        return response
+
+
+class ReplicaPinningMiddleware:
+    """Read from the primary when the request or a recent one wrote data.
+
+    Unsafe requests and the admin always use the primary. After a
+    successful write the client gets a cookie that keeps its reads on the
+    primary until the replica has caught up with the write.
+    """
+
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'polls_primary'
+
+    def __init__(self, get_response):
+        """Initialize the middleware."""
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, 'POLLS_REPLICA_PIN_SECONDS', 30)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _writes(self, request):
+        return request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+    def _pinned(self, request):
+        return (self._writes(request) or self.cookie_name in request.COOKIES
+                or request.path.startswith(reverse('admin:index')))
+
+    def _remember_write(self, request, response):
+        if self._writes(request) and response.status_code < 400:
+            response.set_cookie(self.cookie_name, '1', max_age=self.pin_seconds,
+                                httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        """Serve the request, pinned to the primary if needed."""
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._pinned(request):
+            return self.get_response(request)
+        token = pin_primary()
+        try:
+            response = self.get_response(request)
+        finally:
+            unpin_primary(token)
+        return self._remember_write(request, response)
+
+    async def __acall__(self, request):
+        """Serve the request under ASGI, pinned to the primary if needed."""
+        if not self._pinned(request):
+            return await self.get_response(request)
+        token = pin_primary()
+        try:
+            response = await self.get_response(request)
+        finally:
+            unpin_primary(token)
+        return self._remember_write(request, response)
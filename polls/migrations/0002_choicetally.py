@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_tallies(apps, schema_editor):
+    Choice = apps.get_model('polls', 'Choice')
+    ChoiceTally = apps.get_model('polls', 'ChoiceTally')
+    Vote = apps.get_model('polls', 'Vote')
+    db = schema_editor.connection.alias
+    counts = dict(Vote.objects.using(db).filter(choice__isnull=False)
+                  .values_list('choice').annotate(total=Count('id')))
+    ChoiceTally.objects.using(db).bulk_create(
+        ChoiceTally(choice_id=choice_id, shard=0, count=counts.get(choice_id, 0))
+        for choice_id in Choice.objects.using(db).values_list('id', flat=True)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChoiceTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+                ('choice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tallies', to='polls.choice')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('choice', 'shard'), name='unique_choice_tally_shard')],
+            },
+        ),
+        migrations.RunPython(backfill_tallies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def dedupe_votes(apps, schema_editor):
+    """Keep only the latest vote of each user per question."""
+    Choice = apps.get_model('polls', 'Choice')
+    ChoiceTally = apps.get_model('polls', 'ChoiceTally')
+    Vote = apps.get_model('polls', 'Vote')
+    db = schema_editor.connection.alias
+    duplicates = (Vote.objects.using(db).filter(user__isnull=False)
+                  .values('user', 'question')
+                  .annotate(latest=Max('id'), total=Count('id'))
+                  .filter(total__gt=1))
+    deleted = 0
+    for row in duplicates.iterator():
+        deleted += Vote.objects.using(db).filter(user=row['user'], question=row['question']).exclude(
+            id=row['latest']).delete()[0]
+    if not deleted:
+        return
+    counts = dict(Vote.objects.using(db).filter(choice__isnull=False)
+                  .values_list('choice').annotate(total=Count('id')))
+    ChoiceTally.objects.using(db).all().delete()
+    ChoiceTally.objects.using(db).bulk_create(
+        ChoiceTally(choice_id=choice_id, shard=0, count=counts.get(choice_id, 0))
+        for choice_id in Choice.objects.using(db).values_list('id', flat=True)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0002_choicetally'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_votes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:53
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0006_catalog_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('position', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VoteRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.PositiveIntegerField()),
+                ('bucket', models.DateTimeField()),
+                ('delta', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='rolled_up_choice',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='polls.choice'),
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='voted_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='date voted'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['voted_at'], name='vote_voted_at_idx'),
+        ),
+        migrations.AddField(
+            model_name='voterollup',
+            name='choice',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.choice'),
+        ),
+        migrations.AddField(
+            model_name='voterollup',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.question'),
+        ),
+        migrations.AddIndex(
+            model_name='voterollup',
+            index=models.Index(fields=['question', 'resolution', 'bucket'], name='vote_rollup_question_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='voterollup',
+            constraint=models.UniqueConstraint(fields=('choice', 'resolution', 'bucket'), name='unique_vote_rollup_bucket'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0007_vote_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='last modified'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_question_modified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultSnapshot',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='polls.question')),
+                ('end_date', models.DateTimeField()),
+                ('results', models.JSONField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_stats(apps, schema_editor):
+    QuestionStats = apps.get_model('polls', 'QuestionStats')
+    Vote = apps.get_model('polls', 'Vote')
+    db = schema_editor.connection.alias
+    QuestionStats.objects.using(db).bulk_create(
+        QuestionStats(question_id=question_id, total_votes=total)
+        for question_id, total in Vote.objects.using(db).filter(choice__isnull=False, rolled_up_choice__isnull=False)
+        .values_list('question').annotate(total=Count('id')).order_by()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0009_result_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='polls.question')),
+                ('total_votes', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-total_votes'], name='question_stats_total_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='QuestionActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('votes', models.IntegerField(default=0)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.question')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket'], name='question_activity_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('question', 'bucket'), name='unique_question_activity_bucket')],
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
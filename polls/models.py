@@ -1,20 +1,64 @@
 """Models for ku polls."""
 
 import datetime
+import random
+from collections import Counter
 
-from django.db import models
+from django.conf import settings
+from django.db import connections, models, router, transaction
+from django.db.models import Case, CharField, Count, F, Sum, Value, When
 
 from django.utils import timezone
 
 from django.contrib.auth.models import User
 
+from .signals import vote_changed
+
+
+class QuestionQuerySet(models.QuerySet):
+    """QuerySet for questions."""
+
+    def with_state(self, now=None):
+        """Annotate each question with its state computed by the database.
+
+        Returns: questions with a ``state`` of upcoming, open or closed
+        """
+        now = now or timezone.now()
+        return self.annotate(state=Case(
+            When(pub_date__gt=now, then=Value(Question.UPCOMING)),
+            When(end_date__lte=now, then=Value(Question.CLOSED)),
+            default=Value(Question.OPEN),
+            output_field=CharField(),
+        ))
+
+    def touch(self, now=None):
+        """Mark the questions as modified, for conditional GET.
+
+        Returns: number of questions updated
+        """
+        return self.update(modified=now or timezone.now())
+
 
 class Question(models.Model):
     """Question model for ku polls."""
 
+    UPCOMING = 'upcoming'
+    OPEN = 'open'
+    CLOSED = 'closed'
+
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField('date published')
     end_date = models.DateTimeField('date expired', null=True, default=timezone.now)
+    # Changed on every save and vote, the validator of conditional GETs.
+    modified = models.DateTimeField('last modified', auto_now=True)
+
+    objects = QuestionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['pub_date', 'id'], name='question_pub_date_id_idx'),
+            models.Index(fields=['end_date', 'pub_date'], name='question_end_date_idx'),
+        ]
 
     def __str__(self):
         """Return questions."""
@@ -53,11 +97,319 @@ class Choice(models.Model):
 
     @property
     def votes(self):
-        return Vote.objects.filter(choice=self).count()
+        """Return the number of votes from the tally shards."""
+        total = self.tallies.aggregate(total=Sum('count'))['total']
+        return total or 0
+
+
+class ChoiceTallyManager(models.Manager):
+    """Manager for maintaining the vote tally of choices."""
+
+    def shard_count(self):
+        """Return the number of counter rows per choice."""
+        return max(1, getattr(settings, 'POLLS_TALLY_SHARDS', 1))
+
+    def add(self, choice_id, delta=1):
+        """Add delta to a random shard of the choice tally.
+
+        Must run inside the same transaction as the vote write.
+        """
+        shard = random.randrange(self.shard_count())
+        updated = self.filter(choice_id=choice_id, shard=shard).update(
+            count=F('count') + delta)
+        if not updated:
+            tally, created = self.get_or_create(choice_id=choice_id, shard=shard,
+                                                defaults={'count': delta})
+            if not created:
+                self.filter(pk=tally.pk).update(count=F('count') + delta)
+
+    def move(self, old_choice_id, new_choice_id):
+        """Move one vote from the old choice to the new choice."""
+        if old_choice_id == new_choice_id:
+            return
+        if old_choice_id is not None:
+            self.add(old_choice_id, -1)
+        if new_choice_id is not None:
+            self.add(new_choice_id, 1)
+
+    def rebuild(self, choices=None):
+        """Recompute the tallies from the votes.
+
+        Args:
+            choices: queryset of choices to rebuild, all choices if None
+        Returns: number of choices rebuilt
+        """
+        # Count on the primary, a replica may be behind.
+        db = router.db_for_write(self.model)
+        choices = (Choice.objects.all() if choices is None else choices).using(db)
+        counts = dict(Vote.objects.using(db).filter(choice__in=choices)
+                      .values_list('choice').annotate(total=Count('id')))
+        choice_ids = list(choices.values_list('id', flat=True))
+        self.filter(choice_id__in=choice_ids).delete()
+        self.bulk_create([self.model(choice_id=choice_id, shard=0,
+                                     count=counts.get(choice_id, 0))
+                          for choice_id in choice_ids])
+        return len(choice_ids)
+
+
+class ChoiceTally(models.Model):
+    """Denormalized vote counter of a choice.
+
+    A choice may have several shards so concurrent voters on a hot
+    choice update different rows, the total is the sum of the shards.
+    """
+
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE, related_name='tallies')
+    shard = models.PositiveSmallIntegerField(default=0)
+    count = models.IntegerField(default=0)
+
+    objects = ChoiceTallyManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['choice', 'shard'], name='unique_choice_tally_shard'),
+        ]
+
+    def __str__(self):
+        """Return the tally shard."""
+        return f'{self.choice} [{self.shard}]: {self.count}'
+
+
+class VoteManager(models.Manager):
+    """Manager for recording votes."""
+
+    def _primary(self):
+        """Return the write database alias, votes are read back from it too."""
+        return router.db_for_write(self.model)
+
+    def _send_changed(self, changed, using):
+        """Send vote_changed for every changed vote once the transaction commits."""
+        def send():
+            for user_id, question_id, previous, choice_id in changed:
+                vote_changed.send(sender=self.model, user_id=user_id, question_id=question_id,
+                                  choice_id=choice_id, previous_choice_id=previous)
+        transaction.on_commit(send, using=using)
+
+    def cast_vote(self, user, question, choice):
+        """Record the user's vote for the choice and update the tallies.
+
+        The vote is written with a single upsert on (user, question)
+        where the backend supports it. Votes of the same user are
+        serialized, so two first votes cast at once count once.
+
+        Returns: id of the previously selected choice, None for a new vote
+        """
+        db = self._primary()
+        with transaction.atomic(using=db):
+            if connections[db].features.has_select_for_update:
+                # A vote not cast yet has no row to lock, the user row is locked instead.
+                User.objects.using(db).select_for_update().filter(pk=user.pk).values_list('pk').first()
+            else:
+                # SQLite reads take no write lock, a no-op write takes it before
+                # the vote is read, instead of failing to upgrade after it.
+                Question.objects.using(db).filter(pk=question.pk).update(modified=F('modified'))
+            previous = (self.using(db).select_for_update()
+                        .filter(user=user, question=question)
+                        .values_list('choice_id', flat=True).first())
+            if previous is not None and previous == choice.id:
+                return previous
+            if connections[db].features.supports_update_conflicts_with_target:
+                self.bulk_create([self.model(user=user, question=question, choice=choice)],
+                                 update_conflicts=True,
+                                 unique_fields=['user', 'question'],
+                                 update_fields=['choice', 'voted_at'])
+            else:
+                self.update_or_create(user=user, question=question,
+                                      defaults={'choice': choice, 'voted_at': timezone.now()})
+            ChoiceTally.objects.move(previous, choice.id)
+            Question.objects.using(db).filter(pk=question.pk).touch()
+            self._send_changed([(user.id, question.id, previous, choice.id)], db)
+        return previous
+
+    def apply_batch(self, entries):
+        """Apply buffered votes in one transaction, the last vote wins.
+
+        Votes of users that no longer exist, for choices that are not
+        choices of the question and votes not newer than the stored vote
+        of the user are dropped.
+
+        Args:
+            entries: (user_id, question_id, choice_id) or (user_id,
+                question_id, choice_id, voted_at) tuples in the order they
+                were cast, voted_at is the time of the flush if not given
+        Returns: list of (user_id, question_id, previous_choice_id, choice_id)
+            for the votes that changed
+        """
+        now = timezone.now()
+        latest = {}
+        voted_at = {}
+        for user_id, question_id, choice_id, *cast_at in entries:
+            latest[(user_id, question_id)] = choice_id
+            voted_at[(user_id, question_id)] = cast_at[0] if cast_at else now
+        if not latest:
+            return []
+        db = self._primary()
+        valid = set(Choice.objects.using(db).filter(pk__in=set(latest.values()))
+                    .values_list('id', 'question_id'))
+        users = set(User.objects.using(db).filter(pk__in={user_id for user_id, _ in latest})
+                    .values_list('id', flat=True))
+        latest = {key: choice_id for key, choice_id in latest.items()
+                  if (choice_id, key[1]) in valid and key[0] in users}
+        changed = []
+        with transaction.atomic(using=db):
+            existing = {
+                (user_id, question_id): (choice_id, stored_at)
+                for user_id, question_id, choice_id, stored_at in self.using(db).select_for_update().filter(
+                    user_id__in={user_id for user_id, _ in latest},
+                    question_id__in={question_id for _, question_id in latest},
+                ).values_list('user_id', 'question_id', 'choice_id', 'voted_at')
+            }
+            for (user_id, question_id), choice_id in latest.items():
+                previous, stored_at = existing.get((user_id, question_id), (None, None))
+                # A replayed vote older than the stored one was already overridden.
+                if stored_at is not None and voted_at[(user_id, question_id)] <= stored_at:
+                    continue
+                if previous != choice_id:
+                    changed.append((user_id, question_id, previous, choice_id))
+            if connections[db].features.supports_update_conflicts_with_target:
+                self.bulk_create([self.model(user_id=user_id, question_id=question_id, choice_id=choice_id,
+                                             voted_at=voted_at[(user_id, question_id)])
+                                  for user_id, question_id, _, choice_id in changed],
+                                 update_conflicts=True,
+                                 unique_fields=['user', 'question'],
+                                 update_fields=['choice', 'voted_at'])
+            else:
+                for user_id, question_id, _, choice_id in changed:
+                    self.update_or_create(user_id=user_id, question_id=question_id,
+                                          defaults={'choice_id': choice_id,
+                                                    'voted_at': voted_at[(user_id, question_id)]})
+            deltas = Counter()
+            for _, _, previous, choice_id in changed:
+                if previous is not None:
+                    deltas[previous] -= 1
+                deltas[choice_id] += 1
+            for choice_id, delta in deltas.items():
+                if delta:
+                    ChoiceTally.objects.add(choice_id, delta)
+            if changed:
+                Question.objects.using(db).filter(pk__in={question_id for _, question_id, _, _ in changed}).touch()
+            self._send_changed(changed, db)
+        return changed
 
 
 class Vote(models.Model):
+    """Vote of a user for a choice of a question."""
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True, default=0)
     choice = models.ForeignKey(Choice, on_delete=models.CASCADE, blank=True, null=True)
     question = models.ForeignKey(Question, on_delete=models.CASCADE, default=0)
+    voted_at = models.DateTimeField('date voted', default=timezone.now)
+    # Choice this vote is counted for in the VoteRollup, kept by the rollup job.
+    rolled_up_choice = models.ForeignKey(Choice, on_delete=models.SET_NULL, blank=True, null=True,
+                                         editable=False, related_name='+')
+
+    objects = VoteManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'question'], name='unique_user_question_vote'),
+        ]
+        indexes = [
+            models.Index(fields=['question', 'choice'], name='vote_question_choice_idx'),
+            models.Index(fields=['voted_at'], name='vote_voted_at_idx'),
+        ]
+
+
+class VoteRollup(models.Model):
+    """Net change of the votes of a choice during one time bucket.
+
+    Buckets are ``resolution`` seconds long and start at ``bucket``. The
+    running sum of the deltas up to a bucket is the vote count of the
+    choice at the end of that bucket.
+    """
+
+    MINUTE = 60
+    HOUR = 3600
+
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    resolution = models.PositiveIntegerField()
+    bucket = models.DateTimeField()
+    delta = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['choice', 'resolution', 'bucket'], name='unique_vote_rollup_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['question', 'resolution', 'bucket'], name='vote_rollup_question_idx'),
+        ]
+
+    def __str__(self):
+        """Return the rollup bucket."""
+        return f'{self.choice} @ {self.bucket:%Y-%m-%d %H:%M} ({self.resolution}s): {self.delta:+d}'
+
+
+class RollupWatermark(models.Model):
+    """Latest vote time a rollup job has processed."""
+
+    name = models.CharField(max_length=50, primary_key=True)
+    position = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        """Return the watermark."""
+        return f'{self.name}: {self.position}'
 
+
+class ResultSnapshot(models.Model):
+    """Frozen results of a closed question.
+
+    Written by the finalize job once the question has closed, when its
+    results can no longer change. It is valid for the ``end_date`` it was
+    taken at, any edit of the question or its choices discards it.
+    """
+
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True, related_name='snapshot')
+    end_date = models.DateTimeField()
+    results = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        """Return the snapshot."""
+        return f'{self.question} closed {self.end_date:%Y-%m-%d %H:%M}: {self.results["total"]} votes'
+
+
+class QuestionStats(models.Model):
+    """Vote count of a question, kept for the most voted leaderboard."""
+
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    total_votes = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-total_votes'], name='question_stats_total_idx'),
+        ]
+
+    def __str__(self):
+        """Return the vote count."""
+        return f'{self.question}: {self.total_votes} votes'
+
+
+class QuestionActivity(models.Model):
+    """Votes cast or changed on a question during one time bucket, for trending polls."""
+
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    bucket = models.DateTimeField()
+    votes = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['question', 'bucket'], name='unique_question_activity_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['bucket'], name='question_activity_bucket_idx'),
+        ]
+
+    def __str__(self):
+        """Return the activity bucket."""
+        return f'{self.question} @ {self.bucket:%Y-%m-%d %H:%M}: {self.votes} votes'
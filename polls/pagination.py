@@ -0,0 +1,135 @@
+"""Keyset pagination of the poll catalog.
+
+Pages are ordered by ``(pub_date, id)`` from the newest, and a page
+starts right after the last question of the previous one. The database
+seeks to that position in the ``(pub_date, id)`` index, so every page
+costs the same however deep it is, unlike an OFFSET that reads and
+discards all the rows before it.
+"""
+
+import base64
+import binascii
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Question
+
+# Catalog filters, None lists every published question.
+STATES = (Question.OPEN, Question.CLOSED, Question.UPCOMING)
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor that was not made by encode_cursor()."""
+
+
+def encode_cursor(question):
+    """Return the opaque cursor of the page after the question."""
+    position = f'{question.pub_date.isoformat()}|{question.id}'
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the (pub_date, id) position of the cursor.
+
+    Raises: InvalidCursor when the cursor cannot be decoded
+    """
+    try:
+        position = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        pub_date, question_id = position.split('|')
+        pub_date = parse_datetime(pub_date)
+        question_id = int(question_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(cursor)
+    if pub_date is None:
+        raise InvalidCursor(cursor)
+    return pub_date, question_id
+
+
+def catalog(state=None, now=None):
+    """Return the questions of the catalog filter annotated with their state.
+
+    Raises: ValueError for an unknown state
+    """
+    now = now or timezone.now()
+    if state is None:
+        questions = Question.objects.filter(pub_date__lte=now)
+    elif state == Question.OPEN:
+        questions = Question.objects.filter(Q(end_date__isnull=True) | Q(end_date__gt=now), pub_date__lte=now)
+    elif state == Question.CLOSED:
+        questions = Question.objects.filter(end_date__lte=now, pub_date__lte=now)
+    elif state == Question.UPCOMING:
+        questions = Question.objects.filter(pub_date__gt=now)
+    else:
+        raise ValueError(f'Unknown state {state!r}')
+    return questions.with_state(now).order_by('-pub_date', '-id')
+
+
+def keyset_page(queryset, cursor=None, size=10):
+    """Return a page of the queryset ordered by newest (pub_date, id) first.
+
+    Returns: (list of questions, cursor of the next page or None)
+    Raises: InvalidCursor when the cursor cannot be decoded
+    """
+    if cursor:
+        pub_date, question_id = decode_cursor(cursor)
+        # Same rows as (pub_date, id) < (pub_date, question_id), written
+        # as a range on pub_date so the index can seek to it.
+        queryset = queryset.filter(pub_date__lte=pub_date).exclude(pub_date=pub_date, id__gte=question_id)
+    questions = list(queryset[:size + 1])
+    if len(questions) <= size:
+        return questions, None
+    questions = questions[:size]
+    return questions, encode_cursor(questions[-1])
+
+
+def estimate_rows(model, using='default'):
+    """Return the approximate number of rows of the model's table, None if unknown.
+
+    PostgreSQL and MySQL keep a row estimate in their catalogs. SQLite has
+    none, the highest primary key is used instead, read from the end of
+    the primary key index.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass'
+        params = [connection.ops.quote_name(table)]
+    elif connection.vendor == 'mysql':
+        sql = 'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s'
+        params = [table]
+    elif connection.vendor == 'sqlite' and model._meta.pk.get_internal_type() in ('AutoField', 'BigAutoField'):
+        return model._default_manager.using(using).aggregate(last=Max('pk'))['last'] or 0
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    # PostgreSQL reports -1 for a table that was never analyzed.
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that never counts every row of a huge table.
+
+    An unfiltered list of a table larger than ``exact_limit`` rows uses the
+    estimate of estimate_rows(). Any other list is counted up to
+    ``exact_limit + 1`` rows, so a filter that matches millions of rows
+    costs no more than one that matches a few thousand.
+    """
+
+    exact_limit = 10000
+
+    @cached_property
+    def count(self):
+        """Return the exact number of objects, or an estimate past exact_limit."""
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.exact_limit:
+                return estimate
+        return queryset.order_by()[:self.exact_limit + 1].count()
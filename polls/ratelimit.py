@@ -0,0 +1,250 @@
+"""Rate limiting and duplicate suppression for voting.
+
+Votes are limited by token buckets per user and per client address. A
+bucket holds up to ``burst`` tokens, refills ``rate`` tokens a second,
+and every vote takes one. A vote that repeats the user's last accepted
+vote within ``DUPLICATE_WINDOW`` seconds is acknowledged without
+touching the database.
+
+The state lives in a store. MemoryStore keeps it in this process with a
+bounded LRU, CacheStore in a Django cache shared by all processes.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+DEFAULTS = {
+    'ENABLED': True,
+    'STORE': 'polls.ratelimit.MemoryStore',
+    'OPTIONS': {},
+    'USER': (10, 1.0),
+    'IP': (30, 5.0),
+    'PROXIES': 0,
+    'DUPLICATE_WINDOW': 10,
+}
+
+
+def rate_limit_settings():
+    """Return the rate limit settings with their defaults."""
+    return {**DEFAULTS, **getattr(settings, 'POLLS_RATE_LIMIT', {})}
+
+
+class MemoryStore:
+    """Expiring key value store in this process, evicting the least recently used keys."""
+
+    def __init__(self, max_entries=10000):
+        """Initialize an empty store holding at most max_entries keys."""
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _set(self, key, value, timeout, now):
+        self._entries[key] = (now + timeout, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Return the value of the key, None if it is missing or expired."""
+        with self._lock:
+            return self._get(key, time.monotonic())
+
+    def set(self, key, value, timeout):
+        """Store the value for timeout seconds."""
+        with self._lock:
+            self._set(key, value, timeout, time.monotonic())
+
+    def update(self, key, function, timeout):
+        """Replace the value of the key by function(value) atomically.
+
+        Args:
+            function: takes the current value or None and returns
+                (result, new value)
+        Returns: the result of the function
+        """
+        with self._lock:
+            now = time.monotonic()
+            result, value = function(self._get(key, now))
+            self._set(key, value, timeout, now)
+            return result
+
+    def clear(self):
+        """Remove every key."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        """Return the number of keys, including expired ones not yet removed."""
+        return len(self._entries)
+
+
+class CacheStore:
+    """Store in a Django cache, shared by every process that uses the cache.
+
+    Updates are a read followed by a write, so concurrent requests of one
+    client may both take the last token. The limits hold within that slack.
+    """
+
+    def __init__(self, alias='polls', prefix='polls:ratelimit:'):
+        """Initialize the store on the cache alias."""
+        self.alias = alias
+        self.prefix = prefix
+
+    @property
+    def cache(self):
+        """Return the cache of the store."""
+        return caches[self.alias]
+
+    def get(self, key):
+        """Return the value of the key, None if it is missing or expired."""
+        return self.cache.get(self.prefix + key)
+
+    def set(self, key, value, timeout):
+        """Store the value for timeout seconds."""
+        self.cache.set(self.prefix + key, value, math.ceil(timeout))
+
+    def update(self, key, function, timeout):
+        """Replace the value of the key by function(value)."""
+        result, value = function(self.get(key))
+        self.set(key, value, timeout)
+        return result
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store():
+    """Return the store configured in POLLS_RATE_LIMIT."""
+    options = rate_limit_settings()
+    key = (options['STORE'], tuple(sorted(options['OPTIONS'].items())))
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = import_string(options['STORE'])(**options['OPTIONS'])
+        return _stores[key]
+
+
+def reset():
+    """Forget the state of every in-process store."""
+    with _stores_lock:
+        for store in _stores.values():
+            if hasattr(store, 'clear'):
+                store.clear()
+
+
+def take_token(store, key, burst, rate):
+    """Take a token from the bucket of the key.
+
+    Returns: 0 if the token was taken, else seconds until one is available
+    """
+    def take(bucket):
+        now = time.time()
+        tokens, updated = bucket or (burst, now)
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            return 0, (tokens - 1, now)
+        return (1 - tokens) / rate, (tokens, now)
+
+    # A bucket left alone for burst / rate seconds is full again.
+    return store.update(key, take, burst / rate)
+
+
+def client_address(request):
+    """Return the address of the client.
+
+    Behind PROXIES trusted reverse proxies, each appending the address it
+    got the request from to X-Forwarded-For, the client is the address
+    added by the outermost one. Entries left of it come from the client
+    and are ignored.
+    """
+    proxies = rate_limit_settings()['PROXIES']
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if proxies and forwarded:
+        addresses = [address.strip() for address in forwarded.split(',')]
+        return addresses[-min(proxies, len(addresses))]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def check_rate(request):
+    """Take a vote token for the user and the client address of the request.
+
+    Returns: 0 if the request may vote, else seconds until it may retry
+    """
+    options = rate_limit_settings()
+    store = get_store()
+    waits = []
+    if request.user.is_authenticated:
+        waits.append(take_token(store, f'user:{request.user.pk}', *options['USER']))
+    waits.append(take_token(store, f'ip:{client_address(request)}', *options['IP']))
+    return max(waits)
+
+
+def too_many_requests(retry_after):
+    """Return a 429 response asking the client to retry later."""
+    response = HttpResponse('Too many votes, try again later.', status=429, content_type='text/plain')
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def rate_limited(view):
+    """Answer requests over the vote rate limits with 429 Too Many Requests.
+
+    Works for sync and async views, apply it inside login_required so the
+    user is known.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if rate_limit_settings()['ENABLED']:
+                retry_after = check_rate(request)
+                if retry_after:
+                    return too_many_requests(retry_after)
+            return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if rate_limit_settings()['ENABLED']:
+            retry_after = check_rate(request)
+            if retry_after:
+                return too_many_requests(retry_after)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _vote_key(user_id, question_id):
+    return f'vote:{user_id}:{question_id}'
+
+
+def is_repeat_vote(user_id, question_id, choice_id):
+    """Return True if the user just voted for the same choice of the question."""
+    window = rate_limit_settings()['DUPLICATE_WINDOW']
+    if not window or choice_id is None:
+        return False
+    return get_store().get(_vote_key(user_id, question_id)) == str(choice_id)
+
+
+def remember_vote(user_id, question_id, choice_id):
+    """Record an accepted vote for duplicate suppression."""
+    window = rate_limit_settings()['DUPLICATE_WINDOW']
+    if window:
+        get_store().set(_vote_key(user_id, question_id), str(choice_id), window)
@@ -0,0 +1,111 @@
+"""Aggregated results for ku polls."""
+
+from django.db.models import Prefetch, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Choice, ChoiceTally, Question, ResultSnapshot
+
+
+def _choice_rows(question):
+    """Return the queryset of (id, choice_text, votes) rows of the question."""
+    return (Choice.objects.filter(question=question)
+            .annotate(total_votes=Coalesce(Sum('tallies__count'), 0))
+            .order_by('id')
+            .values_list('id', 'choice_text', 'total_votes'))
+
+
+def build_results(question, rows):
+    """Return the results of the question from its (id, choice_text, votes) rows."""
+    total = sum(votes for _, _, votes in rows)
+    ordered = sorted((votes for _, _, votes in rows), reverse=True)
+    choices = []
+    for choice_id, choice_text, votes in rows:
+        choices.append({
+            'id': choice_id,
+            'choice_text': choice_text,
+            'votes': votes,
+            'percentage': round(100 * votes / total, 1) if total else 0.0,
+            'rank': ordered.index(votes) + 1,
+        })
+    return {
+        'question': question.id,
+        'question_text': question.question_text,
+        'total': total,
+        'choices': choices,
+    }
+
+
+def is_closed(question, now=None):
+    """Return True if voting on the question has ended."""
+    return question.end_date is not None and question.end_date <= (now or timezone.now())
+
+
+def _valid_snapshot(question, snapshot):
+    """Return the results of the snapshot if it was taken at the question's end date."""
+    if snapshot is None or not is_closed(question) or snapshot.end_date != question.end_date:
+        return None
+    return snapshot.results
+
+
+def frozen_results(question):
+    """Return the snapshot results of a closed question, None if it has none.
+
+    Load the question with ``select_related('snapshot')`` to look the
+    snapshot up without a query.
+    """
+    if not is_closed(question):
+        return None
+    return _valid_snapshot(question, getattr(question, 'snapshot', None))
+
+
+async def afrozen_results(question):
+    """Async version of frozen_results()."""
+    if not is_closed(question):
+        return None
+    if Question.snapshot.is_cached(question):
+        snapshot = getattr(question, 'snapshot', None)
+    else:
+        snapshot = await ResultSnapshot.objects.filter(question=question).afirst()
+    return _valid_snapshot(question, snapshot)
+
+
+def get_results(question):
+    """Return the results of the question from one grouped query.
+
+    Args:
+        question: Question object
+    Returns: dict with the total vote count and every choice's
+        votes, percentage and rank (equal votes share a rank)
+    """
+    return build_results(question, list(_choice_rows(question)))
+
+
+async def aget_results(question):
+    """Async version of get_results()."""
+    return build_results(question, [row async for row in _choice_rows(question)])
+
+
+def get_batch_results(question_ids):
+    """Return the results of several questions from three queries.
+
+    The questions, their snapshots and their choices are loaded with one
+    prefetch and the votes of all choices are summed in one grouped
+    query, however many questions are asked for. Closed questions are
+    answered from their snapshots.
+
+    Returns: dict of question id to results, without the ids of missing
+        questions
+    """
+    questions = (Question.objects.filter(pk__in=question_ids)
+                 .select_related('snapshot')
+                 .prefetch_related(Prefetch('choice_set', queryset=Choice.objects.order_by('id')
+                                            .only('id', 'question_id', 'choice_text'))))
+    questions = list(questions)
+    votes = dict(ChoiceTally.objects.filter(choice__question__in=[question.id for question in questions])
+                 .values_list('choice').annotate(total=Sum('count')))
+    return {
+        question.id: frozen_results(question) or build_results(question, [
+            (choice.id, choice.choice_text, votes.get(choice.id, 0)) for choice in question.choice_set.all()])
+        for question in questions
+    }
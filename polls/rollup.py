@@ -0,0 +1,181 @@
+"""Incremental time series rollup of votes.
+
+The rollup job reads the votes cast or changed since its watermark and
+adds +1 for the new choice and -1 for the choice the vote was counted
+for before to the minute and hour buckets of ``voted_at``. Every vote
+remembers the choice it is counted for, so running the job twice, or
+over a window that overlaps the previous run, counts nothing twice.
+"""
+
+import datetime
+import math
+from collections import Counter
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .models import QuestionActivity, QuestionStats, RollupWatermark, Vote, VoteRollup
+
+RESOLUTIONS = (VoteRollup.MINUTE, VoteRollup.HOUR)
+
+WATERMARK = 'votes'
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def rollup_settings():
+    """Return the rollup settings with their defaults."""
+    return {'LAG': 60, 'BATCH_SIZE': 5000, 'MAX_POINTS': 500, **getattr(settings, 'POLLS_ROLLUP', {})}
+
+
+def bucket_start(moment, resolution):
+    """Return the start of the bucket of the given length the moment falls in."""
+    seconds = (moment - EPOCH).total_seconds()
+    return EPOCH + datetime.timedelta(seconds=seconds // resolution * resolution)
+
+
+def _pending(db, since):
+    """Return the votes not counted for their current choice, oldest first."""
+    votes = Vote.objects.using(db).exclude(choice__isnull=True, rolled_up_choice__isnull=True).filter(
+        Q(choice__isnull=True) | Q(rolled_up_choice__isnull=True) | ~Q(rolled_up_choice=F('choice')))
+    if since is not None:
+        votes = votes.filter(voted_at__gt=since)
+    return votes.order_by('voted_at', 'id')
+
+
+def _apply(db, deltas):
+    """Add the deltas keyed by (question_id, choice_id, resolution, bucket)."""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    existing = VoteRollup.objects.using(db).filter(
+        choice_id__in={choice_id for _, choice_id, _, _ in deltas},
+        bucket__in={bucket for _, _, _, bucket in deltas},
+    )
+    updated = []
+    for rollup in existing:
+        key = (rollup.question_id, rollup.choice_id, rollup.resolution, rollup.bucket)
+        if key in deltas:
+            rollup.delta += deltas.pop(key)
+            updated.append(rollup)
+    VoteRollup.objects.using(db).bulk_update(updated, ['delta'])
+    VoteRollup.objects.using(db).bulk_create([
+        VoteRollup(question_id=question_id, choice_id=choice_id, resolution=resolution, bucket=bucket, delta=delta)
+        for (question_id, choice_id, resolution, bucket), delta in deltas.items()
+    ])
+
+
+def rollup_votes(batch_size=None, lag=None, question_ids=None):
+    """Roll the votes changed since the watermark up into the time buckets.
+
+    Each batch is applied in one transaction that holds the watermark
+    row, so concurrent jobs wait for each other. The window starts
+    ``lag`` seconds before the watermark to pick up votes from
+    transactions that committed after a later vote was rolled up.
+
+    With ``question_ids`` every pending vote of those questions is rolled
+    up whatever its time, and the watermark is left alone. This counts
+    votes written with times behind the watermark, such as imported ones.
+
+    The votes of every batch are also counted into the leaderboards.
+
+    Returns: number of votes rolled up
+    """
+    # Imported here, the leaderboards import this module.
+    from .leaderboards import count_votes
+
+    options = rollup_settings()
+    batch_size = batch_size or options['BATCH_SIZE']
+    lag = datetime.timedelta(seconds=options['LAG'] if lag is None else lag)
+    db = router.db_for_write(Vote)
+    total = 0
+    while True:
+        with transaction.atomic(using=db):
+            watermark, _ = RollupWatermark.objects.using(db).select_for_update().get_or_create(name=WATERMARK)
+            since = None if watermark.position is None or question_ids is not None else watermark.position - lag
+            pending = _pending(db, since)
+            if question_ids is not None:
+                pending = pending.filter(question_id__in=question_ids)
+            votes = list(pending.select_for_update()
+                         .values_list('id', 'question_id', 'choice_id', 'rolled_up_choice_id', 'voted_at')
+                         [:batch_size])
+            if not votes:
+                return total
+            deltas = Counter()
+            counted = {}
+            for vote_id, question_id, choice_id, rolled_up_choice_id, voted_at in votes:
+                for resolution in RESOLUTIONS:
+                    bucket = bucket_start(voted_at, resolution)
+                    if rolled_up_choice_id is not None:
+                        deltas[(question_id, rolled_up_choice_id, resolution, bucket)] -= 1
+                    if choice_id is not None:
+                        deltas[(question_id, choice_id, resolution, bucket)] += 1
+                counted.setdefault(choice_id, []).append(vote_id)
+            _apply(db, deltas)
+            count_votes(db, [vote[1:] for vote in votes])
+            for choice_id, vote_ids in counted.items():
+                Vote.objects.using(db).filter(pk__in=vote_ids).update(rolled_up_choice_id=choice_id)
+            latest = max(voted_at for *_, voted_at in votes)
+            if question_ids is None and (watermark.position is None or latest > watermark.position):
+                watermark.position = latest
+                watermark.save(update_fields=['position'])
+        total += len(votes)
+
+
+def reset_rollup():
+    """Forget all rollups and leaderboard counts so the next job rebuilds them from every vote."""
+    db = router.db_for_write(Vote)
+    with transaction.atomic(using=db):
+        RollupWatermark.objects.using(db).select_for_update().filter(name=WATERMARK).delete()
+        VoteRollup.objects.using(db).all().delete()
+        QuestionStats.objects.using(db).all().delete()
+        QuestionActivity.objects.using(db).all().delete()
+        Vote.objects.using(db).update(rolled_up_choice=None)
+
+
+def timeseries(question, start=None, end=None, points=100):
+    """Return the vote count of every choice at evenly spaced times.
+
+    The span from start to end is cut into at most ``points`` steps of
+    whole minutes or whole hours, so the size of the response does not
+    grow with the age of the poll. Counts lag behind the live results
+    until the next rollup job.
+
+    Returns: dict of the step in seconds, the choices and the points,
+        each with a time and the vote counts in the order of the choices
+    """
+    now = timezone.now()
+    points = max(1, min(points, rollup_settings()['MAX_POINTS']))
+    start = start or question.pub_date
+    if end is None:
+        end = now if question.end_date is None else min(now, question.end_date)
+    choices = list(question.choice_set.order_by('id').values_list('id', 'choice_text'))
+    series = {
+        'question': question.id,
+        'step': None,
+        'choices': [{'id': choice_id, 'text': text} for choice_id, text in choices],
+        'points': [],
+    }
+    if end <= start:
+        return series
+    resolution = VoteRollup.HOUR if (end - start).total_seconds() / points >= VoteRollup.HOUR else VoteRollup.MINUTE
+    start = bucket_start(start, resolution)
+    span = (end - start).total_seconds()
+    step = resolution * max(1, math.ceil(span / points / resolution))
+    rollups = VoteRollup.objects.filter(question=question, resolution=resolution)
+    counts = Counter(dict(rollups.filter(bucket__lt=start).values_list('choice').annotate(total=Sum('delta'))))
+    steps = Counter()
+    for choice_id, bucket, delta in rollups.filter(bucket__gte=start, bucket__lt=end).values_list(
+            'choice_id', 'bucket', 'delta'):
+        steps[(int((bucket - start).total_seconds() // step), choice_id)] += delta
+    for number in range(math.ceil(span / step)):
+        for choice_id, _ in choices:
+            counts[choice_id] += steps[(number, choice_id)]
+        series['points'].append({
+            'time': (start + datetime.timedelta(seconds=(number + 1) * step)).isoformat(),
+            'votes': [counts[choice_id] for choice_id, _ in choices],
+        })
+    series['step'] = step
+    return series
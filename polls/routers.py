@@ -0,0 +1,60 @@
+"""Database router for ku polls."""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+REPLICA = 'replica'
+
+_use_primary = ContextVar('polls_use_primary', default=False)
+
+
+def pin_primary():
+    """Read from the primary for the rest of the current request.
+
+    Returns: token for unpin_primary()
+    """
+    return _use_primary.set(True)
+
+
+def unpin_primary(token):
+    """Undo pin_primary()."""
+    _use_primary.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside the block."""
+    token = pin_primary()
+    try:
+        yield
+    finally:
+        unpin_primary(token)
+
+
+class PrimaryReplicaRouter:
+    """Send reads of poll data to the replica and everything else to the primary.
+
+    Sessions, users and admin data are always read from the primary, so
+    logging in never depends on the replica being up to date.
+    """
+
+    def db_for_read(self, model, **hints):
+        """Return the replica for poll models unless the request is pinned."""
+        if (model._meta.app_label == 'polls' and REPLICA in settings.DATABASES
+                and not _use_primary.get()):
+            return REPLICA
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        """Write everything to the primary."""
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Allow relations between the primary and its replica."""
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Migrate only the primary, the replica is a copy of it."""
+        return db == 'default'
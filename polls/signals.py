@@ -0,0 +1,8 @@
+"""Signals sent by ku polls."""
+
+from django.dispatch import Signal
+
+# Sent after a vote was created or moved to another choice and the
+# transaction committed. Arguments: user_id, question_id, choice_id,
+# previous_choice_id (None for a new vote).
+vote_changed = Signal()
@@ -0,0 +1,71 @@
+"""Result snapshots of closed polls.
+
+Once a question has closed its results can no longer change, so the
+finalize job stores them once in a ResultSnapshot and the results views
+serve the snapshot instead of summing the tallies. Editing the question
+or its choices, for example to reopen it, discards the snapshot.
+"""
+
+import datetime
+
+from django.conf import settings
+from django.db import router
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+
+from .models import Question, ResultSnapshot
+from .results import get_batch_results
+from .routers import pin_primary, unpin_primary
+
+
+def snapshot_settings():
+    """Return the snapshot settings with their defaults."""
+    return {'GRACE': 60, 'BATCH_SIZE': 500, 'MAX_AGE': 86400, **getattr(settings, 'POLLS_SNAPSHOT', {})}
+
+
+def finalize_polls(now=None, grace=None):
+    """Snapshot the results of the questions closed without a snapshot.
+
+    Questions are finalized ``grace`` seconds after they close, so votes
+    that were being written when the poll closed are counted.
+
+    Returns: number of questions finalized
+    """
+    options = snapshot_settings()
+    grace = datetime.timedelta(seconds=options['GRACE'] if grace is None else grace)
+    db = router.db_for_write(ResultSnapshot)
+    cutoff = (now or timezone.now()) - grace
+    total = 0
+    # The results must come from the primary, a replica may be behind.
+    token = pin_primary()
+    try:
+        while True:
+            questions = dict(Question.objects.using(db).filter(end_date__lte=cutoff, snapshot__isnull=True)
+                             .order_by('end_date').values_list('id', 'end_date')[:options['BATCH_SIZE']])
+            if not questions:
+                return total
+            results = get_batch_results(list(questions))
+            ResultSnapshot.objects.using(db).bulk_create([
+                ResultSnapshot(question_id=question_id, end_date=questions[question_id], results=entry)
+                for question_id, entry in results.items()
+            ], ignore_conflicts=True)
+            total += len(results)
+    finally:
+        unpin_primary(token)
+
+
+def discard_snapshot(question_id):
+    """Delete the snapshot of the question, the next job takes a new one if it is closed."""
+    ResultSnapshot.objects.filter(question_id=question_id).delete()
+
+
+def cache_frozen(response, private=False):
+    """Let clients keep a response built from a snapshot for MAX_AGE seconds.
+
+    Pages that show the logged in user are only cached by the browser.
+    """
+    if private:
+        patch_cache_control(response, private=True, max_age=snapshot_settings()['MAX_AGE'])
+    else:
+        patch_cache_control(response, public=True, max_age=snapshot_settings()['MAX_AGE'])
+    return response
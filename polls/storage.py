@@ -0,0 +1,18 @@
+"""Static file storage for ku polls."""
+
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+class StaticStorage(CompressedManifestStaticFilesStorage):
+    """Hashed and precompressed static files, once collectstatic has run.
+
+    Before collectstatic has written a manifest, as in tests and in
+    development, templates get the plain names served by the staticfiles
+    finders. With a manifest every name must be in it.
+    """
+
+    def stored_name(self, name):
+        """Return the hashed name of the file, or the name itself without a manifest."""
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
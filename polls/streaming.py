@@ -0,0 +1,117 @@
+"""Live results streaming for ku polls.
+
+One in-process broadcaster fans vote deltas out to every subscriber of a
+question, so idle Server-Sent Events connections wait on a queue instead
+of polling the database.
+"""
+
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+
+# Put in a subscriber queue in place of the deltas it could not keep up
+# with, the stream then sends full results instead.
+RESYNC = object()
+
+
+class TooManySubscribers(Exception):
+    """Raised when the broadcaster is at its subscriber cap."""
+
+
+class Subscription:
+    """Queue of events of one question for one client."""
+
+    def __init__(self, broadcaster, question_id, queue_size):
+        """Initialize an empty bounded queue."""
+        self.broadcaster = broadcaster
+        self.question_id = question_id
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    def put(self, event):
+        """Queue an event, replacing the backlog of a slow client with a resync."""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self):
+        """Wait for the next event."""
+        return await self.queue.get()
+
+    def close(self):
+        """Stop receiving events."""
+        self.broadcaster.unsubscribe(self)
+
+
+class Broadcaster:
+    """Fan out events per question to subscribers on one event loop."""
+
+    def __init__(self, max_subscribers=10000, queue_size=16):
+        """Initialize a broadcaster without subscribers."""
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._count = 0
+        self._loop = None
+
+    @property
+    def subscriber_count(self):
+        """Return the number of subscribers of all questions."""
+        return self._count
+
+    def subscribe(self, question_id):
+        """Subscribe to the events of the question from the running event loop.
+
+        Raises: TooManySubscribers when the cap is reached
+        """
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise TooManySubscribers()
+            self._loop = asyncio.get_running_loop()
+            subscription = Subscription(self, question_id, self.queue_size)
+            self._channels.setdefault(question_id, set()).add(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove the subscription."""
+        with self._lock:
+            channel = self._channels.get(subscription.question_id, set())
+            if subscription in channel:
+                channel.discard(subscription)
+                self._count -= 1
+            if not channel:
+                self._channels.pop(subscription.question_id, None)
+
+    def _deliver(self, question_id, event):
+        for subscription in list(self._channels.get(question_id, ())):
+            subscription.put(event)
+
+    def publish(self, question_id, event):
+        """Send an event to the subscribers of the question, from any thread."""
+        if question_id not in self._channels or self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._deliver(question_id, event)
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._deliver, question_id, event)
+
+
+broadcaster = Broadcaster(
+    max_subscribers=getattr(settings, 'POLLS_STREAM_MAX_SUBSCRIBERS', 10000),
+    queue_size=getattr(settings, 'POLLS_STREAM_QUEUE_SIZE', 16),
+)
+
+
+def format_event(event, data):
+    """Return a Server-Sent Event."""
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
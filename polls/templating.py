@@ -0,0 +1,42 @@
+"""Template backend for ku polls that times template rendering."""
+
+import time
+
+from django.template.backends.django import DjangoTemplates
+
+from .middleware import current_timing
+
+
+class TimedTemplate:
+    """Template wrapper adding its render time to the current request timing."""
+
+    def __init__(self, template):
+        """Wrap a backend template."""
+        self.template = template
+
+    def __getattr__(self, name):
+        """Delegate everything else to the wrapped template."""
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        """Render the template and record how long it took."""
+        timing = current_timing()
+        if timing is None:
+            return self.template.render(context, request)
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            timing.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend with render timing."""
+
+    def from_string(self, template_code):
+        """Return a timed template compiled from a string."""
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        """Return a timed template loaded by name."""
+        return TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,78 @@
+"""Test for the admin pages of large tables."""
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from polls import benchmarks, cache
+from polls.models import Question, Vote
+from polls.pagination import EstimatedCountPaginator, estimate_rows
+
+
+class AdminChangelistTests(TestCase):
+    """Test cases for the query counts of the changelists."""
+
+    def setUp(self):
+        """Log a superuser in."""
+        cache.get_cache().clear()
+        self.admin = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        self.client.force_login(self.admin)
+
+    def changelist_queries(self):
+        """Return the number of queries of every changelist."""
+        # Resolve the session and user first, they are cached afterwards.
+        self.client.get(reverse('admin:index'))
+        counts = {}
+        for model in ('question', 'choice', 'vote'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(f'admin:polls_{model}_changelist'))
+            self.assertEqual(response.status_code, 200)
+            counts[model] = len(queries)
+        return counts
+
+    def test_constant_query_count(self):
+        """The changelists run as many queries with many rows as with few."""
+        benchmarks.build_dataset(questions=2, choices=2, votes=4)
+        small = self.changelist_queries()
+        benchmarks.build_dataset(questions=40, choices=5, votes=400)
+        self.assertEqual(self.changelist_queries(), small)
+
+    def test_annotated_columns(self):
+        """The changelists show the state and vote counts from the annotations."""
+        dataset = benchmarks.build_dataset(questions=1, choices=2, votes=3)
+        response = self.client.get(reverse('admin:polls_question_changelist'))
+        self.assertContains(response, 'class="field-vote_total">3<')
+        self.assertContains(response, 'class="field-state">open<')
+        choice_id = dataset['choices'][dataset['questions'][0]][0]
+        response = self.client.get(reverse('admin:polls_choice_changelist'))
+        self.assertContains(response, f'/polls/choice/{choice_id}/change/')
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    """Test cases for the estimated count paginator."""
+
+    def setUp(self):
+        """Create a few questions and votes."""
+        benchmarks.build_dataset(questions=5, choices=2, votes=20)
+
+    def test_small_table_exact(self):
+        """Tables below the limit are counted exactly."""
+        paginator = EstimatedCountPaginator(Vote.objects.order_by('pk'), 10)
+        self.assertEqual(paginator.count, 20)
+
+    def test_large_table_estimated(self):
+        """Unfiltered tables over the limit use the estimate without counting."""
+        paginator = EstimatedCountPaginator(Vote.objects.order_by('pk'), 10)
+        paginator.exact_limit = 5
+        with CaptureQueriesContext(connection) as queries:
+            count = paginator.count
+        self.assertEqual(count, estimate_rows(Vote))
+        self.assertGreaterEqual(count, 20)
+        self.assertNotIn('COUNT(', ' '.join(query['sql'] for query in queries))
+
+    def test_filtered_count_capped(self):
+        """Filtered lists are counted up to one past the limit."""
+        paginator = EstimatedCountPaginator(Question.objects.filter(question_text__startswith='Benchmark'), 2)
+        paginator.exact_limit = 3
+        self.assertEqual(paginator.count, 4)
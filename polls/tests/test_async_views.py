@@ -0,0 +1,61 @@
+"""Test for the async detail, results and vote views."""
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from polls import async_views, cache, ratelimit
+from polls.benchmarks import use_async_views
+from polls.models import Question, Vote
+
+
+class AsyncViewTests(TestCase):
+    """Test cases for the views served as async views."""
+
+    def setUp(self):
+        """Route to the async views and create an ongoing question."""
+        ratelimit.reset()
+        cache.get_cache().clear()
+        context = use_async_views()
+        context.__enter__()
+        self.addCleanup(context.__exit__, None, None, None)
+        self.user = User.objects.create(username='kiku')
+        self.question = Question.objects.create(question_text='Async poll',
+                                                pub_date=timezone.now() - datetime.timedelta(days=1),
+                                                end_date=timezone.now() + datetime.timedelta(days=1))
+        self.choice = self.question.choice_set.create(choice_text='First')
+
+    def test_url_names_unchanged(self):
+        """The URL names resolve to the async views."""
+        match = resolve(reverse('polls:vote', args=(self.question.id,)))
+        self.assertEqual(match.func.__wrapped__, async_views.vote.__wrapped__)
+
+    async def test_detail(self):
+        """The async detail view lists the choices."""
+        response = await self.async_client.get(reverse('polls:detail', args=(self.question.id,)))
+        self.assertContains(response, 'First')
+
+    async def test_results(self):
+        """The async results view shows the results."""
+        response = await self.async_client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertContains(response, 'Async poll')
+        self.assertEqual(response.context['results']['total'], 0)
+
+    async def test_vote_requires_login(self):
+        """An anonymous vote is redirected to the login page."""
+        response = await self.async_client.post(reverse('polls:vote', args=(self.question.id,)),
+                                                {'choice': self.choice.id})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/accounts/login/', response['Location'])
+        self.assertFalse(await Vote.objects.aexists())
+
+    async def test_vote(self):
+        """A logged in user can vote through the async view."""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(reverse('polls:vote', args=(self.question.id,)),
+                                                {'choice': self.choice.id})
+        self.assertRedirects(response, reverse('polls:results', args=(self.question.id,)),
+                             fetch_redirect_response=False)
+        self.assertEqual(await Vote.objects.filter(user=self.user, choice=self.choice).acount(), 1)
@@ -0,0 +1,126 @@
+"""Test for the vote integrity audit."""
+import datetime
+import json
+import os
+import sqlite3
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from polls.audit import audit_votes, pk_ranges, repair, scan
+from polls.models import ChoiceTally, Question, Vote
+
+
+class VoteAuditTests(TestCase):
+    """Test cases for finding and repairing inconsistent votes."""
+
+    def setUp(self):
+        """Create two questions and a sound vote by each of six users."""
+        now = timezone.now()
+        self.questions = [Question.objects.create(question_text=f'Poll {number}', pub_date=now,
+                                                  end_date=now + datetime.timedelta(days=1)) for number in range(2)]
+        self.choices = [question.choice_set.create(choice_text='Yes') for question in self.questions]
+        self.users = [User.objects.create(username=f'user{number}') for number in range(6)]
+        self.votes = [Vote.objects.create(user=user, question=self.questions[0], choice=self.choices[0])
+                      for user in self.users]
+        ChoiceTally.objects.rebuild()
+
+    def break_votes(self):
+        """Make one vote of every kind of finding."""
+        Vote.objects.filter(pk=self.votes[0].pk).update(user_id=None)
+        Vote.objects.filter(pk=self.votes[1].pk).update(user_id=999999)
+        Vote.objects.filter(pk=self.votes[2].pk).update(choice_id=None)
+        Vote.objects.filter(pk=self.votes[3].pk).update(question_id=self.questions[1].id)
+
+    def test_sound_votes(self):
+        """Sound votes and tallies give no findings."""
+        report = audit_votes(size=2)
+        self.assertEqual(report['votes'], 6)
+        self.assertEqual([name for name, vote_ids in report['findings'].items() if vote_ids], [])
+        self.assertEqual(report['drift'], {})
+
+    def test_find_and_repair(self):
+        """Every finding is reported and repaired, and the tallies are rebuilt."""
+        self.break_votes()
+        report = audit_votes(size=4)
+        self.assertEqual(report['findings']['no_user'], [self.votes[0].id])
+        self.assertEqual(report['findings']['orphan_user'], [self.votes[1].id])
+        self.assertEqual(report['findings']['no_choice'], [self.votes[2].id])
+        self.assertEqual(report['findings']['mismatch'], [self.votes[3].id])
+        self.assertEqual(report['drift'], {self.choices[0].id: (6, 3)})
+        done = repair(report, batch_size=2)
+        self.assertEqual((done['deleted'], done['moved']), (3, 1))
+        self.assertEqual(Vote.objects.get(pk=self.votes[3].pk).question, self.questions[0])
+        report = audit_votes(size=4)
+        self.assertEqual([name for name, vote_ids in report['findings'].items() if vote_ids], [])
+        self.assertEqual(report['drift'], {})
+
+    def test_ranges_cover_table(self):
+        """The ranges cover every vote id once."""
+        ranges = pk_ranges(4)
+        self.assertEqual(ranges[0][0], self.votes[0].id)
+        self.assertEqual(ranges[-1][1], self.votes[-1].id + 1)
+        self.assertTrue(all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:])))
+
+    def test_resume_from_checkpoint(self):
+        """Ranges in the checkpoint are not checked again."""
+        directory = tempfile.mkdtemp()
+        checkpoint = os.path.join(directory, 'audit.json')
+        first = pk_ranges(3)[0]
+        with open(checkpoint, 'w') as file:
+            json.dump({'size': 3, 'plan': pk_ranges(3), 'ranges': {first[0]: {
+                'range': list(first), 'votes': 3, 'findings': {'no_user': [first[0]]}, 'counts': {}}}}, file)
+        progress = []
+        results = scan(size=3, checkpoint=checkpoint, progress=lambda *args: progress.append(args))
+        self.assertEqual(results[0]['findings'], {'no_user': [first[0]]})
+        self.assertEqual(progress, [(2, 2, 6)])
+        with open(checkpoint) as file:
+            self.assertEqual(len(json.load(file)['ranges']), 2)
+        os.remove(checkpoint)
+        os.rmdir(directory)
+
+    def test_resume_keeps_ranges(self):
+        """Votes added after the last range of an interrupted audit are checked in a new range."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        checkpoint = os.path.join(directory.name, 'audit.json')
+        plan = pk_ranges(4)
+        with open(checkpoint, 'w') as file:
+            json.dump({'size': 4, 'plan': plan, 'ranges': {plan[-1][0]: {
+                'range': list(plan[-1]), 'votes': 2, 'findings': {}, 'counts': {}}}}, file)
+        late = Vote.objects.create(user=User.objects.create(username='late'), question=self.questions[1],
+                                   choice=self.choices[0])
+        results = scan(size=4, checkpoint=checkpoint)
+        self.assertEqual([result['range'] for result in results],
+                         [list(bounds) for bounds in plan] + [[plan[-1][1], late.id + 1]])
+        self.assertEqual(results[-1]['findings']['mismatch'], [late.id])
+
+
+class ParallelVoteAuditTests(TransactionTestCase):
+    """Test cases for auditing in worker processes."""
+
+    def test_workers(self):
+        """Worker processes check the ranges of a file database."""
+        now = timezone.now()
+        question = Question.objects.create(question_text='Poll', pub_date=now,
+                                           end_date=now + datetime.timedelta(days=1))
+        choice = question.choice_set.create(choice_text='Yes')
+        votes = [Vote.objects.create(user=User.objects.create(username=f'user{number}'), question=question,
+                                     choice=choice) for number in range(4)]
+        Vote.objects.filter(pk=votes[1].pk).update(choice_id=None)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'audit.sqlite3')
+        # The workers read a file copy of the in-memory test database.
+        target = sqlite3.connect(path)
+        connection.ensure_connection()
+        connection.connection.backup(target)
+        target.close()
+        with mock.patch.dict(connection.settings_dict, NAME=path):
+            report = audit_votes(size=1, workers=2)
+        self.assertEqual(report['votes'], 4)
+        self.assertEqual(report['findings']['no_choice'], [votes[1].id])
@@ -1,7 +1,19 @@
 """Test for polls authentication."""
+import datetime
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.checks import run_checks
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.shortcuts import reverse
+from django.utils import timezone
+
+from polls import cache, ratelimit
+from polls.auth import CACHED_AUTH, CachedModelBackend, user_cache_key
+from polls.models import Question
 
 
 class AuthenticationTest(TestCase):
@@ -28,3 +40,133 @@ class AuthenticationTest(TestCase):
         response = self.client.post(reverse('logout'))
         self.assertEqual(response.status_code, 200)
         self.assertFalse(response.context['user'].is_authenticated)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], **CACHED_AUTH)
+class CachedAuthenticationTests(TestCase):
+    """Test cases for resolving the user of a request from the cache."""
+
+    def setUp(self):
+        """Log a user in and create an ongoing question."""
+        ratelimit.reset()
+        cache.get_cache().clear()
+        self.user = User.objects.create_user(username='kiku', password='first-Pass-1')
+        self.client.login(username='kiku', password='first-Pass-1')
+        self.question = Question.objects.create(question_text='Cached poll',
+                                                pub_date=timezone.now() - datetime.timedelta(days=1),
+                                                end_date=timezone.now() + datetime.timedelta(days=1))
+        self.choice = self.question.choice_set.create(choice_text='Yes')
+        self.backend = CachedModelBackend()
+
+    def vote(self):
+        """Post a vote and return the SQL run for it."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.choice.id})
+        return response, [query['sql'] for query in queries]
+
+    def test_vote_skips_identity_queries(self):
+        """A vote from a warm session does not query sessions or users."""
+        self.vote()
+        response, queries = self.vote()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual([sql for sql in queries if 'django_session' in sql or 'auth_user' in sql], [])
+
+    def test_user_cached(self):
+        """The backend loads a user from the database once."""
+        self.backend.get_user(self.user.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.user.id), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(self.backend.aget_user)(self.user.id), self.user)
+
+    def test_missing_user_cached(self):
+        """Unknown user ids are cached as missing."""
+        self.assertIsNone(self.backend.get_user(0))
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.backend.get_user(0))
+
+    def test_password_change_logs_out(self):
+        """Sessions of the old password end after a password change."""
+        self.vote()
+        self.user.set_password('second-Pass-2')
+        self.user.save()
+        response, _ = self.vote()
+        self.assertTrue(response.url.startswith(reverse('login')))
+
+    def test_deactivated_user(self):
+        """A deactivated user is no longer resolved."""
+        self.backend.get_user(self.user.id)
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(self.backend.get_user(self.user.id))
+
+    def test_logout_drops_cached_user(self):
+        """Logging out removes the cached user and the session."""
+        self.vote()
+        self.assertIsNotNone(cache.get_cache().get(user_cache_key(self.user.id)))
+        self.client.post(reverse('logout'))
+        self.assertIsNone(cache.get_cache().get(user_cache_key(self.user.id)))
+        response, _ = self.vote()
+        self.assertTrue(response.url.startswith(reverse('login')))
+
+
+def worker(location):
+    """Run the block as a worker process whose polls cache is at the location."""
+    return override_settings(CACHES={**settings.CACHES, 'polls': {**settings.CACHES['polls'], 'LOCATION': location}})
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class WorkerAuthenticationTests(TestCase):
+    """Test cases for logouts and password changes seen by every worker process."""
+
+    def setUp(self):
+        """Log a user in and empty the caches of the workers."""
+        for location in ('worker-a', 'worker-b', 'shared'):
+            with worker(location):
+                cache.get_cache().clear()
+        self.user = User.objects.create_user(username='kiku', password='first-Pass-1')
+
+    def authenticated(self):
+        """Return True if the index page is rendered for the logged in user."""
+        return self.client.get(reverse('polls:index')).context['user'].is_authenticated
+
+    def assertSeenByOtherWorker(self, change, first='worker-a', second='worker-b'):
+        """A change made in the first worker ends the session in the second one."""
+        with worker(first):
+            self.client.login(username='kiku', password='first-Pass-1')
+        with worker(second):
+            self.assertTrue(self.authenticated())
+        session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        with worker(first):
+            change()
+        # Another tab, or a copied cookie, still sends the old session.
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+        with worker(second):
+            self.assertFalse(self.authenticated())
+
+    def change_password(self):
+        """Change the password of the user."""
+        self.user.set_password('second-Pass-2')
+        self.user.save()
+
+    def test_logout_with_local_caches(self):
+        """A logout in one worker ends the session in the others."""
+        self.assertSeenByOtherWorker(lambda: self.client.post(reverse('logout')))
+
+    def test_password_change_with_local_caches(self):
+        """A password change in one worker ends the sessions in the others."""
+        self.assertSeenByOtherWorker(self.change_password)
+
+    @override_settings(**CACHED_AUTH)
+    def test_shared_cache(self):
+        """With a shared cache the cached session and user are dropped for every worker."""
+        self.assertSeenByOtherWorker(lambda: self.client.post(reverse('logout')), 'shared', 'shared')
+        self.client.logout()
+        self.assertSeenByOtherWorker(self.change_password, 'shared', 'shared')
+
+    def test_check_refuses_local_cache(self):
+        """Cached sessions and users on a process-local cache fail the system checks."""
+        self.assertEqual([error.id for error in run_checks() if error.id.startswith('polls.')], [])
+        with override_settings(**CACHED_AUTH):
+            self.assertEqual([error.id for error in run_checks() if error.id.startswith('polls.')],
+                             ['polls.E001', 'polls.E002'])
@@ -0,0 +1,144 @@
+"""Test for the write-behind vote buffer."""
+import datetime
+import json
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls import buffer, ratelimit
+from polls.buffer import VoteBuffer
+from polls.models import Question, Vote
+
+
+class VoteBufferTests(TestCase):
+    """Test cases for buffering and flushing votes."""
+
+    def setUp(self):
+        """Create users, an ongoing question and a buffer in a temporary directory."""
+        ratelimit.reset()
+        self.users = [User.objects.create(username=f'user{number}') for number in range(3)]
+        self.question = Question.objects.create(question_text='Flash poll',
+                                                pub_date=timezone.now() - datetime.timedelta(days=1),
+                                                end_date=timezone.now() + datetime.timedelta(days=1))
+        self.first = self.question.choice_set.create(choice_text='First')
+        self.second = self.question.choice_set.create(choice_text='Second')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.buffer = VoteBuffer(directory.name, batch_size=2, fsync=False)
+
+    def test_votes_wait_for_flush(self):
+        """Buffered votes reach the database only when flushed."""
+        self.buffer.append(self.users[0].id, self.question.id, self.first.id)
+        self.assertFalse(Vote.objects.exists())
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.first.votes, 1)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_last_write_wins(self):
+        """The latest buffered vote of a user wins, across batches."""
+        for user in self.users:
+            self.buffer.append(user.id, self.question.id, self.first.id)
+        self.buffer.append(self.users[0].id, self.question.id, self.second.id)
+        self.buffer.flush()
+        self.assertEqual(Vote.objects.get(user=self.users[0]).choice, self.second)
+        self.assertEqual(self.first.votes, 2)
+        self.assertEqual(self.second.votes, 1)
+
+    def test_replay_is_idempotent(self):
+        """Applying the same votes twice changes nothing the second time."""
+        entries = [(user.id, self.question.id, self.first.id) for user in self.users]
+        self.assertEqual(len(Vote.objects.apply_batch(entries)), 3)
+        self.assertEqual(Vote.objects.apply_batch(entries), [])
+        self.assertEqual(self.first.votes, 3)
+
+    def test_skips_choice_of_other_question(self):
+        """A choice that does not belong to the question is dropped."""
+        other = Question.objects.create(question_text='Other', pub_date=timezone.now())
+        self.buffer.append(self.users[0].id, other.id, self.first.id)
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertFalse(Vote.objects.exists())
+
+    def write_segment(self, name, *records):
+        """Write a pending segment of (user, choice, at) votes on the question."""
+        with open(Path(self.buffer.path) / name, 'w') as segment:
+            for user, choice, at in records:
+                segment.write(json.dumps({'user': user.id, 'question': self.question.id,
+                                          'choice': choice.id, 'at': at}) + '\n')
+
+    def test_segments_merged_by_time(self):
+        """Votes of several segments are applied in the order they were cast, with their time."""
+        self.write_segment('votes-100-2.pending', (self.users[0], self.second, 2000.0))
+        self.write_segment('votes-200-1.pending', (self.users[0], self.first, 1000.0))
+        self.buffer.flush()
+        vote = Vote.objects.get(user=self.users[0])
+        self.assertEqual(vote.choice, self.second)
+        self.assertEqual(vote.voted_at.timestamp(), 2000.0)
+
+    def test_stale_replay_skipped(self):
+        """A replayed vote cast before the stored vote of the user changes nothing."""
+        Vote.objects.cast_vote(self.users[0], self.question, self.second)
+        voted_at = Vote.objects.get(user=self.users[0]).voted_at
+        stale = voted_at - datetime.timedelta(hours=1)
+        self.assertEqual(Vote.objects.apply_batch([(self.users[0].id, self.question.id, self.first.id, stale)]), [])
+        vote = Vote.objects.get(user=self.users[0])
+        self.assertEqual((vote.choice, vote.voted_at), (self.second, voted_at))
+        self.assertEqual((self.first.votes, self.second.votes), (0, 1))
+
+    def test_skips_deleted_user(self):
+        """A vote of a user deleted since it was buffered is dropped, the others are applied."""
+        self.buffer.append(self.users[0].id, self.question.id, self.first.id)
+        self.buffer.append(self.users[1].id, self.question.id, self.first.id)
+        self.users[0].delete()
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(list(Path(self.buffer.path).iterdir()), [])
+
+    def test_rejected_votes_quarantined(self):
+        """Votes the database refuses are moved to a rejected file and the rest are applied."""
+        apply_batch = Vote.objects.apply_batch
+
+        def refuse_first_user(entries):
+            if any(entry[0] == self.users[0].id for entry in entries):
+                raise IntegrityError('refused')
+            return apply_batch(entries)
+
+        for user in self.users:
+            self.buffer.append(user.id, self.question.id, self.first.id)
+        with mock.patch.object(Vote.objects, 'apply_batch', side_effect=refuse_first_user), \
+                self.assertLogs('polls.buffer', 'WARNING'):
+            self.assertEqual(self.buffer.flush(), 2)
+        rejected = list(Path(self.buffer.path).glob('*.rejected'))
+        self.assertEqual(len(rejected), 1)
+        self.assertEqual(json.loads(rejected[0].read_text())['user'], self.users[0].id)
+        self.assertFalse(list(Path(self.buffer.path).glob('*.claimed-*')))
+
+    def test_failed_flush_keeps_segments(self):
+        """Segments of a flush that fails are pending again for the next flush."""
+        self.buffer.append(self.users[0].id, self.question.id, self.first.id)
+        with mock.patch.object(Vote.objects, 'apply_batch', side_effect=RuntimeError('down')), \
+                self.assertRaises(RuntimeError):
+            self.buffer.flush()
+        self.assertEqual(self.buffer.flush(), 1)
+
+    def test_vote_view_appends_to_buffer(self):
+        """With the buffer enabled the vote view does not write the vote."""
+        self.client.force_login(self.users[0])
+        with override_settings(POLLS_VOTE_BUFFER={'ENABLED': True}):
+            self.patch_buffer()
+            response = self.client.post(reverse('polls:vote', args=(self.question.id,)),
+                                        {'choice': self.first.id})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Vote.objects.exists())
+        self.buffer.flush()
+        self.assertTrue(Vote.objects.filter(user=self.users[0], choice=self.first).exists())
+
+    def patch_buffer(self):
+        """Use the test buffer as the process wide buffer without a flusher thread."""
+        self.buffer.start = lambda: None
+        previous, buffer._buffer = buffer._buffer, self.buffer
+        self.addCleanup(setattr, buffer, '_buffer', previous)
@@ -0,0 +1,59 @@
+"""Test for the versioned results cache."""
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from polls import cache, ratelimit
+from polls.models import Question
+
+
+class ResultsCacheTests(TestCase):
+    """Test cases for caching the results of a question."""
+
+    def setUp(self):
+        """Create an ongoing question with two choices and clear the cache."""
+        ratelimit.reset()
+        cache.get_cache().clear()
+        cache.stats.reset()
+        self.question = Question.objects.create(question_text='Cached poll',
+                                                pub_date=timezone.now() - datetime.timedelta(days=1),
+                                                end_date=timezone.now() + datetime.timedelta(days=1))
+        self.first = self.question.choice_set.create(choice_text='First')
+        self.second = self.question.choice_set.create(choice_text='Second')
+        self.url = reverse('polls:results_json', args=(self.question.id,))
+
+    def test_hit_after_miss(self):
+        """The second read of unchanged results is served from the cache."""
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+        self.assertEqual(cache.stats.snapshot()['results'], {'hits': 1, 'misses': 1, 'ratio': 0.5})
+
+    def test_vote_bumps_version(self):
+        """A vote makes the cached results stale."""
+        self.assertEqual(self.client.get(self.url).json()['total'], 0)
+        version = cache.results_version(self.question.id)
+        user = User.objects.create(username='kiku')
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.first.id})
+        self.assertGreater(cache.results_version(self.question.id), version)
+        self.assertEqual(self.client.get(self.url).json()['total'], 1)
+
+    def test_lost_version_is_not_reused(self):
+        """A version recreated after eviction is newer than the lost one."""
+        version = cache.results_version(self.question.id)
+        cache.get_cache().delete(f'polls:results:version:{self.question.id}')
+        self.assertGreater(cache.results_version(self.question.id), version)
+
+    def test_stats_for_staff_only(self):
+        """The cache stats can be read by staff members."""
+        self.assertEqual(self.client.get(reverse('polls:cache_stats')).status_code, 302)
+        staff = User.objects.create(username='admin', is_staff=True)
+        self.client.force_login(staff)
+        self.client.get(self.url)
+        response = self.client.get(reverse('polls:cache_stats'))
+        self.assertEqual(response.json()['results']['misses'], 1)
@@ -0,0 +1,100 @@
+"""Test for conditional GET of the poll pages."""
+import datetime
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls import cache
+from polls.auth import CACHED_AUTH
+from polls.benchmarks import use_async_views
+from polls.models import Question, Vote
+
+
+@override_settings(**CACHED_AUTH)
+class ConditionalGetTests(TestCase):
+    """Test cases for ETag and Last-Modified on the detail, results and index pages."""
+
+    def setUp(self):
+        """Log a user in and create an ongoing question."""
+        cache.get_cache().clear()
+        self.user = User.objects.create(username='kiku')
+        self.client.force_login(self.user)
+        self.question = Question.objects.create(question_text='Cached poll',
+                                                pub_date=timezone.now() - datetime.timedelta(days=1),
+                                                end_date=timezone.now() + datetime.timedelta(days=1))
+        self.choice = self.question.choice_set.create(choice_text='Yes')
+        self.urls = [reverse('polls:index'), reverse('polls:detail', args=(self.question.id,)),
+                     reverse('polls:results', args=(self.question.id,)),
+                     reverse('polls:results_json', args=(self.question.id,))]
+
+    def revalidate(self, url, response):
+        """Request the url again with the validators of the earlier response."""
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'],
+                               HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+
+    def test_not_modified(self):
+        """An unchanged page is answered with 304 without rendering it."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                with self.assertNumQueries(1 if url != self.urls[0] else 0):
+                    again = self.revalidate(url, response)
+                self.assertEqual(again.status_code, 304)
+                self.assertFalse(again.templates)
+
+    def test_vote_changes_question_pages(self):
+        """A vote changes the validators of the detail and results pages."""
+        responses = {url: self.client.get(url) for url in self.urls[1:]}
+        Vote.objects.cast_vote(User.objects.create(username='voter'), self.question, self.choice)
+        for url, response in responses.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_edit_changes_index(self):
+        """Editing a listed question changes the validators of the index."""
+        url = self.urls[0]
+        response = self.client.get(url)
+        self.question.question_text = 'Renamed poll'
+        self.question.save()
+        again = self.revalidate(url, response)
+        self.assertEqual(again.status_code, 200)
+        self.assertContains(again, 'Renamed poll')
+
+    def test_index_listing_loaded_once(self):
+        """An index page beyond the first loads its questions once for the validators and the view."""
+        for number in range(3):
+            Question.objects.create(question_text=f'Older poll {number}',
+                                    pub_date=timezone.now() - datetime.timedelta(days=2 + number))
+        with self.settings(POLLS_INDEX_PAGE_SIZE=2):
+            cursor = self.client.get(self.urls[0]).context['next_cursor']
+            with mock.patch.object(cache, 'get_index_listing', wraps=cache.get_index_listing) as listing:
+                response = self.client.get(self.urls[0], {'cursor': cursor})
+        self.assertContains(response, 'Older poll 2')
+        self.assertEqual(listing.call_count, 1)
+
+    def test_closing_changes_detail(self):
+        """A question that closed since the last request is rendered again."""
+        url = self.urls[1]
+        response = self.client.get(url)
+        Question.objects.filter(pk=self.question.pk).update(end_date=timezone.now() - datetime.timedelta(seconds=1),
+                                                            modified=self.question.modified)
+        self.assertEqual(self.revalidate(url, response).status_code, 302)
+
+    def test_validators_differ_per_user(self):
+        """Another user gets the page rendered for them."""
+        url = self.urls[2]
+        response = self.client.get(url)
+        self.client.force_login(User.objects.create(username='other'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_async_not_modified(self):
+        """The async results view is answered with 304 too."""
+        with use_async_views():
+            url = self.urls[2]
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.revalidate(url, response).status_code, 304)
@@ -0,0 +1,74 @@
+"""Test that the polls views use indexes instead of full table scans."""
+import datetime
+import unittest
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from polls import ratelimit
+from polls.models import ChoiceTally, Question, Vote
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite specific')
+class QueryPlanTests(TestCase):
+    """Check the query plan of every query a view runs."""
+
+    def setUp(self):
+        """Create questions, choices and votes."""
+        ratelimit.reset()
+        self.user = User.objects.create(username='kiku')
+        now = timezone.now()
+        for number in range(10):
+            question = Question.objects.create(question_text=f'Question {number}',
+                                               pub_date=now - datetime.timedelta(days=number),
+                                               end_date=now + datetime.timedelta(days=number))
+            for text in ('A', 'B', 'C'):
+                choice = question.choice_set.create(choice_text=text)
+            Vote.objects.create(user=self.user, choice=choice, question=question)
+        ChoiceTally.objects.rebuild()
+        self.question = question
+        self.choice = choice
+
+    def full_scans(self, queries):
+        """Return the query plan lines that scan a polls table without an index."""
+        scans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    if detail.startswith('SCAN polls_') and 'INDEX' not in detail:
+                        scans.append(f"{detail}: {query['sql']}")
+        return scans
+
+    def assertNoFullScan(self, method, url, data=None):
+        """Request the url and fail if a polls table is fully scanned."""
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data)
+        self.assertLess(response.status_code, 400)
+        self.assertEqual(self.full_scans(queries), [])
+
+    def test_index(self):
+        """The index view queries use indexes."""
+        self.assertNoFullScan('get', reverse('polls:index'))
+
+    def test_detail(self):
+        """The detail view queries use indexes."""
+        self.assertNoFullScan('get', reverse('polls:detail', args=(self.question.id,)))
+
+    def test_results(self):
+        """The results views queries use indexes."""
+        self.assertNoFullScan('get', reverse('polls:results', args=(self.question.id,)))
+        self.assertNoFullScan('get', reverse('polls:results_json', args=(self.question.id,)))
+
+    def test_vote(self):
+        """The vote view queries use indexes."""
+        self.client.force_login(self.user)
+        self.assertNoFullScan('post', reverse('polls:vote', args=(self.question.id,)),
+                              {'choice': self.choice.id})
@@ -0,0 +1,129 @@
+"""Test for the most voted and trending leaderboards."""
+import datetime
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from polls import cache, leaderboards
+from polls.models import Question, QuestionActivity, QuestionStats, Vote
+from polls.rollup import reset_rollup, rollup_votes
+
+
+class LeaderboardTests(TestCase):
+    """Test cases for counting votes into the leaderboards and serving them."""
+
+    def setUp(self):
+        """Create three open questions and clear the cache."""
+        cache.get_cache().clear()
+        now = timezone.now()
+        self.questions = [Question.objects.create(question_text=f'Poll {number}', pub_date=now,
+                                                  end_date=now + datetime.timedelta(days=1)) for number in range(3)]
+        self.choices = [question.choice_set.create(choice_text='Yes') for question in self.questions]
+
+    def vote(self, number, voted_at=None):
+        """Add a vote on question number by a new user, to be counted by the next rollup."""
+        user = User.objects.create(username=f'user{User.objects.count()}')
+        return Vote.objects.create(user=user, question=self.questions[number], choice=self.choices[number],
+                                   voted_at=voted_at or timezone.now())
+
+    def test_counted_by_rollup(self):
+        """A new vote adds to the total and the activity, a changed one to the activity only."""
+        vote = self.vote(0)
+        rollup_votes()
+        other = self.questions[0].choice_set.create(choice_text='No')
+        Vote.objects.filter(pk=vote.pk).update(choice=other)
+        rollup_votes()
+        self.assertEqual(QuestionStats.objects.get(question=self.questions[0]).total_votes, 1)
+        self.assertEqual(sum(QuestionActivity.objects.values_list('votes', flat=True)), 2)
+
+    def test_one_grouped_update_per_batch(self):
+        """A batch of votes is counted with one read and one write per leaderboard table."""
+        for number in range(3):
+            for _ in range(3):
+                self.vote(number)
+        with CaptureQueriesContext(connection) as queries:
+            rollup_votes()
+        tables = ('polls_questionstats', 'polls_questionactivity')
+        self.assertEqual(len([query for query in queries.captured_queries
+                              if any(table in query['sql'] for table in tables)]), 4)
+        self.assertEqual(sorted(QuestionStats.objects.values_list('total_votes', flat=True)), [3, 3, 3])
+
+    def test_boards(self):
+        """Most voted counts every vote and trending only the votes in the window."""
+        old = timezone.now() - datetime.timedelta(days=1)
+        for _ in range(3):
+            self.vote(0, voted_at=old)
+        self.vote(1)
+        self.vote(1)
+        self.vote(2)
+        rollup_votes()
+        boards = leaderboards.get_leaderboards()
+        self.assertEqual([(entry['id'], entry['votes']) for entry in boards['most_voted']],
+                         [(self.questions[0].id, 3), (self.questions[1].id, 2), (self.questions[2].id, 1)])
+        self.assertEqual([(entry['id'], entry['votes']) for entry in boards['trending']],
+                         [(self.questions[1].id, 2), (self.questions[2].id, 1)])
+
+    def test_unpublished_excluded(self):
+        """Questions that are not published yet are not on the boards."""
+        self.vote(0)
+        rollup_votes()
+        Question.objects.filter(pk=self.questions[0].id).update(pub_date=timezone.now() + datetime.timedelta(days=1))
+        boards = leaderboards.get_leaderboards()
+        self.assertEqual((boards['most_voted'], boards['trending']), ([], []))
+
+    def test_rebuild(self):
+        """The rebuild recounts the same boards from the rolled up votes."""
+        self.vote(0)
+        self.vote(0)
+        self.vote(1, voted_at=timezone.now() - datetime.timedelta(days=1))
+        rollup_votes()
+        expected = leaderboards.get_leaderboards()
+        QuestionStats.objects.update(total_votes=100)
+        QuestionActivity.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_leaderboards', stdout=out)
+        self.assertIn('2 questions', out.getvalue())
+        boards = leaderboards.get_leaderboards()
+        self.assertEqual((boards['most_voted'], boards['trending']), (expected['most_voted'], expected['trending']))
+        self.assertEqual(QuestionActivity.objects.count(), 1)
+        # A vote the rollup has not reached yet is counted once, by the rollup.
+        self.vote(0)
+        leaderboards.rebuild_leaderboards()
+        rollup_votes()
+        self.assertEqual(QuestionStats.objects.get(question=self.questions[0]).total_votes, 3)
+
+    def test_reset_rollup(self):
+        """Rebuilding the rollups from scratch recounts the leaderboards without counting votes twice."""
+        self.vote(0)
+        rollup_votes()
+        reset_rollup()
+        rollup_votes()
+        self.assertEqual(QuestionStats.objects.get(question=self.questions[0]).total_votes, 1)
+
+    def test_vote_view_does_not_count(self):
+        """Voting through the view writes no leaderboard rows, the rollup counts the vote."""
+        user = User.objects.create(username='kiku')
+        self.client.force_login(user)
+        with override_settings(POLLS_RATE_LIMIT={'ENABLED': False}), self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('polls:vote', args=(self.questions[2].id,)), {'choice': self.choices[2].id})
+        self.assertFalse(QuestionStats.objects.exists())
+        rollup_votes()
+        self.assertEqual(QuestionStats.objects.get(question=self.questions[2]).total_votes, 1)
+
+    def test_index(self):
+        """The first index page shows the cached boards without counting votes."""
+        self.vote(1)
+        rollup_votes()
+        response = self.client.get(reverse('polls:index'))
+        self.assertContains(response, 'Most voted')
+        self.assertEqual(response.context['leaderboards']['most_voted'][0]['id'], self.questions[1].id)
+        with self.assertNumQueries(0):
+            leaderboards.get_leaderboards()
+        response = self.client.get(reverse('polls:index'), {'state': 'open'})
+        self.assertNotIn('leaderboards', response.context)
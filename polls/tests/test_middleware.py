@@ -0,0 +1,43 @@
+"""Test for the request timing middleware."""
+import json
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls import cache
+from polls.models import Question
+
+
+class ServerTimingMiddlewareTests(TestCase):
+    """Test cases for the Server-Timing header and the slow request log."""
+
+    def setUp(self):
+        """Create a question and clear the cache."""
+        cache.get_cache().clear()
+        self.question = Question.objects.create(question_text='Timed poll', pub_date=timezone.now())
+
+    def test_server_timing_header(self):
+        """Responses carry the SQL, template and view timings."""
+        response = self.client.get(reverse('polls:results', args=(self.question.id,)))
+        timing = response['Server-Timing']
+        self.assertIn('desc="2 queries"', timing)
+        for metric in ('db;dur=', 'tpl;dur=', 'view;dur=', 'total;dur='):
+            self.assertIn(metric, timing)
+
+    @override_settings(POLLS_TIMING={'ENABLED': True, 'SLOW_REQUEST_MS': 0})
+    def test_slow_request_log(self):
+        """Slow requests are logged with their most repeated statement."""
+        with self.assertLogs('polls.timing', level='WARNING') as logs:
+            self.client.get(reverse('polls:index'))
+        record = logs.records[0].timing
+        self.assertEqual(record['path'], reverse('polls:index'))
+        self.assertEqual(record['status'], 200)
+        self.assertTrue(record['top_sql'].startswith('SELECT'))
+        self.assertEqual(json.loads(logs.records[0].getMessage().split(' ', 2)[2]), record)
+
+    @override_settings(POLLS_TIMING={'ENABLED': False})
+    def test_disabled(self):
+        """The middleware is not used when disabled."""
+        response = self.client.get(reverse('polls:index'))
+        self.assertNotIn('Server-Timing', response)
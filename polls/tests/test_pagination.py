@@ -0,0 +1,124 @@
+"""Test for the keyset paginated poll catalog."""
+import datetime
+import unittest
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from polls import cache
+from polls.models import Question
+from polls.pagination import InvalidCursor, catalog, decode_cursor, encode_cursor, keyset_page
+
+
+class KeysetPaginationTests(TestCase):
+    """Test cases for cursors and pages of the catalog."""
+
+    def setUp(self):
+        """Create closed, open and upcoming questions, some published at the same time."""
+        cache.get_cache().clear()
+        self.now = timezone.now()
+        same_time = self.now - datetime.timedelta(days=3)
+        self.closed = [Question.objects.create(question_text=f'Closed {number}', pub_date=same_time,
+                                               end_date=self.now - datetime.timedelta(days=1))
+                       for number in range(4)]
+        self.open = [Question.objects.create(question_text=f'Open {number}',
+                                             pub_date=self.now - datetime.timedelta(hours=number + 1),
+                                             end_date=self.now + datetime.timedelta(days=1))
+                     for number in range(3)]
+        self.upcoming = Question.objects.create(question_text='Upcoming',
+                                                pub_date=self.now + datetime.timedelta(days=1))
+
+    def walk(self, state=None, size=2):
+        """Return all questions of the filter, page by page."""
+        questions, cursor = keyset_page(catalog(state, self.now), size=size)
+        pages = [questions]
+        while cursor:
+            questions, cursor = keyset_page(catalog(state, self.now), cursor, size)
+            pages.append(questions)
+        return pages
+
+    def test_cursor_round_trip(self):
+        """A cursor decodes to the position of its question."""
+        question = self.open[0]
+        self.assertEqual(decode_cursor(encode_cursor(question)), (question.pub_date, question.id))
+
+    def test_invalid_cursor(self):
+        """Tampered cursors are rejected."""
+        for cursor in ('not a cursor', 'Zm9v', encode_cursor(self.open[0])[:-3]):
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(cursor)
+
+    def test_pages_cover_catalog(self):
+        """Pages list every published question once, newest first, ties broken by id."""
+        pages = self.walk(size=2)
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        listed = [question for page in pages for question in page]
+        expected = self.open + sorted(self.closed, key=lambda question: -question.id)
+        self.assertEqual(listed, expected)
+
+    def test_state_filters(self):
+        """The state filters list only questions in that state."""
+        for state, expected in (('open', self.open), ('closed', self.closed), ('upcoming', [self.upcoming])):
+            listed = [question for page in self.walk(state) for question in page]
+            self.assertEqual({question.id for question in listed}, {question.id for question in expected})
+            self.assertEqual({question.state for question in listed}, {state})
+
+    @override_settings(POLLS_INDEX_PAGE_SIZE=2)
+    def test_deep_page_same_queries(self):
+        """A later page runs the same number of queries as the first."""
+        url = reverse('polls:index')
+        first = self.client.get(url, {'state': 'closed'})
+        cursor = first.context['next_cursor']
+        cache.get_cache().clear()
+        with CaptureQueriesContext(connection) as first_queries:
+            self.client.get(url, {'state': 'closed'})
+        with CaptureQueriesContext(connection) as later_queries:
+            response = self.client.get(url, {'state': 'closed', 'cursor': cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(later_queries), len(first_queries))
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite specific')
+    def test_deep_page_seeks_index(self):
+        """A later page seeks in the (pub_date, id) index instead of sorting or offsetting."""
+        _, cursor = keyset_page(catalog(now=self.now), size=2)
+        questions = catalog(now=self.now)
+        pub_date, question_id = decode_cursor(cursor)
+        queryset = questions.filter(pub_date__lte=pub_date).exclude(pub_date=pub_date, id__gte=question_id)[:3]
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as db:
+            db.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(row[-1] for row in db.fetchall())
+        self.assertIn('question_pub_date_id_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertNotIn('OFFSET', str(queryset.query))
+
+
+class IndexPaginationViewTests(TestCase):
+    """Test cases for the catalog pages of the index view."""
+
+    def setUp(self):
+        """Create more questions than fit on a page."""
+        cache.get_cache().clear()
+        now = timezone.now()
+        for number in range(12):
+            Question.objects.create(question_text=f'Question {number}',
+                                    pub_date=now - datetime.timedelta(hours=number))
+
+    def test_next_page(self):
+        """The index links to the next page, which lists the older questions."""
+        response = self.client.get(reverse('polls:index'))
+        self.assertEqual(len(response.context['latest_question_list']), 10)
+        cursor = response.context['next_cursor']
+        self.assertContains(response, f'cursor={cursor}')
+        response = self.client.get(reverse('polls:index'), {'cursor': cursor})
+        self.assertEqual([question.question_text for question in response.context['latest_question_list']],
+                         ['Question 10', 'Question 11'])
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_bad_parameters(self):
+        """Unknown states and invalid cursors are not found."""
+        self.assertEqual(self.client.get(reverse('polls:index'), {'state': 'all'}).status_code, 404)
+        self.assertEqual(self.client.get(reverse('polls:index'), {'cursor': 'bogus'}).status_code, 404)
@@ -0,0 +1,32 @@
+"""Query count regression gates for the poll views."""
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from polls import benchmarks
+
+
+class QueryCountGateTests(TestCase):
+    """Fail when a view's query count grows with the size of the data."""
+
+    def counts(self, questions, choices, votes):
+        """Return the cold query count of every view on a fresh dataset."""
+        dataset = benchmarks.build_dataset(questions=questions, choices=choices, votes=votes)
+        voter = User.objects.create(username=f'voter{questions}')
+        return benchmarks.query_counts(dataset, voter)
+
+    def test_query_counts_do_not_grow(self):
+        """Every view runs as many queries on a larger dataset as on a small one."""
+        small = self.counts(questions=3, choices=2, votes=6)
+        large = self.counts(questions=30, choices=20, votes=600)
+        self.assertEqual(small.keys(), large.keys())
+        for name in small:
+            with self.subTest(view=name):
+                self.assertEqual(large[name], small[name])
+
+    def test_summarize(self):
+        """Latencies are summarized as percentiles in milliseconds."""
+        summary = benchmarks.summarize([0.001 * number for number in range(1, 101)], 2.0)
+        self.assertEqual(summary['requests'], 100)
+        self.assertEqual(summary['throughput'], 50.0)
+        self.assertEqual(summary['p50_ms'], 51.0)
+        self.assertEqual(summary['p95_ms'], 96.0)
@@ -0,0 +1,128 @@
+"""Test for vote rate limiting and duplicate suppression."""
+import datetime
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls import cache, ratelimit
+from polls.auth import CACHED_AUTH
+from polls.benchmarks import use_async_views
+from polls.models import Question, Vote
+from polls.ratelimit import MemoryStore, take_token
+
+
+class TokenBucketTests(TestCase):
+    """Test cases for the stores and the token bucket."""
+
+    def test_memory_store_evicts_least_recently_used(self):
+        """A full store drops the key used longest ago."""
+        store = MemoryStore(max_entries=2)
+        store.set('a', 1, 60)
+        store.set('b', 2, 60)
+        store.get('a')
+        store.set('c', 3, 60)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.get('a'), 1)
+        self.assertIsNone(store.get('b'))
+
+    def test_memory_store_expires(self):
+        """A key is gone after its timeout."""
+        store = MemoryStore()
+        with mock.patch('polls.ratelimit.time.monotonic', return_value=100.0):
+            store.set('a', 1, 5)
+        with mock.patch('polls.ratelimit.time.monotonic', return_value=105.0):
+            self.assertIsNone(store.get('a'))
+
+    def test_bucket_refills(self):
+        """A bucket allows the burst, then one token per 1 / rate seconds."""
+        store = MemoryStore()
+        with mock.patch('polls.ratelimit.time.time', return_value=1000.0):
+            self.assertEqual([take_token(store, 'key', 2, 0.5) for _ in range(2)], [0, 0])
+            self.assertEqual(take_token(store, 'key', 2, 0.5), 2.0)
+        with mock.patch('polls.ratelimit.time.time', return_value=1002.0):
+            self.assertEqual(take_token(store, 'key', 2, 0.5), 0)
+
+
+@override_settings(**CACHED_AUTH)
+class VoteRateLimitTests(TestCase):
+    """Test cases for the limits and duplicate suppression of the vote view."""
+
+    def setUp(self):
+        """Log a user in and create an ongoing question with two choices."""
+        ratelimit.reset()
+        cache.get_cache().clear()
+        self.user = User.objects.create(username='kiku')
+        self.client.force_login(self.user)
+        self.question = Question.objects.create(question_text='Busy poll',
+                                                pub_date=timezone.now() - datetime.timedelta(days=1),
+                                                end_date=timezone.now() + datetime.timedelta(days=1))
+        self.first = self.question.choice_set.create(choice_text='Yes')
+        self.second = self.question.choice_set.create(choice_text='No')
+        self.url = reverse('polls:vote', args=(self.question.id,))
+
+    def vote_alternately(self, times):
+        """Vote for the two choices in turn, so no vote is a repeat."""
+        return [self.client.post(self.url, {'choice': (self.first, self.second)[number % 2].id})
+                for number in range(times)]
+
+    @override_settings(POLLS_RATE_LIMIT={'USER': (2, 0.01)})
+    def test_user_limit(self):
+        """Votes over the burst of a user get 429 with Retry-After."""
+        responses = self.vote_alternately(3)
+        self.assertEqual([response.status_code for response in responses], [302, 302, 429])
+        self.assertEqual(responses[-1]['Retry-After'], '100')
+        self.assertEqual(Vote.objects.get(user=self.user).choice, self.second)
+
+    @override_settings(POLLS_RATE_LIMIT={'IP': (2, 0.01)})
+    def test_address_limit(self):
+        """Votes of several users from one address share its bucket."""
+        self.vote_alternately(2)
+        self.client.force_login(User.objects.create(username='other'))
+        self.assertEqual(self.vote_alternately(1)[0].status_code, 429)
+        other = self.client.post(self.url, {'choice': self.first.id}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(other.status_code, 302)
+
+    @override_settings(POLLS_RATE_LIMIT={'IP': (2, 0.01), 'PROXIES': 1})
+    def test_address_behind_proxy(self):
+        """Behind a trusted proxy the address it forwarded is limited, not the proxy's."""
+        self.vote_alternately(2)
+        spoofed = self.client.post(self.url, {'choice': self.first.id}, HTTP_X_FORWARDED_FOR='10.0.0.9, 127.0.0.1')
+        self.assertEqual(spoofed.status_code, 429)
+        self.client.force_login(User.objects.create(username='other'))
+        other = self.client.post(self.url, {'choice': self.first.id}, HTTP_X_FORWARDED_FOR='10.0.0.2')
+        self.assertEqual(other.status_code, 302)
+
+    @override_settings(POLLS_RATE_LIMIT={'ENABLED': False, 'USER': (1, 0.01)})
+    def test_disabled(self):
+        """With the limiter disabled every vote goes through."""
+        self.assertEqual({response.status_code for response in self.vote_alternately(3)}, {302})
+
+    def test_repeat_skips_database(self):
+        """Resubmitting the same choice is acknowledged without queries."""
+        self.client.post(self.url, {'choice': self.first.id})
+        with self.assertNumQueries(0):
+            response = self.client.post(self.url, {'choice': self.first.id})
+        self.assertRedirects(response, reverse('polls:results', args=(self.question.id,)))
+
+    def test_changed_vote_is_written(self):
+        """A vote for another choice is not a repeat."""
+        self.vote_alternately(3)
+        self.assertEqual(Vote.objects.get(user=self.user).choice, self.first)
+
+    @override_settings(POLLS_RATE_LIMIT={'STORE': 'polls.ratelimit.CacheStore', 'USER': (1, 0.01)})
+    def test_cache_store(self):
+        """The limits and repeats also work with the state in the shared cache."""
+        self.client.post(self.url, {'choice': self.first.id})
+        self.assertEqual(self.client.post(self.url, {'choice': self.first.id}).status_code, 429)
+        self.assertEqual(cache.get_cache().get(f'polls:ratelimit:vote:{self.user.id}:{self.question.id}'),
+                         str(self.first.id))
+
+    @override_settings(POLLS_RATE_LIMIT={'USER': (1, 0.01)})
+    def test_async_vote(self):
+        """The async vote view is limited too."""
+        with use_async_views():
+            responses = self.vote_alternately(2)
+        self.assertEqual([response.status_code for response in responses], [302, 429])
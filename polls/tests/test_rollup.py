@@ -0,0 +1,127 @@
+"""Test for the vote time series rollup."""
+import datetime
+
+from django.contrib.auth.models import User
+from django.db.models import Sum
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Question, RollupWatermark, Vote, VoteRollup
+from polls.rollup import bucket_start, reset_rollup, rollup_votes, timeseries
+
+
+class VoteRollupTests(TestCase):
+    """Test cases for the incremental rollup job."""
+
+    def setUp(self):
+        """Create an ongoing question with two choices and voters."""
+        self.now = timezone.now()
+        self.question = Question.objects.create(question_text='Trend poll',
+                                                pub_date=self.now - datetime.timedelta(days=2),
+                                                end_date=self.now + datetime.timedelta(days=1))
+        self.first = self.question.choice_set.create(choice_text='First')
+        self.second = self.question.choice_set.create(choice_text='Second')
+        self.users = [User.objects.create(username=f'user{number}') for number in range(3)]
+
+    def totals(self, resolution=VoteRollup.MINUTE):
+        """Return the summed rollup deltas per choice id."""
+        return dict(VoteRollup.objects.filter(resolution=resolution).values_list('choice')
+                    .annotate(total=Sum('delta')))
+
+    def test_bucket_start(self):
+        """Buckets start on whole minutes and hours."""
+        moment = datetime.datetime(2026, 10, 18, 16, 37, 42, tzinfo=datetime.timezone.utc)
+        self.assertEqual(bucket_start(moment, VoteRollup.MINUTE), moment.replace(second=0))
+        self.assertEqual(bucket_start(moment, VoteRollup.HOUR), moment.replace(minute=0, second=0))
+
+    def test_rollup_is_idempotent(self):
+        """Votes are rolled up once, a second run changes nothing."""
+        for user in self.users:
+            Vote.objects.cast_vote(user, self.question, self.first)
+        self.assertEqual(rollup_votes(), 3)
+        self.assertEqual(rollup_votes(), 0)
+        self.assertEqual(self.totals(), {self.first.id: 3})
+        self.assertEqual(self.totals(VoteRollup.HOUR), {self.first.id: 3})
+
+    def test_changed_vote_moves_count(self):
+        """A changed vote is subtracted from its old choice and added to the new one."""
+        Vote.objects.cast_vote(self.users[0], self.question, self.first)
+        rollup_votes()
+        Vote.objects.cast_vote(self.users[0], self.question, self.second)
+        Vote.objects.cast_vote(self.users[1], self.question, self.second)
+        self.assertEqual(rollup_votes(), 2)
+        self.assertEqual(self.totals(), {self.first.id: 0, self.second.id: 2})
+
+    def test_late_commit_within_lag(self):
+        """A vote older than the watermark is still picked up within the lag."""
+        Vote.objects.cast_vote(self.users[0], self.question, self.first)
+        rollup_votes(lag=60)
+        watermark = RollupWatermark.objects.get().position
+        Vote.objects.create(user=self.users[1], question=self.question, choice=self.second,
+                            voted_at=watermark - datetime.timedelta(seconds=30))
+        self.assertEqual(rollup_votes(lag=60), 1)
+        self.assertEqual(self.totals(), {self.first.id: 1, self.second.id: 1})
+
+    def test_small_batches(self):
+        """Batches smaller than the backlog roll up every vote."""
+        for user in self.users:
+            Vote.objects.cast_vote(user, self.question, self.second)
+        self.assertEqual(rollup_votes(batch_size=1), 3)
+        self.assertEqual(self.totals(), {self.second.id: 3})
+
+    def test_reset(self):
+        """A reset rebuilds the rollups from all votes."""
+        Vote.objects.cast_vote(self.users[0], self.question, self.first)
+        rollup_votes()
+        reset_rollup()
+        self.assertFalse(VoteRollup.objects.exists())
+        self.assertEqual(rollup_votes(), 1)
+        self.assertEqual(self.totals(), {self.first.id: 1})
+
+
+class TimeseriesTests(TestCase):
+    """Test cases for the time series built from the rollups."""
+
+    def setUp(self):
+        """Create a question with votes spread over two days."""
+        self.now = timezone.now()
+        self.question = Question.objects.create(question_text='Trend poll',
+                                                pub_date=self.now - datetime.timedelta(days=2),
+                                                end_date=self.now + datetime.timedelta(days=1))
+        self.first = self.question.choice_set.create(choice_text='First')
+        self.second = self.question.choice_set.create(choice_text='Second')
+        for hours in range(40):
+            Vote.objects.create(user=User.objects.create(username=f'user{hours}'), question=self.question,
+                                choice=self.first if hours % 4 else self.second,
+                                voted_at=self.now - datetime.timedelta(hours=hours, minutes=30))
+        rollup_votes(lag=0)
+
+    def test_downsampled(self):
+        """The series has at most the requested points and ends at the current counts."""
+        series = timeseries(self.question, points=24)
+        self.assertLessEqual(len(series['points']), 24)
+        self.assertEqual(series['step'] % VoteRollup.HOUR, 0)
+        self.assertEqual(series['points'][-1]['votes'], [30, 10])
+        totals = [sum(point['votes']) for point in series['points']]
+        self.assertEqual(totals, sorted(totals))
+
+    def test_minute_resolution(self):
+        """Short spans use minute buckets and start from the earlier votes."""
+        series = timeseries(self.question, start=self.now - datetime.timedelta(hours=2), points=60)
+        self.assertLess(series['step'], VoteRollup.HOUR)
+        self.assertEqual(series['step'] % VoteRollup.MINUTE, 0)
+        self.assertLessEqual(len(series['points']), 60)
+        self.assertEqual(series['points'][0]['votes'], [29, 9])
+        self.assertEqual(series['points'][-1]['votes'], [30, 10])
+
+    def test_endpoint(self):
+        """The time series endpoint returns JSON and rejects invalid parameters."""
+        url = reverse('polls:results_timeseries', args=(self.question.id,))
+        response = self.client.get(url, {'points': 10})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([choice['text'] for choice in data['choices']], ['First', 'Second'])
+        self.assertLessEqual(len(data['points']), 10)
+        self.assertEqual(self.client.get(url, {'points': 'many'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start': 'yesterday'}).status_code, 400)
@@ -0,0 +1,157 @@
+"""Test for the primary and replica database router."""
+import os
+import sqlite3
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from polls import cache
+from polls.management.commands.sync_replica import sync_replica
+from polls.middleware import ReplicaPinningMiddleware
+from polls.models import Question
+from polls.routers import PrimaryReplicaRouter, pin_primary, unpin_primary
+
+WITHOUT_REPLICA = {'default': settings.DATABASES['default']}
+WITH_REPLICA = {**WITHOUT_REPLICA, 'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}}
+
+
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    """Test cases for the routing of reads and writes."""
+
+    router = PrimaryReplicaRouter()
+
+    @override_settings(DATABASES=WITHOUT_REPLICA)
+    def test_without_replica(self):
+        """Everything uses the primary when no replica is configured."""
+        self.assertEqual(self.router.db_for_read(Question), 'default')
+        self.assertEqual(self.router.db_for_write(Question), 'default')
+
+    @override_settings(DATABASES=WITH_REPLICA)
+    def test_poll_reads_use_replica(self):
+        """Poll data is read from the replica, users and sessions from the primary."""
+        self.assertEqual(self.router.db_for_read(Question), 'replica')
+        self.assertEqual(self.router.db_for_read(User), 'default')
+        self.assertEqual(self.router.db_for_write(Question), 'default')
+
+    @override_settings(DATABASES=WITH_REPLICA)
+    def test_pinned_reads_use_primary(self):
+        """Reads of a pinned request use the primary."""
+        token = pin_primary()
+        try:
+            self.assertEqual(self.router.db_for_read(Question), 'default')
+        finally:
+            unpin_primary(token)
+        self.assertEqual(self.router.db_for_read(Question), 'replica')
+
+    def test_migrate_primary_only(self):
+        """Only the primary is migrated."""
+        self.assertTrue(self.router.allow_migrate('default', 'polls'))
+        self.assertFalse(self.router.allow_migrate('replica', 'polls'))
+
+
+@override_settings(DATABASES=WITH_REPLICA, POLLS_REPLICA_PIN_SECONDS=30)
+class ReplicaPinningMiddlewareTests(SimpleTestCase):
+    """Test cases for pinning requests to the primary."""
+
+    def setUp(self):
+        """Create a middleware that records the database of its reads."""
+        self.factory = RequestFactory()
+        self.read_from = None
+
+        def view(request):
+            self.read_from = PrimaryReplicaRouter().db_for_read(Question)
+            return HttpResponse()
+
+        self.middleware = ReplicaPinningMiddleware(view)
+
+    def test_get_reads_replica(self):
+        """A plain GET reads from the replica and sets no cookie."""
+        response = self.middleware(self.factory.get('/polls/1/'))
+        self.assertEqual(self.read_from, 'replica')
+        self.assertNotIn(ReplicaPinningMiddleware.cookie_name, response.cookies)
+
+    def test_post_pins_and_sets_cookie(self):
+        """A POST reads from the primary and pins the next requests of the client."""
+        response = self.middleware(self.factory.post('/polls/1/vote/'))
+        self.assertEqual(self.read_from, 'default')
+        self.assertEqual(response.cookies[ReplicaPinningMiddleware.cookie_name]['max-age'], 30)
+
+    def test_cookie_pins_get(self):
+        """A GET with the pin cookie reads from the primary."""
+        request = self.factory.get('/polls/1/results/')
+        request.COOKIES[ReplicaPinningMiddleware.cookie_name] = '1'
+        self.middleware(request)
+        self.assertEqual(self.read_from, 'default')
+
+    def test_admin_pins(self):
+        """Admin pages read from the primary."""
+        self.middleware(self.factory.get('/admin/polls/question/'))
+        self.assertEqual(self.read_from, 'default')
+
+
+@override_settings(DATABASES=WITH_REPLICA)
+class CacheFillTests(SimpleTestCase):
+    """Test cases for filling the results cache from the primary."""
+
+    def setUp(self):
+        """Clear the cache and record the database the results are read from."""
+        cache.get_cache().clear()
+        self.read_from = []
+
+    def record(self, *args):
+        """Record the database of a poll read and return empty results."""
+        self.read_from.append(PrimaryReplicaRouter().db_for_read(Question))
+        return {}
+
+    def test_results_filled_from_primary(self):
+        """A miss reads the results from the primary, so lagging results are never cached."""
+        with mock.patch.object(cache, 'get_results', side_effect=self.record), \
+                mock.patch.object(cache, 'get_batch_results', side_effect=self.record):
+            cache.get_cached_results(Question(id=1, end_date=None))
+            cache.get_cached_batch_results([2])
+        self.assertEqual(self.read_from, ['default', 'default'])
+        self.assertEqual(PrimaryReplicaRouter().db_for_read(Question), 'replica')
+
+    async def test_async_results_filled_from_primary(self):
+        """The async results are read from the primary on a miss too."""
+        async def record(*args):
+            return self.record()
+
+        with mock.patch.object(cache, 'aget_results', side_effect=record):
+            await cache.aget_cached_results(Question(id=3, end_date=None))
+        self.assertEqual(self.read_from, ['default'])
+
+
+class SyncReplicaTests(SimpleTestCase):
+    """Test cases for copying the primary into the replica."""
+
+    def test_copy_replaces_replica(self):
+        """The copy replaces the replica file, readers of the old file are not disturbed."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        primary, replica = (os.path.join(directory.name, name) for name in ('primary.sqlite3', 'replica.sqlite3'))
+        with sqlite3.connect(primary) as source:
+            source.execute('PRAGMA journal_mode=WAL')
+            source.execute('CREATE TABLE poll (text)')
+            source.execute("INSERT INTO poll VALUES ('new')")
+        with sqlite3.connect(replica) as target:
+            target.execute('CREATE TABLE poll (text)')
+            target.execute("INSERT INTO poll VALUES ('old')")
+        reader = sqlite3.connect(replica, isolation_level=None)
+        self.addCleanup(reader.close)
+        reader.execute('BEGIN')
+        self.assertEqual(reader.execute('SELECT text FROM poll').fetchall(), [('old',)])
+        databases = {alias: mock.Mock(vendor='sqlite', settings_dict={'NAME': name})
+                     for alias, name in (('default', primary), ('replica', replica))}
+        with mock.patch('polls.management.commands.sync_replica.connections', databases):
+            sync_replica()
+        self.assertEqual(reader.execute('SELECT text FROM poll').fetchall(), [('old',)])
+        with sqlite3.connect(replica) as target:
+            self.assertEqual(target.execute('SELECT text FROM poll').fetchall(), [('new',)])
+            self.assertEqual(target.execute('PRAGMA journal_mode').fetchone(), ('delete',))
+        self.assertEqual([name for name in os.listdir(directory.name) if name.startswith('replica')],
+                         ['replica.sqlite3'])
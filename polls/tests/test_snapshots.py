@@ -0,0 +1,104 @@
+"""Test for the result snapshots of closed polls."""
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from polls import cache, ratelimit
+from polls.models import ChoiceTally, Question, ResultSnapshot, Vote
+from polls.snapshots import finalize_polls
+
+
+class ResultSnapshotTests(TestCase):
+    """Test cases for finalizing closed polls and serving their snapshots."""
+
+    def setUp(self):
+        """Create a poll that closed an hour ago with two votes."""
+        ratelimit.reset()
+        cache.get_cache().clear()
+        now = timezone.now()
+        self.question = Question.objects.create(question_text='Closed poll', pub_date=now - datetime.timedelta(days=2),
+                                                end_date=now - datetime.timedelta(hours=1))
+        self.choice = self.question.choice_set.create(choice_text='Yes')
+        for number in range(2):
+            Vote.objects.create(user=User.objects.create(username=f'user{number}'),
+                                question=self.question, choice=self.choice)
+        ChoiceTally.objects.rebuild()
+
+    def tamper(self):
+        """Change the tally behind the snapshot's back and drop the cached results."""
+        ChoiceTally.objects.filter(choice=self.choice).update(count=5)
+        cache.get_cache().clear()
+
+    def test_finalize_closed_polls(self):
+        """Polls closed longer than the grace period are finalized once."""
+        Question.objects.create(question_text='Open poll', pub_date=timezone.now(),
+                                end_date=timezone.now() + datetime.timedelta(days=1))
+        Question.objects.create(question_text='Just closed', pub_date=timezone.now() - datetime.timedelta(days=1),
+                                end_date=timezone.now() - datetime.timedelta(seconds=10))
+        self.assertEqual(finalize_polls(grace=60), 1)
+        self.assertEqual(finalize_polls(grace=60), 0)
+        snapshot = ResultSnapshot.objects.get()
+        self.assertEqual(snapshot.question, self.question)
+        self.assertEqual(snapshot.results['total'], 2)
+
+    def test_served_from_snapshot(self):
+        """Closed polls are answered from the snapshot with long cache headers."""
+        finalize_polls()
+        self.tamper()
+        response = self.client.get(reverse('polls:results_json', args=(self.question.id,)))
+        self.assertEqual(response.json()['total'], 2)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=86400', response['Cache-Control'])
+        response = self.client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertEqual(response.context['results']['total'], 2)
+        self.assertIn('private', response['Cache-Control'])
+        batch = self.client.get(reverse('polls:results_batch'), {'ids': self.question.id}).json()
+        self.assertEqual(batch['results'][0]['total'], 2)
+
+    def test_live_without_snapshot(self):
+        """Until it is finalized a closed poll is summed from the tallies without cache headers."""
+        self.tamper()
+        response = self.client.get(reverse('polls:results_json', args=(self.question.id,)))
+        self.assertEqual(response.json()['total'], 5)
+        self.assertFalse(response.has_header('Cache-Control'))
+
+    def test_reopen_in_admin_discards_snapshot(self):
+        """Moving the end date to the future in the admin deletes the snapshot."""
+        finalize_polls()
+        admin = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        end_date = timezone.localtime(timezone.now() + datetime.timedelta(days=1))
+        pub_date = timezone.localtime(self.question.pub_date)
+        response = self.client.post(reverse('admin:polls_question_change', args=(self.question.id,)), {
+            'question_text': self.question.question_text,
+            'pub_date_0': pub_date.strftime('%Y-%m-%d'), 'pub_date_1': pub_date.strftime('%H:%M:%S'),
+            'end_date_0': end_date.strftime('%Y-%m-%d'), 'end_date_1': end_date.strftime('%H:%M:%S'),
+            'choice_set-TOTAL_FORMS': 1, 'choice_set-INITIAL_FORMS': 1,
+            'choice_set-MIN_NUM_FORMS': 0, 'choice_set-MAX_NUM_FORMS': 1000,
+            'choice_set-0-id': self.choice.id, 'choice_set-0-question': self.question.id,
+            'choice_set-0-choice_text': self.choice.choice_text,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(ResultSnapshot.objects.exists())
+        self.tamper()
+        response = self.client.get(reverse('polls:results_json', args=(self.question.id,)))
+        self.assertEqual(response.json()['total'], 5)
+
+    def test_stale_snapshot_ignored(self):
+        """A snapshot taken at another end date is not served."""
+        finalize_polls()
+        ResultSnapshot.objects.update(end_date=self.question.end_date - datetime.timedelta(minutes=1))
+        self.tamper()
+        response = self.client.get(reverse('polls:results_json', args=(self.question.id,)))
+        self.assertEqual(response.json()['total'], 5)
+
+    def test_no_vote_on_closed_poll(self):
+        """Votes on a closed poll are refused, so the snapshot stays final."""
+        user = User.objects.create(username='late')
+        self.client.force_login(user)
+        response = self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.choice.id})
+        self.assertRedirects(response, reverse('polls:index'))
+        self.assertFalse(Vote.objects.filter(user=user).exists())
@@ -0,0 +1,52 @@
+"""Test for the self-hosted static assets."""
+import tempfile
+from pathlib import Path
+
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls import cache
+from polls.models import Question
+
+
+class StaticAssetTests(TestCase):
+    """Test cases for the shared base template and the static pipeline."""
+
+    def setUp(self):
+        """Create an ongoing question with a choice."""
+        cache.get_cache().clear()
+        self.question = Question.objects.create(question_text='Offline poll', pub_date=timezone.now(),
+                                                end_date=timezone.now() + timezone.timedelta(days=1))
+        self.question.choice_set.create(choice_text='Yes')
+
+    def pages(self):
+        """Return the urls of the three poll pages."""
+        return [reverse('polls:index'), reverse('polls:detail', args=(self.question.id,)),
+                reverse('polls:results', args=(self.question.id,))]
+
+    def test_pages_use_local_assets(self):
+        """Every page links the vendored assets and nothing from another host."""
+        for url in self.pages():
+            response = self.client.get(url)
+            self.assertTemplateUsed(response, 'polls/base.html')
+            self.assertContains(response, '/static/polls/vendor/bootstrap/bootstrap.min.css')
+            self.assertNotContains(response, 'https://')
+
+    def test_collected_assets(self):
+        """collectstatic writes hashed, compressed assets that are served as immutable."""
+        with tempfile.TemporaryDirectory() as static_root, override_settings(STATIC_ROOT=static_root):
+            call_command('collectstatic', interactive=False, verbosity=0, ignore_patterns=['admin'])
+            directory = Path(static_root, 'polls', 'vendor', 'bootstrap')
+            hashed = [path.name for path in directory.glob('bootstrap.min.*.css')]
+            self.assertEqual(len(hashed), 1)
+            for suffix in ('.gz', '.br'):
+                self.assertTrue((directory / (hashed[0] + suffix)).exists())
+            response = self.client.get(reverse('polls:index'))
+            self.assertContains(response, f'/static/polls/vendor/bootstrap/{hashed[0]}')
+            response = Client().get(f'/static/polls/vendor/bootstrap/{hashed[0]}', HTTP_ACCEPT_ENCODING='br')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Encoding'], 'br')
+            self.assertIn('immutable', response['Cache-Control'])
+            response.close()
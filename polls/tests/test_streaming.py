@@ -0,0 +1,93 @@
+"""Test for live results streaming."""
+import asyncio
+import json
+import threading
+
+from asgiref.sync import sync_to_async
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from polls import cache
+from polls.models import Question
+from polls.signals import vote_changed
+from polls.streaming import RESYNC, Broadcaster, TooManySubscribers
+
+
+class BroadcasterTests(SimpleTestCase):
+    """Test cases for fanning out events."""
+
+    async def test_fan_out(self):
+        """Every subscriber of a question receives its events."""
+        hub = Broadcaster()
+        first, second, other = hub.subscribe(1), hub.subscribe(1), hub.subscribe(2)
+        hub.publish(1, 'event')
+        self.assertEqual(await first.get(), 'event')
+        self.assertEqual(await second.get(), 'event')
+        self.assertTrue(other.queue.empty())
+
+    async def test_publish_from_other_thread(self):
+        """Events published by a worker thread reach the event loop."""
+        hub = Broadcaster()
+        subscription = hub.subscribe(1)
+        thread = threading.Thread(target=hub.publish, args=(1, 'event'))
+        thread.start()
+        thread.join()
+        self.assertEqual(await asyncio.wait_for(subscription.get(), 1), 'event')
+
+    async def test_slow_subscriber_resyncs(self):
+        """A full queue is replaced by a single resync marker."""
+        hub = Broadcaster(queue_size=2)
+        subscription = hub.subscribe(1)
+        for number in range(3):
+            hub.publish(1, number)
+        self.assertIs(await subscription.get(), RESYNC)
+        self.assertTrue(subscription.queue.empty())
+
+    async def test_subscriber_cap(self):
+        """Subscribing beyond the cap fails until someone leaves."""
+        hub = Broadcaster(max_subscribers=1)
+        subscription = hub.subscribe(1)
+        with self.assertRaises(TooManySubscribers):
+            hub.subscribe(2)
+        subscription.close()
+        self.assertEqual(hub.subscriber_count, 0)
+        hub.subscribe(2)
+
+
+class ResultsStreamViewTests(TestCase):
+    """Test cases for the results stream endpoint."""
+
+    def setUp(self):
+        """Create a question with a choice."""
+        cache.get_cache().clear()
+        self.question = Question.objects.create(question_text='Live poll', pub_date=timezone.now())
+        self.choice = self.question.choice_set.create(choice_text='First')
+
+    async def test_stream_results_then_deltas(self):
+        """The stream starts with the results and then sends vote deltas."""
+        response = await self.async_client.get(reverse('polls:results_stream', args=(self.question.id,)))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+        first = (await anext(events)).decode()
+        self.assertTrue(first.startswith('event: results'))
+        next_event = asyncio.ensure_future(anext(events))
+        await asyncio.sleep(0)
+        # Votes are committed, and the signal sent, in synchronous code.
+        await sync_to_async(vote_changed.send)(sender=None, user_id=1, question_id=self.question.id,
+                                               choice_id=self.choice.id, previous_choice_id=None)
+        delta = (await asyncio.wait_for(next_event, 1)).decode()
+        self.assertEqual(json.loads(delta.split('data: ')[1]),
+                         {'question': self.question.id, 'deltas': {str(self.choice.id): 1}})
+        await events.aclose()
+
+    async def test_stream_unknown_question(self):
+        """Streaming a missing question is a 404."""
+        response = await self.async_client.get(reverse('polls:results_stream', args=(999,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_stream_needs_asgi(self):
+        """Under WSGI the stream is refused instead of being buffered forever."""
+        response = self.client.get(reverse('polls:results_stream', args=(self.question.id,)))
+        self.assertEqual(response.status_code, 501)
+        self.assertFalse(response.streaming)
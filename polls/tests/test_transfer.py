@@ -0,0 +1,81 @@
+"""Test for exporting and importing polls data."""
+import datetime
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from polls.models import ChoiceTally, Question, QuestionStats, Vote, VoteRollup
+from polls.rollup import rollup_votes
+from polls.transfer import Importer
+
+
+class TransferTests(TestCase):
+    """Test cases for the export_polls and import_polls commands."""
+
+    def setUp(self):
+        """Create a question with two choices and votes."""
+        self.question = Question.objects.create(question_text='Exported, "quoted"', pub_date=timezone.now())
+        first = self.question.choice_set.create(choice_text='First')
+        self.question.choice_set.create(choice_text='Second')
+        for name in ('demo1', 'demo2'):
+            Vote.objects.create(user=User.objects.create(username=name), choice=first, question=self.question)
+        ChoiceTally.objects.rebuild()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def round_trip(self, fmt, *args):
+        """Export and import the data in the given format."""
+        call_command('export_polls', self.directory, '--format', fmt, '--chunk-size', '1', stdout=StringIO())
+        call_command('import_polls', self.directory, '--format', fmt, '--chunk-size', '1', *args, stdout=StringIO())
+        return Question.objects.exclude(pk=self.question.pk).get()
+
+    def assertImported(self, imported):
+        """The imported question has the same text, choices and tallies."""
+        self.assertEqual(imported.question_text, self.question.question_text)
+        self.assertEqual(imported.pub_date, self.question.pub_date)
+        self.assertEqual([(choice.choice_text, choice.votes) for choice in imported.choice_set.order_by('id')],
+                         [('First', 2), ('Second', 0)])
+
+    def test_csv_round_trip(self):
+        """Data exported as CSV imports with new ids."""
+        self.assertImported(self.round_trip('csv'))
+
+    def test_jsonl_round_trip(self):
+        """Data exported as JSON lines imports with new ids."""
+        self.assertImported(self.round_trip('jsonl'))
+
+    def test_missing_users(self):
+        """Votes of unknown users are skipped unless users are created."""
+        call_command('export_polls', self.directory, stdout=StringIO())
+        Vote.objects.all().delete()
+        User.objects.all().delete()
+        call_command('import_polls', self.directory, stdout=StringIO())
+        self.assertEqual(Vote.objects.count(), 0)
+        call_command('import_polls', self.directory, '--create-users', stdout=StringIO())
+        self.assertEqual(Vote.objects.count(), 2)
+        self.assertEqual(User.objects.count(), 2)
+
+    def test_counts_and_rollups(self):
+        """Only inserted votes are counted, and old imported votes are rolled up and on the leaderboards."""
+        Vote.objects.update(voted_at=timezone.now() - datetime.timedelta(days=2))
+        call_command('export_polls', self.directory, '--format', 'jsonl', stdout=StringIO())
+        with open(os.path.join(self.directory, 'votes.jsonl')) as file:
+            duplicate = file.readline()
+        with open(os.path.join(self.directory, 'votes.jsonl'), 'a') as file:
+            file.write(duplicate)
+        newer = Question.objects.create(question_text='Newer', pub_date=timezone.now())
+        Vote.objects.create(user=User.objects.get(username='demo1'), question=newer,
+                            choice=newer.choice_set.create(choice_text='Yes'))
+        rollup_votes()
+        counts = Importer(self.directory, 'jsonl').run()
+        self.assertEqual((counts['votes'], counts['skipped_votes']), (2, 1))
+        imported = Question.objects.exclude(pk__in=(self.question.pk, newer.pk)).get()
+        self.assertEqual(VoteRollup.objects.filter(question=imported, resolution=VoteRollup.HOUR)
+                         .values_list('delta', flat=True).get(), 2)
+        self.assertEqual(QuestionStats.objects.get(question=imported).total_votes, 2)
@@ -1,8 +1,20 @@
 import datetime
-from django.test import TestCase
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest import mock
+from django import db
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.urls import reverse
-from polls.models import Question
+from polls import cache, ratelimit
+from polls.models import ChoiceTally, Question, Vote
 
 
 def create_question(question_text, days):
@@ -20,21 +32,26 @@ def create_question(question_text, days):
 class QuestionIndexViewTests(TestCase):
     """Tests for question index."""
 
+    def setUp(self):
+        """Clear the cached listing."""
+        cache.get_cache().clear()
+
     def test_no_questions(self):
         """If no questions exist, an appropriate message is displayed."""
         response = self.client.get(reverse('polls:index'))
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, "No polls are available.")
-        self.assertQuerysetEqual(response.context['latest_question_list'], [])
+        self.assertQuerySetEqual(response.context['latest_question_list'], [])
 
     def test_past_question(self):
         """Questions with a pub_date in the past are displayed on the \
         index page."""
         create_question(question_text="Past question.", days=-30)
         response = self.client.get(reverse('polls:index'))
-        self.assertQuerysetEqual(
+        self.assertQuerySetEqual(
             response.context['latest_question_list'],
-            ['<Question: Past question.>']
+            ['<Question: Past question.>'],
+            transform=repr
         )
 
     def test_future_question(self):
@@ -46,7 +63,7 @@ class QuestionIndexViewTests(TestCase):
         create_question(question_text="Future question.", days=30)
         response = self.client.get(reverse('polls:index'))
         self.assertContains(response, "No polls are available.")
-        self.assertQuerysetEqual(response.context['latest_question_list'], [])
+        self.assertQuerySetEqual(response.context['latest_question_list'], [])
 
     def test_future_question_and_past_question(self):
         """Even if both past and future questions exist, only past questions \
@@ -54,9 +71,10 @@ class QuestionIndexViewTests(TestCase):
         create_question(question_text="Past question.", days=-30)
         create_question(question_text="Future question.", days=30)
         response = self.client.get(reverse('polls:index'))
-        self.assertQuerysetEqual(
+        self.assertQuerySetEqual(
             response.context['latest_question_list'],
-            ['<Question: Past question.>']
+            ['<Question: Past question.>'],
+            transform=repr
         )
 
     def test_two_past_questions(self):
@@ -64,12 +82,74 @@ class QuestionIndexViewTests(TestCase):
         create_question(question_text="Past question 1.", days=-30)
         create_question(question_text="Past question 2.", days=-5)
         response = self.client.get(reverse('polls:index'))
-        self.assertQuerysetEqual(
+        self.assertQuerySetEqual(
             response.context['latest_question_list'],
-            ['<Question: Past question 2.>', '<Question: Past question 1.>']
+            ['<Question: Past question 2.>', '<Question: Past question 1.>'],
+            transform=repr
         )
 
 
+class IndexListingCacheTests(TestCase):
+    """Tests for the cached index listing."""
+
+    def setUp(self):
+        """Create an open, a closed and an upcoming question."""
+        cache.get_cache().clear()
+        now = timezone.now()
+        self.open = Question.objects.create(question_text='Open', pub_date=now - datetime.timedelta(days=2),
+                                            end_date=now + datetime.timedelta(hours=1))
+        self.closed = Question.objects.create(question_text='Closed', pub_date=now - datetime.timedelta(days=3),
+                                              end_date=now - datetime.timedelta(days=1))
+        self.upcoming = Question.objects.create(question_text='Upcoming', pub_date=now + datetime.timedelta(hours=2),
+                                                end_date=now + datetime.timedelta(days=3))
+
+    def test_state_annotation(self):
+        """The database computes the same state as can_vote()."""
+        states = dict(Question.objects.with_state().values_list('question_text', 'state'))
+        self.assertEqual(states, {'Open': 'open', 'Closed': 'closed', 'Upcoming': 'upcoming'})
+
+    def test_cached_listing_costs_no_queries(self):
+        """The index is served from the cache until something changes."""
+        self.client.get(reverse('polls:index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('polls:index'))
+        self.assertContains(response, "Can't vote", count=1)
+
+    def test_listing_expires_at_next_boundary(self):
+        """The cached listing is recomputed once a listed poll closes."""
+        self.client.get(reverse('polls:index'))
+        later = timezone.now() + datetime.timedelta(hours=1, minutes=1)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            response = self.client.get(reverse('polls:index'))
+        self.assertContains(response, "Can't vote", count=2)
+
+    def test_closed_listing_expires_when_a_poll_closes(self):
+        """The cached closed listing is recomputed once an unlisted open poll closes."""
+        url = reverse('polls:index')
+        self.upcoming.delete()
+        response = self.client.get(url, {'state': 'closed'})
+        self.assertEqual(list(response.context['latest_question_list']), [self.closed])
+        later = timezone.now() + datetime.timedelta(hours=1, minutes=1)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            response = self.client.get(url, {'state': 'closed'})
+        self.assertEqual(list(response.context['latest_question_list']), [self.open, self.closed])
+
+    def test_listing_cached_at_most_timeout(self):
+        """A question added without a save signal is listed once the cached listing times out."""
+        self.client.get(reverse('polls:index'))
+        Question.objects.bulk_create([Question(question_text='Imported', pub_date=timezone.now())])
+        self.assertNotContains(self.client.get(reverse('polls:index')), 'Imported')
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertContains(self.client.get(reverse('polls:index')), 'Imported')
+
+    def test_listing_refreshed_on_save(self):
+        """Saving a question refreshes the cached listing."""
+        self.client.get(reverse('polls:index'))
+        self.open.question_text = 'Renamed'
+        self.open.save()
+        self.assertContains(self.client.get(reverse('polls:index')), 'Renamed')
+
+
 class QuestionDetailViewTests(TestCase):
     """Tests for question detail."""
 
@@ -92,3 +172,205 @@ class QuestionDetailViewTests(TestCase):
         past_question.save()
         response = self.client.get(url)
         self.assertContains(response, past_question.question_text)
+
+
+class VoteViewTests(TestCase):
+    """Tests for voting and the vote tally."""
+
+    def setUp(self):
+        """Create a user, an ongoing question and two choices."""
+        ratelimit.reset()
+        self.user = User.objects.create(username='kiku')
+        self.client.force_login(self.user)
+        self.question = create_question(question_text='Ongoing question.', days=-1)
+        self.question.end_date = timezone.now() + datetime.timedelta(days=7)
+        self.question.save()
+        self.first = self.question.choice_set.create(choice_text='First')
+        self.second = self.question.choice_set.create(choice_text='Second')
+
+    def vote(self, choice):
+        """Post a vote for the choice."""
+        return self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': choice.id})
+
+    def test_vote_increments_tally(self):
+        """Voting adds one to the selected choice."""
+        response = self.vote(self.first)
+        self.assertRedirects(response, reverse('polls:results', args=(self.question.id,)))
+        self.assertEqual(self.first.votes, 1)
+        self.assertEqual(self.second.votes, 0)
+
+    def test_change_vote_moves_tally(self):
+        """Changing a vote decrements the old choice and increments the new one."""
+        self.vote(self.first)
+        self.vote(self.second)
+        self.assertEqual(self.first.votes, 0)
+        self.assertEqual(self.second.votes, 1)
+        self.assertEqual(Vote.objects.filter(user=self.user).count(), 1)
+
+    def test_repeat_vote_keeps_tally(self):
+        """Voting for the same choice again does not count twice."""
+        self.vote(self.first)
+        self.vote(self.first)
+        self.assertEqual(self.first.votes, 1)
+
+    def test_one_vote_write_per_vote(self):
+        """A new or changed vote is written with a single statement."""
+        for choice in (self.first, self.second):
+            with CaptureQueriesContext(connection) as queries:
+                self.vote(choice)
+            writes = [q['sql'] for q in queries
+                      if 'polls_vote' in q['sql'] and not q['sql'].startswith('SELECT')]
+            self.assertEqual(len(writes), 1)
+
+    def test_unique_vote_per_user_and_question(self):
+        """The database rejects a second vote row for the same user and question."""
+        self.vote(self.first)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Vote.objects.create(user=self.user, choice=self.second, question=self.question)
+
+    @override_settings(POLLS_TALLY_SHARDS=8)
+    def test_sharded_tally(self):
+        """The vote total is the sum of the tally shards."""
+        for number in range(20):
+            user = User.objects.create(username=f'user{number}')
+            self.client.force_login(user)
+            self.vote(self.first)
+        self.assertEqual(self.first.votes, 20)
+        self.assertLessEqual(self.first.tallies.count(), 8)
+
+    def test_rebuild_tallies(self):
+        """Rebuilding the tallies recomputes them from the votes."""
+        Vote.objects.create(user=self.user, choice=self.second, question=self.question)
+        self.assertEqual(self.second.votes, 0)
+        ChoiceTally.objects.rebuild()
+        self.assertEqual(self.second.votes, 1)
+
+
+class ConcurrentVoteTests(TransactionTestCase):
+    """Tests for votes of the same user cast at the same time."""
+
+    def test_concurrent_first_votes(self):
+        """The second of two first votes waits for the first and moves it."""
+        user = User.objects.create(username='kiku')
+        question = create_question(question_text='Ongoing question.', days=-1)
+        question.end_date = timezone.now() + datetime.timedelta(days=7)
+        question.save()
+        first = question.choice_set.create(choice_text='First')
+        second = question.choice_set.create(choice_text='Second')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'votes.sqlite3')
+        # The threads share a file copy of the in-memory test database.
+        target = sqlite3.connect(path)
+        connection.ensure_connection()
+        connection.connection.backup(target)
+        target.close()
+        first_read, second_done = threading.Event(), threading.Event()
+        bulk_create = Vote.objects.bulk_create
+        errors = []
+
+        def write_late(*args, **kwargs):
+            # The first voter has read its previous vote, let the second one in.
+            if threading.current_thread().name == 'first':
+                first_read.set()
+                second_done.wait(timeout=1)
+            return bulk_create(*args, **kwargs)
+
+        def vote(choice, done):
+            try:
+                Vote.objects.cast_vote(user, question, choice)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                db.connections.close_all()
+                done.set()
+
+        with mock.patch.dict(connection.settings_dict, NAME=path), \
+                mock.patch.object(Vote.objects, 'bulk_create', side_effect=write_late):
+            voters = [threading.Thread(target=vote, args=(first, threading.Event()), name='first'),
+                      threading.Thread(target=vote, args=(second, second_done), name='second')]
+            voters[0].start()
+            first_read.wait(timeout=5)
+            voters[1].start()
+            for voter in voters:
+                voter.join()
+        self.assertEqual(errors, [])
+        with sqlite3.connect(path) as votes:
+            self.assertEqual(votes.execute('SELECT choice_id FROM polls_vote').fetchall(), [(second.id,)])
+            tallies = dict(votes.execute('SELECT choice_id, SUM(count) FROM polls_choicetally GROUP BY choice_id'))
+        self.assertEqual(tallies, {first.id: 0, second.id: 1})
+
+
+class ResultsViewTests(TestCase):
+    """Tests for the aggregated results."""
+
+    def setUp(self):
+        """Create a question with votes on two of three choices."""
+        cache.get_cache().clear()
+        self.question = create_question(question_text='Past question.', days=-1)
+        self.choices = [self.question.choice_set.create(choice_text=text) for text in ('A', 'B', 'C')]
+        for number, choice in enumerate([self.choices[0], self.choices[0], self.choices[0], self.choices[1]]):
+            user = User.objects.create(username=f'user{number}')
+            Vote.objects.create(user=user, choice=choice, question=self.question)
+        ChoiceTally.objects.rebuild()
+
+    def test_results_json(self):
+        """The JSON results have counts, percentages, ranks and the total."""
+        response = self.client.get(reverse('polls:results_json', args=(self.question.id,)))
+        data = response.json()
+        self.assertEqual(data['total'], 4)
+        self.assertEqual([c['votes'] for c in data['choices']], [3, 1, 0])
+        self.assertEqual([c['percentage'] for c in data['choices']], [75.0, 25.0, 0.0])
+        self.assertEqual([c['rank'] for c in data['choices']], [1, 2, 3])
+
+    def test_results_page(self):
+        """The results page shows the vote counts and the total."""
+        response = self.client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertContains(response, '75.0%')
+        self.assertEqual(response.context['results']['total'], 4)
+
+    def test_constant_query_count(self):
+        """The results cost the same number of queries with more choices."""
+        for number in range(20):
+            self.question.choice_set.create(choice_text=f'Extra {number}')
+        for url in (reverse('polls:results_json', args=(self.question.id,)),
+                    reverse('polls:results', args=(self.question.id,))):
+            cache.get_cache().clear()
+            with self.assertNumQueries(2):
+                self.client.get(url)
+
+    def test_batch_matches_single_results(self):
+        """The batch API returns the same results as results.json, in the order asked for."""
+        other = create_question(question_text='Other question.', days=-2)
+        other.choice_set.create(choice_text='Only')
+        url = reverse('polls:results_batch')
+        data = self.client.get(url, {'ids': f'{other.id},{self.question.id},0,{other.id}'}).json()
+        single = self.client.get(reverse('polls:results_json', args=(self.question.id,))).json()
+        self.assertEqual([results['question'] for results in data['results']], [other.id, self.question.id])
+        self.assertEqual(data['results'][1], single)
+        self.assertEqual(data['missing'], [0])
+
+    def test_batch_constant_query_count(self):
+        """A cold batch costs three queries however many polls it asks for, a warm one none."""
+        questions = [create_question(question_text=f'Batch {number}', days=-1) for number in range(10)]
+        for question in questions:
+            question.choice_set.create(choice_text='Yes')
+        ids = ','.join(str(question.id) for question in [self.question, *questions])
+        with self.assertNumQueries(3):
+            self.client.get(reverse('polls:results_batch'), {'ids': ids})
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('polls:results_batch'), {'ids': ids})
+        self.assertEqual(len(response.json()['results']), 11)
+
+    @override_settings(POLLS_RESULTS_BATCH={'MAX_SIZE': 3, 'CHUNK_SIZE': 1})
+    def test_batch_limits(self):
+        """Large batches are streamed and batches over the cap or with bad ids are refused."""
+        url = reverse('polls:results_batch')
+        response = self.client.get(url, {'ids': f'{self.question.id},0'})
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([results['total'] for results in data['results']], [4])
+        self.assertEqual(data['missing'], [0])
+        for ids in ('1,2,3,4', 'one', ''):
+            with self.subTest(ids=ids):
+                self.assertEqual(self.client.get(url, {'ids': ids}).status_code, 400)
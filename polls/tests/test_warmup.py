@@ -0,0 +1,75 @@
+"""Test for the worker warm-up."""
+import datetime
+import time
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.core.management import call_command
+from django.template import engines
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from polls import cache, warmup
+from polls.models import Question
+
+
+class WarmupTests(TestCase):
+    """Test cases for the warm-up steps and the startup report."""
+
+    def setUp(self):
+        """Start from an empty cache and report with one open question."""
+        cache.get_cache().clear()
+        cache.stats.reset()
+        patcher = mock.patch.object(warmup, 'report', warmup.StartupReport())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.question = Question.objects.create(question_text='Warm poll', pub_date=timezone.now(),
+                                                end_date=timezone.now() + datetime.timedelta(days=1))
+        self.question.choice_set.create(choice_text='Yes')
+
+    def test_warm_up(self):
+        """Every step runs and the first requests find the caches primed."""
+        report = warmup.warm_up()
+        self.assertEqual(list(report.as_dict())[-4:], ['modules', 'urls', 'templates', 'caches'])
+        loader = engines.all()[0].engine.template_loaders[0]
+        self.assertIn('polls/index.html', {key.split('-')[0] for key in loader.get_template_cache})
+        cache.stats.reset()
+        with self.assertNumQueries(0):
+            cache.get_index_listing(size=10)
+            cache.get_cached_batch_results([self.question.id])
+        self.assertEqual(cache.stats.snapshot()['index']['misses'], 0)
+
+    def test_failing_step(self):
+        """A failing step is logged and does not stop the worker from starting."""
+        with mock.patch.object(warmup, 'prime_caches', side_effect=RuntimeError('down')), \
+                self.assertLogs('polls.startup', 'ERROR'):
+            report = warmup.warm_up(warmup.DATA_STEPS)
+        self.assertIn('caches', report.as_dict())
+
+    def test_startup_report(self):
+        """The startup report is logged with the data steps only when enabled."""
+        with self.assertLogs('polls.startup', 'INFO') as logs:
+            warmup.finish_startup('wsgi', time.perf_counter())
+        self.assertIn('"handler": "wsgi"', logs.output[0])
+        self.assertNotIn('caches', logs.output[0])
+        with override_settings(POLLS_WARMUP={'ENABLED': True}), self.assertLogs('polls.startup', 'INFO') as logs, \
+                mock.patch('django.db.connections.close_all') as close_all:
+            warmup.finish_startup('asgi', time.perf_counter())
+        self.assertIn('"caches"', logs.output[0])
+        close_all.assert_called_once_with()
+
+    def test_ready(self):
+        """PollsConfig.ready warms the code up when enabled."""
+        with mock.patch.object(warmup, 'warm_up') as warm_up:
+            apps.get_app_config('polls').ready()
+            warm_up.assert_not_called()
+            with override_settings(POLLS_WARMUP={'ENABLED': True}):
+                apps.get_app_config('polls').ready()
+            warm_up.assert_called_once_with(warmup.CODE_STEPS)
+
+    def test_command(self):
+        """The warmup command prints the duration of every step."""
+        out = StringIO()
+        call_command('warmup', stdout=out)
+        self.assertIn('caches: ', out.getvalue())
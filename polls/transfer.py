@@ -0,0 +1,209 @@
+"""Streaming export and import of questions, choices and votes.
+
+Both directions hold at most one chunk of rows in memory, plus the maps
+from exported to imported ids of questions, choices and users.
+"""
+
+import csv
+import json
+from itertools import islice
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache import bump_index_generation
+from .models import Choice, ChoiceTally, Question, Vote
+from .rollup import rollup_votes
+
+FORMATS = ('csv', 'jsonl')
+
+FIELDS = {
+    'questions': ('id', 'question_text', 'pub_date', 'end_date'),
+    'choices': ('id', 'question_id', 'choice_text'),
+    'votes': ('id', 'question_id', 'choice_id', 'username', 'voted_at'),
+}
+
+
+def _querysets():
+    return {
+        'questions': Question.objects.order_by('pk').values_list(*FIELDS['questions']),
+        'choices': Choice.objects.order_by('pk').values_list(*FIELDS['choices']),
+        'votes': Vote.objects.order_by('pk').values_list('id', 'question_id', 'choice_id', 'user__username',
+                                                         'voted_at'),
+    }
+
+
+def _encode(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def export_data(directory, fmt='csv', chunk_size=2000):
+    """Write questions, choices and votes to files in the directory.
+
+    Returns: dict of the number of rows written per file
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    written = {}
+    for name, queryset in _querysets().items():
+        count = 0
+        with open(directory / f'{name}.{fmt}', 'w', encoding='utf-8', newline='') as output:
+            if fmt == 'csv':
+                writer = csv.writer(output)
+                writer.writerow(FIELDS[name])
+            for row in queryset.iterator(chunk_size=chunk_size):
+                row = [_encode(value) for value in row]
+                if fmt == 'csv':
+                    writer.writerow(row)
+                else:
+                    output.write(json.dumps(dict(zip(FIELDS[name], row))) + '\n')
+                count += 1
+        written[name] = count
+    return written
+
+
+def _read(path, fmt):
+    """Yield the rows of an exported file as dicts."""
+    with open(path, encoding='utf-8', newline='') as lines:
+        if fmt == 'csv':
+            for row in csv.DictReader(lines):
+                yield {key: value if value != '' else None for key, value in row.items()}
+        else:
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _chunks(rows, size):
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _as_int(value):
+    return None if value is None else int(value)
+
+
+def _as_datetime(value):
+    return None if value is None else parse_datetime(value)
+
+
+class Importer:
+    """Import exported files in chunked bulk_create transactions."""
+
+    def __init__(self, directory, fmt='csv', chunk_size=5000, create_users=False):
+        """Initialize the importer and empty id maps."""
+        self.directory = Path(directory)
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.create_users = create_users
+        self.questions = {}
+        self.choices = {}
+        self.users = {}
+        self.counts = {'questions': 0, 'choices': 0, 'votes': 0, 'skipped_votes': 0}
+
+    def _rows(self, name):
+        return _chunks(_read(self.directory / f'{name}.{self.fmt}', self.fmt), self.chunk_size)
+
+    def import_questions(self):
+        """Create the questions and remember their new ids."""
+        for chunk in self._rows('questions'):
+            with transaction.atomic():
+                created = Question.objects.bulk_create([
+                    Question(question_text=row['question_text'], pub_date=_as_datetime(row['pub_date']),
+                             end_date=_as_datetime(row['end_date']))
+                    for row in chunk
+                ])
+            for row, question in zip(chunk, created):
+                self.questions[int(row['id'])] = question.id
+            self.counts['questions'] += len(created)
+
+    def import_choices(self):
+        """Create the choices under their remapped questions."""
+        for chunk in self._rows('choices'):
+            chunk = [row for row in chunk if int(row['question_id']) in self.questions]
+            with transaction.atomic():
+                created = Choice.objects.bulk_create([
+                    Choice(question_id=self.questions[int(row['question_id'])], choice_text=row['choice_text'])
+                    for row in chunk
+                ])
+            for row, choice in zip(chunk, created):
+                self.choices[int(row['id'])] = choice.id
+            self.counts['choices'] += len(created)
+
+    def _resolve_users(self, usernames):
+        """Map the usernames of a chunk to user ids, creating users if asked."""
+        missing = {name for name in usernames if name and name not in self.users}
+        if not missing:
+            return
+        self.users.update(User.objects.filter(username__in=missing).values_list('username', 'id'))
+        missing -= self.users.keys()
+        if missing and self.create_users:
+            User.objects.bulk_create([User(username=name, password='!') for name in missing],
+                                     ignore_conflicts=True)
+            self.users.update(User.objects.filter(username__in=missing).values_list('username', 'id'))
+
+    def import_votes(self):
+        """Create the votes with remapped questions, choices and users."""
+        for chunk in self._rows('votes'):
+            self._resolve_users(row['username'] for row in chunk)
+            votes = []
+            for row in chunk:
+                question_id = self.questions.get(_as_int(row['question_id']))
+                choice_id = self.choices.get(_as_int(row['choice_id']))
+                user_id = self.users.get(row['username'])
+                if question_id is None or choice_id is None or user_id is None:
+                    self.counts['skipped_votes'] += 1
+                    continue
+                # Files exported before votes had a time get the import time.
+                voted_at = _as_datetime(row.get('voted_at')) or timezone.now()
+                votes.append(Vote(question_id=question_id, choice_id=choice_id, user_id=user_id,
+                                  voted_at=voted_at))
+            with transaction.atomic():
+                # bulk_create does not tell which rows ignore_conflicts skipped,
+                # the votes already stored for the chunk are looked up instead.
+                seen = set(Vote.objects.filter(user_id__in={vote.user_id for vote in votes},
+                                               question_id__in={vote.question_id for vote in votes})
+                           .values_list('user_id', 'question_id'))
+                new = []
+                for vote in votes:
+                    if (vote.user_id, vote.question_id) not in seen:
+                        seen.add((vote.user_id, vote.question_id))
+                        new.append(vote)
+                Vote.objects.bulk_create(new, ignore_conflicts=True)
+            self.counts['votes'] += len(new)
+            self.counts['skipped_votes'] += len(votes) - len(new)
+
+    def rebuild_tallies(self):
+        """Recompute the tallies of the imported choices."""
+        question_ids = list(self.questions.values())
+        for start in range(0, len(question_ids), self.chunk_size):
+            with transaction.atomic():
+                ChoiceTally.objects.rebuild(
+                    Choice.objects.filter(question_id__in=question_ids[start:start + self.chunk_size]))
+
+    def rollup_votes(self):
+        """Roll the imported votes up and count them into the leaderboards.
+
+        Their times are behind the watermark of the rollup job, which
+        would never reach them.
+        """
+        question_ids = list(self.questions.values())
+        for start in range(0, len(question_ids), self.chunk_size):
+            rollup_votes(question_ids=question_ids[start:start + self.chunk_size])
+
+    def run(self):
+        """Import everything and return the row counts."""
+        self.import_questions()
+        self.import_choices()
+        self.import_votes()
+        self.rebuild_tallies()
+        self.rollup_votes()
+        # bulk_create sends no post_save, refresh the cached listing here.
+        bump_index_generation()
+        return self.counts
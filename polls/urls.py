@@ -1,14 +1,24 @@
 """KU polls URL Configuration."""
 
+from django.conf import settings
 from django.urls import path, include
 
-from . import views
+from . import async_views, views
+from .conditional import conditional_index, conditional_question
+
+# Detail, results and vote run as async views under ASGI when enabled.
+poll_views = async_views if getattr(settings, 'POLLS_ASYNC_VIEWS', False) else views
 
 app_name = 'polls'
 urlpatterns = [
-    path('', views.IndexView.as_view(), name='index'),
-    path('<int:question_id>/', views.detail, name='detail'),
-    path('<int:pk>/results/', views.ResultsView.as_view(), name='results'),
-    path('<int:question_id>/vote/', views.vote, name='vote'),
+    path('', conditional_index(views.IndexView.as_view()), name='index'),
+    path('<int:question_id>/', conditional_question(poll_views.detail), name='detail'),
+    path('<int:pk>/results/', conditional_question(poll_views.ResultsView.as_view()), name='results'),
+    path('results.json', views.results_batch, name='results_batch'),
+    path('<int:question_id>/results.json', conditional_question(views.results_json), name='results_json'),
+    path('<int:question_id>/timeseries.json', views.results_timeseries, name='results_timeseries'),
+    path('<int:question_id>/results/stream', views.results_stream, name='results_stream'),
+    path('<int:question_id>/vote/', poll_views.vote, name='vote'),
+    path('cache/stats.json', views.cache_stats, name='cache_stats'),
     path('accounts/', include('django.contrib.auth.urls')),
 ]
@@ -1,14 +1,41 @@
 """Views for ku polls."""
 
-from django.http import HttpResponseRedirect
+import asyncio
+import json
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
 from django.views import generic
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 
+from . import cache
+from .buffer import buffer_settings, get_buffer
+from .leaderboards import get_leaderboards
 from .models import Choice, Question, Vote
+from .pagination import STATES, InvalidCursor
+from .ratelimit import is_repeat_vote, rate_limited, remember_vote
+from .results import frozen_results
+from .rollup import timeseries
+from .snapshots import cache_frozen
+from .streaming import RESYNC, TooManySubscribers, broadcaster, format_event
+
+
+def get_question(request, question_id):
+    """Return the question conditional_question loaded, or load it.
+
+    Raises: Http404 if the question does not exist
+    """
+    question = getattr(request, 'question', None)
+    if question is not None and question.pk == question_id:
+        return question
+    return get_object_or_404(Question.objects.select_related('snapshot'), pk=question_id)
 
 
 class IndexView(generic.ListView):
@@ -18,14 +45,38 @@ class IndexView(generic.ListView):
     context_object_name = 'latest_question_list'
 
     def get_queryset(self):
-        """Return the last five published questions \
-        (not including those set to be published in the future).
+        """Return a page of published questions, newest first.
+
+        The ``state`` parameter filters open, closed or upcoming
+        questions, and ``cursor`` is the next page link of the previous page.
 
-        Returns: latest 5 questions
+        Returns: questions of the page
         """
-        return Question.objects.filter(
-            pub_date__lte=timezone.now()
-        ).order_by('-pub_date')[:5]
+        state = self.request.GET.get('state') or None
+        if state is not None and state not in STATES:
+            raise Http404('Unknown poll state.')
+        self.state = state
+        # Loaded by conditional_index for the validators of the page.
+        if hasattr(self.request, 'index_listing'):
+            questions, self.next_cursor = self.request.index_listing
+            return questions
+        try:
+            questions, self.next_cursor = cache.get_index_listing(
+                state=state, cursor=self.request.GET.get('cursor'),
+                size=getattr(settings, 'POLLS_INDEX_PAGE_SIZE', 10))
+        except InvalidCursor:
+            raise Http404('Invalid page.')
+        return questions
+
+    def get_context_data(self, **kwargs):
+        """Add the state filter, the cursor of the next page and the leaderboards of the first page."""
+        context = super().get_context_data(**kwargs)
+        context['state'] = self.state
+        context['states'] = STATES
+        context['next_cursor'] = self.next_cursor
+        if self.state is None and not self.request.GET.get('cursor'):
+            context['leaderboards'] = get_leaderboards()
+        return context
 
 
 class DetailView(generic.DetailView):
@@ -44,36 +95,189 @@ class ResultsView(generic.DetailView):
 
     model = Question
     template_name = 'polls/results.html'
-    
+
+    def get_object(self, queryset=None):
+        """Return the question of the results."""
+        return get_question(self.request, self.kwargs['pk'])
+
+    def get_context_data(self, **kwargs):
+        """Add the aggregated results of the question."""
+        context = super().get_context_data(**kwargs)
+        context['results'] = cache.get_cached_results(self.object)
+        return context
+
+    def render_to_response(self, context, **response_kwargs):
+        """Let the browser keep the results page of a finalized poll."""
+        response = super().render_to_response(context, **response_kwargs)
+        if frozen_results(self.object) is not None:
+            cache_frozen(response, private=True)
+        return response
+
+
+def results_json(request, question_id):
+    """Return the results of the question as JSON."""
+    question = get_question(request, question_id)
+    response = JsonResponse(cache.get_cached_results(question))
+    return cache_frozen(response) if frozen_results(question) is not None else response
+
+
+def _parse_ids(value):
+    """Return the distinct ids of a comma separated parameter, in order."""
+    return list(dict.fromkeys(int(part) for part in value.split(',') if part.strip()))
+
+
+def _batch_chunks(question_ids, size):
+    """Yield a JSON document of the results, computing them size questions at a time."""
+    missing = []
+    separator = ''
+    yield '{"results": ['
+    for start in range(0, len(question_ids), size):
+        chunk = question_ids[start:start + size]
+        results = cache.get_cached_batch_results(chunk)
+        for question_id in chunk:
+            if question_id not in results:
+                missing.append(question_id)
+                continue
+            yield separator + json.dumps(results[question_id])
+            separator = ', '
+    yield f'], "missing": {json.dumps(missing)}}}'
+
+
+def results_batch(request):
+    """Return the results of several questions as JSON.
+
+    ``ids`` is a comma separated list of question ids. Every group of up
+    to ``CHUNK_SIZE`` questions costs a fixed number of queries, larger
+    batches are streamed one group at a time.
+    """
+    options = {'MAX_SIZE': 200, 'CHUNK_SIZE': 50, **getattr(settings, 'POLLS_RESULTS_BATCH', {})}
+    try:
+        question_ids = _parse_ids(request.GET.get('ids', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid question ids.'}, status=400)
+    if not question_ids:
+        return JsonResponse({'error': 'No question ids.'}, status=400)
+    if len(question_ids) > options['MAX_SIZE']:
+        return JsonResponse({'error': f"At most {options['MAX_SIZE']} questions per request."}, status=400)
+    if len(question_ids) > options['CHUNK_SIZE']:
+        return StreamingHttpResponse(_batch_chunks(question_ids, options['CHUNK_SIZE']),
+                                     content_type='application/json')
+    results = cache.get_cached_batch_results(question_ids)
+    return JsonResponse({
+        'results': [results[question_id] for question_id in question_ids if question_id in results],
+        'missing': [question_id for question_id in question_ids if question_id not in results],
+    })
+
+
+def _parse_time(value):
+    """Return the aware datetime of an ISO 8601 parameter, None if it is empty."""
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(value)
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+
+
+def results_timeseries(request, question_id):
+    """Return the vote counts of the question over time as JSON.
+
+    ``start`` and ``end`` are ISO 8601 times, ``points`` is the largest
+    number of points to return.
+    """
+    question = get_object_or_404(Question, pk=question_id)
+    try:
+        start, end = (_parse_time(request.GET.get(name)) for name in ('start', 'end'))
+        points = int(request.GET.get('points', 100))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid start, end or points.'}, status=400)
+    return JsonResponse(timeseries(question, start=start, end=end, points=points))
+
+
+async def _results_events(question, subscription):
+    """Yield the full results, then a delta per vote and keep-alive comments."""
+    heartbeat = getattr(settings, 'POLLS_STREAM_HEARTBEAT', 15)
+    try:
+        yield format_event('results', await cache.aget_cached_results(question))
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            if event is RESYNC:
+                yield format_event('results', await cache.aget_cached_results(question))
+            else:
+                yield format_event('delta', event)
+    finally:
+        subscription.close()
+
+
+async def results_stream(request, question_id):
+    """Stream live results of the question as Server-Sent Events.
+
+    Only served under ASGI. A WSGI server reads the whole body of a
+    streaming response before sending it, and this stream never ends.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse('Live results need an ASGI server.', status=501)
+    try:
+        question = await Question.objects.aget(pk=question_id)
+    except Question.DoesNotExist:
+        raise Http404('No Question matches the given query.')
+    try:
+        subscription = broadcaster.subscribe(question.id)
+    except TooManySubscribers:
+        return HttpResponse('Too many live results subscribers.', status=503, headers={'Retry-After': '30'})
+    response = StreamingHttpResponse(_results_events(question, subscription),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@staff_member_required
+def cache_stats(request):
+    """Return the hit and miss counts of the caches of this process."""
+    return JsonResponse(cache.stats.snapshot())
+
 
 @login_required()
+@rate_limited
 def vote(request, question_id):
     """Vote page for the selected question."""
+    # A resubmit of the vote just cast is answered without the database.
+    if is_repeat_vote(request.user.id, question_id, request.POST.get('choice')):
+        return HttpResponseRedirect(reverse('polls:results', args=(question_id,)))
     question = get_object_or_404(Question, pk=question_id)
+    if not question.can_vote():
+        messages.error(request, f'{"Poll not available"}')
+        return HttpResponseRedirect(reverse('polls:index'))
     try:
         selected_choice = question.choice_set.get(pk=request.POST['choice'])
     except (KeyError, Choice.DoesNotExist):
         # Redisplay the question voting form.
         return render(request, 'polls/detail.html', {
             'question': question,
+            'choices': question.choice_set.all(),
             'error_message': "You didn't select a choice.",
         })
     else:
-        if question.vote_set.filter(user=request.user).exists():
-            the_vote = question.vote_set.get(user=request.user)
-            the_vote.choice = selected_choice
-            the_vote.save()
+        if buffer_settings()['ENABLED']:
+            get_buffer().append(request.user.id, question.id, selected_choice.id)
         else:
-            selected_choice.vote_set.create(user=request.user, question=question)
+            Vote.objects.cast_vote(request.user, question, selected_choice)
+        remember_vote(request.user.id, question.id, selected_choice.id)
         return HttpResponseRedirect(reverse('polls:results',
                                             args=(question.id,)))
 
 
 def detail(request, question_id=None):
     """Return poll not available or go to detail page."""
-    question = get_object_or_404(Question, pk=question_id)
+    question = get_question(request, question_id)
     if not question.can_vote():
         messages.error(request, f'{"Poll not available"}')
         return HttpResponseRedirect(reverse('polls:index'))
     else:
-        return render(request, 'polls/detail.html', {'question': question, })
+        return render(request, 'polls/detail.html', {'question': question,
+                                                     'choices': question.choice_set.all()})
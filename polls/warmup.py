@@ -0,0 +1,169 @@
+"""Warm-up of new workers.
+
+A fresh worker builds its URL resolvers, compiles its templates and
+imports the admin on its first requests, which makes them slow. With
+POLLS_WARMUP enabled, PollsConfig.ready does the import, URL and template
+work, and the WSGI and ASGI entry points prime the index, results and
+leaderboard caches once the app registry is ready, before the worker
+takes traffic. Every step is timed and the startup report is logged to
+``polls.startup``.
+
+Database connections are not warmed up. The entry points run in the
+import thread, and under ``gunicorn --preload`` in the master process,
+while requests run in other threads or forked processes that must open
+their own connections. The connections used to prime the caches are
+closed again.
+"""
+
+import importlib
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger('polls.startup')
+
+DEFAULTS = {
+    'ENABLED': False,
+    'MODULES': [
+        'polls.views',
+        'polls.async_views',
+        'polls.admin',
+        'mysite.views',
+    ],
+    'TEMPLATES': [
+        'polls/base.html',
+        'polls/index.html',
+        'polls/detail.html',
+        'polls/results.html',
+        'registration/login.html',
+    ],
+}
+
+# Steps that only load code and are safe while the apps are being set up.
+CODE_STEPS = ('modules', 'urls', 'templates')
+
+# Steps that query the database, run once the app registry is ready.
+DATA_STEPS = ('caches',)
+
+
+def warmup_settings():
+    """Return the warm-up settings with their defaults."""
+    return {**DEFAULTS, **getattr(settings, 'POLLS_WARMUP', {})}
+
+
+class StartupReport:
+    """Durations of the startup steps of this process, in order."""
+
+    def __init__(self):
+        """Initialize an empty report."""
+        self.steps = []
+
+    @contextmanager
+    def step(self, name):
+        """Time the block as the named step, logging instead of raising its errors."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            logger.exception('warm-up step %s failed', name)
+        finally:
+            self.steps.append((name, time.perf_counter() - start))
+
+    def add(self, name, seconds):
+        """Record a step timed elsewhere."""
+        self.steps.append((name, seconds))
+
+    def as_dict(self):
+        """Return the step durations in milliseconds."""
+        return {name: round(seconds * 1000, 1) for name, seconds in self.steps}
+
+
+report = StartupReport()
+
+
+def import_modules(modules):
+    """Import the modules, timing each one that was not imported yet."""
+    for name in modules:
+        if name in sys.modules:
+            continue
+        with report.step(f'import {name}'):
+            importlib.import_module(name)
+
+
+def build_urls():
+    """Import the URLconf and build the resolver and its reverse lookups."""
+    from django.contrib import admin
+    from django.urls import reverse
+
+    # The admin registers its models in its own ready(), which may not
+    # have run yet, and the admin URLs are built from that registry.
+    admin.autodiscover()
+    # The first reverse populates the resolvers of every included URLconf.
+    reverse('polls:index')
+
+
+def compile_templates(names):
+    """Load the templates, so the cached loader keeps them compiled."""
+    from django.template.loader import get_template
+
+    for name in names:
+        get_template(name)
+
+
+def prime_caches():
+    """Load the first index page of every state, the results of its questions and the leaderboards."""
+    from . import cache
+    from .leaderboards import get_leaderboards
+    from .pagination import STATES
+
+    size = getattr(settings, 'POLLS_INDEX_PAGE_SIZE', 10)
+    question_ids = {}
+    for state in (None, *STATES):
+        questions, _ = cache.get_index_listing(state=state, size=size)
+        question_ids.update(dict.fromkeys(question.id for question in questions))
+    if question_ids:
+        cache.get_cached_batch_results(list(question_ids))
+    get_leaderboards()
+
+
+def warm_up(steps=CODE_STEPS + DATA_STEPS):
+    """Run the warm-up steps in this process.
+
+    Returns: the startup report
+    """
+    options = warmup_settings()
+    actions = {
+        'modules': lambda: import_modules(options['MODULES']),
+        'urls': build_urls,
+        'templates': lambda: compile_templates(options['TEMPLATES']),
+        'caches': prime_caches,
+    }
+    for name in steps:
+        with report.step(name):
+            actions[name]()
+    return report
+
+
+def finish_startup(handler, started):
+    """Run the data steps if enabled and log the startup report of the worker.
+
+    Called by the WSGI and ASGI modules once the application is loaded.
+
+    Args:
+        handler: 'wsgi' or 'asgi'
+        started: time.perf_counter() before the application was loaded
+    """
+    from django.db import connections
+
+    report.add('setup', time.perf_counter() - started)
+    if warmup_settings()['ENABLED']:
+        warm_up(DATA_STEPS)
+        # Not reused by the request threads, nor safe to share with forked workers.
+        connections.close_all()
+    record = {'handler': handler, 'total_ms': round((time.perf_counter() - started) * 1000, 1),
+              'steps': report.as_dict()}
+    logger.info('startup %s', json.dumps(record), extra={'startup': record})
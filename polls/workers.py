@@ -0,0 +1,18 @@
+"""Setup of spawned worker processes.
+
+This module imports no models, so a spawned worker can load it before
+the app registry is ready.
+"""
+
+import django
+from django.conf import settings
+
+
+def setup_worker(databases):
+    """Set Django up in a spawned worker with the databases of its parent.
+
+    The parent may use databases its settings module does not name, such
+    as the test database, so their settings are passed to the worker.
+    """
+    settings.DATABASES = databases
+    django.setup()